@@ -0,0 +1,4 @@
+"""
+Benchmarks for Commandline BudgetApp, run with
+`python3 -m benchmarks.flows`.
+"""
@@ -0,0 +1,247 @@
+"""
+An in-memory stand-in for the parts of gspread's Spreadsheet and
+Worksheet that budgetapp.storage uses.
+
+Every call is counted in a CallLog, along with the size of what would
+have been sent to and received from Google as JSON. Cells are kept as
+strings, the same way Sheets returns them. Like Sheets, each worksheet
+has a grid of a set size, and reading or writing past it raises
+GridLimitError. Appending adds the rows it needs.
+"""
+import json
+import re
+import time
+from collections import Counter
+from gspread.exceptions import WorksheetNotFound
+
+
+class GridLimitError(Exception):
+    """
+    Raised, as Sheets answers with an error, for a range that goes past
+    the edge of a worksheet's grid
+    """
+
+
+def a1_to_cell(label):
+    """
+    Turns an A1 label such as 'B3' into (row, col). A label with no
+    row number, such as 'B', gives a row of None.
+    """
+    match = re.fullmatch(r"([A-Z]+)(\d*)", label)
+    col = 0
+    for letter in match.group(1):
+        col = col * 26 + ord(letter) - ord("A") + 1
+    return int(match.group(2)) if match.group(2) else None, col
+
+
+def cell_value(value):
+    """
+    Returns a value as the string Sheets would show for it
+    """
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class CallLog:
+    """
+    Counts remote calls and bytes. Each call can also wait round_trip
+    seconds, to model the time spent on the network.
+    """
+
+    def __init__(self, round_trip=0):
+        self.round_trip = round_trip
+        self.reset()
+
+    def reset(self):
+        """
+        Starts counting from zero
+        """
+        self.calls = Counter()
+        self.bytes = 0
+
+    def record(self, name, request, response):
+        """
+        Counts one call to name, returning its response
+        """
+        self.calls[name] += 1
+        self.bytes += len(json.dumps(request)) + len(json.dumps(response))
+        if self.round_trip:
+            time.sleep(self.round_trip)
+        return response
+
+
+class FakeWorksheet:
+    """
+    A worksheet held as a list of rows of strings, in a grid of
+    row_count rows and col_count columns. The grid is as big as the
+    rows it starts with unless it is given a size.
+    """
+
+    def __init__(self, log, title, rows=None, row_count=None,
+                 col_count=None):
+        self.log = log
+        self.title = title
+        self.rows = [[cell_value(x) for x in row] for row in rows or []]
+        self.row_count = row_count or max(len(self.rows), 1)
+        self.col_count = col_count or max(
+            [len(row) for row in self.rows] + [1])
+
+    def _check_grid(self, range_name, first_row, first_col, last_row,
+                    last_col):
+        """
+        Raises GridLimitError if a range goes past the grid. A range
+        with no last row runs to the bottom of the grid.
+        """
+        if (first_row or 1) > self.row_count \
+                or (last_row or 1) > self.row_count \
+                or max(first_col, last_col) > self.col_count:
+            raise GridLimitError(
+                f"Range ('{self.title}'!{range_name}) exceeds grid limits. "
+                f"Max rows: {self.row_count}, max columns: {self.col_count}")
+
+    def _cell(self, row, col):
+        """
+        Returns the list that holds a cell, growing the rows to reach it
+        """
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        return cells
+
+    def _set(self, row, col, value):
+        self._check_grid(f"R{row}C{col}", row, col, row, col)
+        self._cell(row, col)[col - 1] = cell_value(value)
+
+    def get_all_values(self):
+        width = max((len(row) for row in self.rows), default=0)
+        values = [row + [""] * (width - len(row)) for row in self.rows]
+        return self.log.record("get_all_values", self.title, values)
+
+    def col_values(self, col):
+        values = [row[col - 1] if len(row) >= col else ""
+                  for row in self.rows]
+        while values and values[-1] == "":
+            values.pop()
+        return self.log.record("col_values", [self.title, col], values)
+
+    def row_values(self, row):
+        values = list(self.rows[row - 1]) if row <= len(self.rows) else []
+        return self.log.record("row_values", [self.title, row], values)
+
+    def _values(self, range_name):
+        """
+        Returns the values in a range, without trailing blanks
+        """
+        first, _, last = range_name.partition(":")
+        first_row, first_col = a1_to_cell(first)
+        last_row, last_col = a1_to_cell(last or first)
+        self._check_grid(range_name, first_row, first_col, last_row,
+                         last_col)
+        values = [row[first_col - 1:last_col]
+                  for row in self.rows[(first_row or 1) - 1:last_row]]
+        for row in values:
+            while row and row[-1] == "":
+                row.pop()
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def get(self, range_name):
+        return self.log.record(
+            "get", [self.title, range_name], self._values(range_name))
+
+    def batch_get(self, ranges):
+        return self.log.record(
+            "batch_get", [self.title, ranges],
+            [self._values(range_name) for range_name in ranges])
+
+    def update_cell(self, row, col, value):
+        self._set(row, col, value)
+        return self.log.record(
+            "update_cell", [self.title, row, col, value], {})
+
+    def update(self, range_name, values, **kwargs):
+        first_row, first_col = a1_to_cell(range_name.partition(":")[0])
+        for row_offset, row in enumerate(values):
+            for col_offset, value in enumerate(row):
+                self._set(first_row + row_offset, first_col + col_offset,
+                          value)
+        return self.log.record("update", [self.title, range_name, values], {})
+
+    def batch_update(self, data, **kwargs):
+        for update in data:
+            first_row, first_col = a1_to_cell(
+                update["range"].partition(":")[0])
+            for row_offset, row in enumerate(update["values"]):
+                for col_offset, value in enumerate(row):
+                    self._set(first_row + row_offset,
+                              first_col + col_offset, value)
+        return self.log.record("batch_update", [self.title, data], {})
+
+    def append_row(self, values, **kwargs):
+        return self._append("append_row", [values])
+
+    def append_rows(self, values, **kwargs):
+        return self._append("append_rows", values)
+
+    def _append(self, name, values):
+        self.rows.extend([cell_value(x) for x in row] for row in values)
+        # Rows are added to the grid for whatever doesn't fit
+        self.row_count = max(self.row_count, len(self.rows))
+        self.col_count = max(
+            [self.col_count] + [len(row) for row in values])
+        response = {"updates": {"updatedRange": (
+            f"{self.title}!A{len(self.rows) - len(values) + 1}"
+            f":D{len(self.rows)}")}}
+        return self.log.record(name, [self.title, values], response)
+
+    def add_rows(self, rows):
+        self.row_count += rows
+        return self.log.record("add_rows", [self.title, rows], {})
+
+    def add_cols(self, cols):
+        self.col_count += cols
+        return self.log.record("add_cols", [self.title, cols], {})
+
+    def delete_rows(self, start_index, end_index=None):
+        del self.rows[start_index - 1:end_index or start_index]
+        self.row_count -= (end_index or start_index) - start_index + 1
+        return self.log.record(
+            "delete_rows", [self.title, start_index, end_index], {})
+
+    def delete_row(self, index):
+        return self.delete_rows(index)
+
+
+class FakeSpreadsheet:
+    """
+    A spreadsheet of FakeWorksheets, all counting calls in one log
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self.worksheets = {}
+
+    def add_rows(self, title, rows):
+        """
+        Sets up a worksheet's starting rows without counting any calls
+        """
+        self.worksheets[title] = FakeWorksheet(self.log, title, rows)
+
+    def worksheet(self, title):
+        self.log.record("worksheet", title, {})
+        if title not in self.worksheets:
+            raise WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def add_worksheet(self, title, rows, cols):
+        self.log.record("add_worksheet", [title, rows, cols], {})
+        self.worksheets[title] = FakeWorksheet(self.log, title, [], rows, cols)
+        return self.worksheets[title]
+
+    def del_worksheet(self, worksheet):
+        self.log.record("del_worksheet", worksheet.title, {})
+        del self.worksheets[worksheet.title]
@@ -0,0 +1,193 @@
+"""
+Runs the app's main flows against an in-memory spreadsheet and reports
+the remote calls, bytes and time each one takes at several ledger sizes.
+
+Run it from the project folder:
+
+    python3 -m benchmarks.flows
+    python3 -m benchmarks.flows --sizes 100 10000 --round-trip 150
+    python3 -m benchmarks.flows --json results.json
+    python3 -m benchmarks.flows --baseline results.json
+
+Each flow starts on a screen with a fresh budget, answers its prompts
+from a script and stops when the app returns to the dashboard. With
+--baseline, the run fails if any flow makes more remote calls than it
+did in a saved --json file.
+"""
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import sys
+import time
+from budgetapp import pacing
+from budgetapp.storage import (
+    JOURNAL_HEADER, SheetsBackend, TRANSACTION_HEADER)
+from benchmarks.fake_sheets import CallLog, FakeSpreadsheet
+import run
+
+SIZES = [100, 10000, 100000]
+
+# [name, amount, version]
+CATEGORIES = [
+    ["Rent", 800, 0], ["Groceries", 250, 0], ["Eating Out", 60, 0],
+    ["Transport", 90, 0], ["Utilities", 120, 0], ["Savings", 300, 0]]
+
+USER = ["Bench", "bench@example.com", "bench", "benchpassword"]
+
+# (name, first screen, answers to its prompts)
+FLOWS = [
+    ("log_in", "log_in", ["bench", "benchpassword"]),
+    ("add_paycheck", "add_paycheck",
+     ["100", "Employer", "01-02-22", "1", "60", "6", "40", "2"]),
+    ("add_transaction", "add_transaction",
+     ["25", "Corner Shop", "02-02-22", "2", "2"]),
+    ("redelegate", "redelegate", ["1", "6", "50", "2"]),
+    ("delete_category", "delete_category", ["3", "1", "60", "2"]),
+    ("view_recent_transactions", "view_recent_transactions",
+     ["10", "1", "2", "2"]),
+    ]
+
+
+class ScriptError(Exception):
+    """
+    Raised when a flow doesn't follow its script
+    """
+
+
+def build_spreadsheet(log, size):
+    """
+    Returns a spreadsheet with one user whose ledger has size transactions
+    """
+    spreadsheet = FakeSpreadsheet(log)
+    spreadsheet.add_rows("users", [USER])
+    # A snapshot of the categories that includes the journal's header
+    snapshot = [row + [""] for row in CATEGORIES]
+    snapshot[0][3] = 1
+    snapshot[1][3] = len(CATEGORIES)
+    spreadsheet.add_rows("bench_main", snapshot)
+    spreadsheet.add_rows("bench_journal", [JOURNAL_HEADER])
+    spreadsheet.add_rows("bench_transactions", [TRANSACTION_HEADER] + [
+        [-(n % 50 + 1), f"Shop {n % 40}",
+         f"{n % 28 + 1:02}-{n % 12 + 1:02}-22", CATEGORIES[n % 6][0]]
+        for n in range(size)])
+    return spreadsheet
+
+
+@contextlib.contextmanager
+def scripted_input(answers):
+    """
+    Answers input() from a list, failing if the flow asks too often
+    """
+    remaining = list(answers)
+
+    def answer(prompt=""):
+        if not remaining:
+            raise ScriptError(f"No answer left for: {prompt.strip()}")
+        return remaining.pop(0)
+
+    original_input = builtins.input
+    builtins.input = answer
+    try:
+        yield remaining
+    finally:
+        builtins.input = original_input
+
+
+def run_flow(screen_name, answers, size, round_trip):
+    """
+    Runs one flow on a fresh budget and returns its measurements
+    """
+    log = CallLog(round_trip)
+    spreadsheet = build_spreadsheet(log, size)
+    run.backend = SheetsBackend(lambda: spreadsheet)
+    if screen_name == "log_in":
+        next_screen = (run.log_in,)
+    else:
+        store = run.backend.open_budget("bench")
+        store.category_count()
+        next_screen = (getattr(run, screen_name), store)
+    log.reset()
+
+    start = time.perf_counter()
+    with scripted_input(answers) as remaining, \
+            contextlib.redirect_stdout(io.StringIO()):
+        while next_screen[0] is not run.home_prompt:
+            screen, *args = next_screen
+            next_screen = screen(*args)
+    elapsed = time.perf_counter() - start
+    if screen_name == "log_in":
+        # Wait for the index logging in starts building in the
+        # background, so its read is always counted
+        next_screen[1].index_in_background().join()
+    if remaining:
+        raise ScriptError(f"{screen_name} left answers unused: {remaining}")
+    return {
+        "calls": sum(log.calls.values()),
+        "bytes": log.bytes,
+        "seconds": round(elapsed, 4),
+        "by_method": dict(log.calls),
+        }
+
+
+def check_baseline(results, path):
+    """
+    Returns the flows that make more remote calls than in the baseline
+    """
+    with open(path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = []
+    for key, result in results.items():
+        if key in baseline and result["calls"] > baseline[key]["calls"]:
+            regressions.append(
+                f"{key}: {baseline[key]['calls']} -> {result['calls']} calls")
+    return regressions
+
+
+def main(args):
+    """
+    Runs every flow at every size and prints a table of the results
+    """
+    parser = argparse.ArgumentParser(
+        prog="python3 -m benchmarks.flows",
+        description="Benchmark the app's flows against a fake spreadsheet")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=SIZES,
+        help="ledger sizes to run each flow at")
+    parser.add_argument(
+        "--round-trip", type=float, default=0,
+        help="milliseconds to wait on every remote call")
+    parser.add_argument("--json", help="save the results to this file")
+    parser.add_argument(
+        "--baseline", help="fail if calls go up from this saved --json file")
+    options = parser.parse_args(args)
+
+    pacing.set_mode("none")
+    # Clearing the screen would write escape codes over the results table
+    run.clear_terminal = lambda: None
+
+    results = {}
+    print(f"{'flow':<26}{'ledger':>8}{'calls':>7}{'bytes':>12}{'ms':>10}")
+    for size in options.sizes:
+        for name, screen_name, answers in FLOWS:
+            result = run_flow(
+                screen_name, answers, size, options.round_trip / 1000)
+            results[f"{name}@{size}"] = result
+            print(
+                f"{name:<26}{size:>8}{result['calls']:>7}"
+                f"{result['bytes']:>12}{result['seconds'] * 1000:>10.1f}")
+
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as results_file:
+            json.dump(results, results_file, indent=2)
+    if options.baseline:
+        regressions = check_baseline(results, options.baseline)
+        for regression in regressions:
+            print(f"More remote calls than the baseline: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,4 @@
+"""
+Supporting modules for Commandline BudgetApp.
+run.py holds the terminal screens, this package holds everything else.
+"""
@@ -0,0 +1,507 @@
+"""
+An asyncio client for the Google Sheets v4 REST API, used instead of
+gspread when BUDGETAPP_SHEETS_CLIENT is set to 'async'.
+
+AsyncSpreadsheet and AsyncWorksheet have awaitable versions of the
+gspread calls the storage layer makes, sent with httpx. All of them run
+on one event loop in a background thread, which every session in the
+process shares, so a session waiting on Google doesn't hold up any
+other: their requests are in flight at the same time, though each
+session's own calls are made one after another. BlockingSpreadsheet
+and BlockingWorksheet wrap them for the screens, which are not async:
+each call waits for its coroutine on the shared loop.
+
+Reads and writes use the worksheet's title in the A1 range, so opening
+a worksheet costs nothing. The sheet ids that deletes need, and the
+size of each worksheet's grid, are read once, the first time one is
+needed, and the sizes are kept up to date as rows are added. When a
+budget is opened, its snapshot of the categories and the rows at the
+bottom of its transactions, which count them, are read in one batchGet
+request rather than two.
+
+Calls take their tokens from the same buckets as the gspread client and
+are retried the same way (see budgetapp.ratelimit). A request that gets
+no answer, because the network dropped or it timed out, raises
+SheetsConnectionError, a SheetsAPIError with no response, so the
+screens handle it as they do Google answering with an error.
+"""
+import asyncio
+import os
+import threading
+from urllib.parse import quote
+import httpx
+from budgetapp import ratelimit
+from budgetapp.storage import TAIL_ROWS, SheetsBackend, SheetsBudgetStore
+
+API = "https://sheets.googleapis.com/v4/spreadsheets"
+DRIVE_FILES = "https://www.googleapis.com/drive/v3/files"
+
+
+class SheetsAPIError(Exception):
+    """
+    Raised when the Sheets API answers with an error. Like gspread's
+    APIError it keeps the response, so its status can be checked.
+    """
+
+    def __init__(self, response):
+        super().__init__(f"{response.status_code}: {response.text}")
+        self.response = response
+
+
+class SheetsConnectionError(SheetsAPIError):
+    """
+    Raised when the Sheets API can't be reached or doesn't answer in
+    time. There is no response, so its status is None.
+    """
+
+    def __init__(self, error):
+        Exception.__init__(self, f"no answer: {error}")
+        self.response = None
+
+
+def a1_range(title, cells=None):
+    """
+    Returns the A1 range of some cells in a worksheet, or all of it
+    """
+    sheet = "'" + title.replace("'", "''") + "'"
+    return f"{sheet}!{cells}" if cells else sheet
+
+
+def cell_label(row, col):
+    """
+    Returns the A1 label of a cell, e.g. 'B3' for row 3, column 2
+    """
+    letters = ""
+    while col:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return f"{letters}{row}"
+
+
+def should_retry(method, error):
+    """
+    Returns True if a failed request is safe and worth sending again.
+    A request that got no answer may still have reached Google, so it
+    is only sent again if sending it twice does no harm, as after a
+    server error.
+    """
+    if isinstance(error, SheetsConnectionError):
+        return method in ratelimit.READ_METHODS or \
+            method in ratelimit.REPEATABLE_WRITES
+    return ratelimit.should_retry(method, error)
+
+
+class LoopThread:
+    """
+    An event loop running forever in a daemon thread
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def run(self, coroutine):
+        """
+        Runs a coroutine on the loop and waits for its result
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+class AsyncSpreadsheet:
+    """
+    One spreadsheet, reached through an httpx.AsyncClient. credentials
+    are google-auth credentials that already have their scopes.
+    """
+
+    def __init__(self, credentials, spreadsheet_id=None,
+                 spreadsheet_name=None, transport=None):
+        self.credentials = credentials
+        self.spreadsheet_id = spreadsheet_id
+        self.spreadsheet_name = spreadsheet_name
+        self.transport = transport
+        self._client = None
+        self._token_lock = None
+        self._sheets = None
+
+    async def _request(self, method_name, http_method, url, **kwargs):
+        """
+        Sends one request within the quota and returns its JSON,
+        retrying it if it fails with a retryable error
+        """
+        if self._client is None:
+            # Made here so that it belongs to the loop it is used on
+            self._client = httpx.AsyncClient(
+                transport=self.transport, timeout=30)
+            self._token_lock = asyncio.Lock()
+        bucket = ratelimit.buckets[
+            "read" if method_name in ratelimit.READ_METHODS else "write"]
+        for attempt in range(ratelimit.MAX_RETRIES + 1):
+            await asyncio.to_thread(bucket.take)
+            headers = {"Authorization": f"Bearer {await self._token()}"}
+            try:
+                response = await self._client.request(
+                    http_method, url, headers=headers, **kwargs)
+            except httpx.TransportError as transport_error:
+                error = SheetsConnectionError(transport_error)
+                cause = transport_error
+            else:
+                if response.is_success:
+                    return response.json()
+                error = SheetsAPIError(response)
+                cause = None
+            if attempt == ratelimit.MAX_RETRIES or \
+                    not should_retry(method_name, error):
+                raise error from cause
+            await asyncio.sleep(ratelimit.retry_delay(attempt, error))
+
+    async def _token(self):
+        """
+        Returns an access token, refreshing it if it has expired
+        """
+        async with self._token_lock:
+            if not self.credentials.valid:
+                # google-auth refreshes with a blocking request
+                from google.auth.transport.requests import Request
+                await asyncio.to_thread(self.credentials.refresh, Request())
+        return self.credentials.token
+
+    async def _url(self, suffix=""):
+        """
+        Returns the API URL of the spreadsheet, finding its id by name
+        the first time if it wasn't given one
+        """
+        if self.spreadsheet_id is None:
+            query = (
+                f"name = '{self.spreadsheet_name}' and mimeType = "
+                "'application/vnd.google-apps.spreadsheet'")
+            found = await self._request(
+                "open", "GET", DRIVE_FILES, params={
+                    "q": query, "supportsAllDrives": "true",
+                    "includeItemsFromAllDrives": "true"})
+            if not found.get("files"):
+                raise LookupError(
+                    f"No spreadsheet named {self.spreadsheet_name}")
+            self.spreadsheet_id = found["files"][0]["id"]
+        return f"{API}/{self.spreadsheet_id}{suffix}"
+
+    async def sheet_properties(self, title):
+        """
+        Returns a worksheet's properties, with its sheetId and its
+        gridProperties, reading every worksheet's the first time
+        """
+        if self._sheets is None or title not in self._sheets:
+            metadata = await self._request(
+                "worksheets", "GET", await self._url(), params={
+                    "fields": "sheets.properties(sheetId,title,"
+                              "gridProperties(rowCount,columnCount))"})
+            self._sheets = {
+                sheet["properties"]["title"]: sheet["properties"]
+                for sheet in metadata.get("sheets", [])}
+        return self._sheets[title]
+
+    async def sheet_id(self, title):
+        """
+        Returns the sheet id of a worksheet
+        """
+        return (await self.sheet_properties(title))["sheetId"]
+
+    def grow(self, title, dimension, length):
+        """
+        Adds length to the rowCount or columnCount kept for a worksheet,
+        if its properties have been read
+        """
+        if self._sheets is not None and title in self._sheets:
+            grid = self._sheets[title].setdefault("gridProperties", {})
+            grid[dimension] = grid.get(dimension, 0) + length
+
+    async def _structure_update(self, method_name, request):
+        """
+        Sends one request that changes the spreadsheet's structure
+        """
+        return await self._request(
+            method_name, "POST", await self._url(":batchUpdate"),
+            json={"requests": [request]})
+
+    async def values_get(self, method_name, range_name, **params):
+        """
+        Returns the values in a range. Like gspread, the API leaves
+        out blank cells at the end of a row and blank rows at the end.
+        """
+        result = await self._request(
+            method_name, "GET",
+            await self._url("/values/" + quote(range_name, safe="")),
+            params=params)
+        return result.get("values", [])
+
+    async def values_batch_get(self, method_name, range_names):
+        """
+        Returns the values in several ranges, read in one request
+        """
+        result = await self._request(
+            method_name, "GET", await self._url("/values:batchGet"),
+            params=[("ranges", range_name) for range_name in range_names])
+        return [
+            value_range.get("values", [])
+            for value_range in result.get("valueRanges", [])]
+
+    async def read_budget(self, category_title, transactions_title):
+        """
+        Reads a budget's snapshot of the categories and the last
+        TAIL_ROWS rows of its transactions' grid in one request.
+        Returns the snapshot, the first row of the transactions read
+        and the rows (see SheetsBudgetStore._set_tail).
+        """
+        properties = await self.sheet_properties(transactions_title)
+        grid_rows = properties.get("gridProperties", {}).get("rowCount", 1)
+        first_row = max(grid_rows - TAIL_ROWS + 1, 1)
+        # Open at the bottom, so rows appended by other processes since
+        # the grid's size was read are included
+        categories, rows = await self.values_batch_get("batch_get", [
+            a1_range(category_title, "A:D"),
+            a1_range(transactions_title, f"A{first_row}:D")])
+        return categories, first_row, rows
+
+    def worksheet(self, title):
+        return AsyncWorksheet(self, title)
+
+    async def has_worksheet(self, title):
+        """
+        Returns True if there is a worksheet with this title
+        """
+        try:
+            await self.sheet_id(title)
+        except KeyError:
+            return False
+        return True
+
+    async def add_worksheet(self, title, rows, cols):
+        await self._structure_update("add_worksheet", {"addSheet": {
+            "properties": {"title": title, "gridProperties": {
+                "rowCount": rows, "columnCount": cols}}}})
+        self._sheets = None
+        return self.worksheet(title)
+
+    async def del_worksheet(self, worksheet):
+        await self._structure_update("del_worksheet", {"deleteSheet": {
+            "sheetId": await self.sheet_id(worksheet.title)}})
+        self._sheets = None
+
+
+class AsyncWorksheet:
+    """
+    Awaitable versions of the gspread Worksheet calls storage uses
+    """
+
+    def __init__(self, spreadsheet, title):
+        self.spreadsheet = spreadsheet
+        self.title = title
+
+    async def row_count(self):
+        """
+        Returns the number of rows in the worksheet's grid
+        """
+        properties = await self.spreadsheet.sheet_properties(self.title)
+        return properties.get("gridProperties", {}).get("rowCount", 0)
+
+    async def col_count(self):
+        """
+        Returns the number of columns in the worksheet's grid
+        """
+        properties = await self.spreadsheet.sheet_properties(self.title)
+        return properties.get("gridProperties", {}).get("columnCount", 0)
+
+    async def get_all_values(self):
+        return await self.spreadsheet.values_get(
+            "get_all_values", a1_range(self.title))
+
+    async def col_values(self, col):
+        columns = await self.spreadsheet.values_get(
+            "col_values", a1_range(self.title),
+            majorDimension="COLUMNS")
+        return columns[col - 1] if len(columns) >= col else []
+
+    async def row_values(self, row):
+        rows = await self.spreadsheet.values_get(
+            "row_values", a1_range(self.title, f"{row}:{row}"))
+        return rows[0] if rows else []
+
+    async def batch_get(self, ranges):
+        return await self.spreadsheet.values_batch_get(
+            "batch_get",
+            [a1_range(self.title, range_name) for range_name in ranges])
+
+    async def get(self, range_name):
+        return await self.spreadsheet.values_get(
+            "get", a1_range(self.title, range_name))
+
+    async def update(self, range_name, values, value_input_option="RAW"):
+        return await self.spreadsheet._request(
+            "update", "PUT", await self.spreadsheet._url(
+                "/values/" + quote(a1_range(self.title, range_name), safe="")),
+            params={"valueInputOption": value_input_option},
+            json={"values": values})
+
+    async def update_cell(self, row, col, value):
+        return await self.batch_update(
+            [{"range": cell_label(row, col), "values": [[value]]}],
+            value_input_option="USER_ENTERED")
+
+    async def batch_update(self, data, value_input_option="RAW"):
+        return await self.spreadsheet._request(
+            "batch_update", "POST",
+            await self.spreadsheet._url("/values:batchUpdate"),
+            json={"valueInputOption": value_input_option, "data": [
+                {"range": a1_range(self.title, update["range"]),
+                 "values": update["values"]} for update in data]})
+
+    async def append_row(self, values, value_input_option="RAW"):
+        return await self.append_rows([values], value_input_option)
+
+    async def append_rows(self, values, value_input_option="RAW"):
+        response = await self.spreadsheet._request(
+            "append_rows", "POST", await self.spreadsheet._url(
+                "/values/" + quote(a1_range(self.title), safe="")
+                + ":append"),
+            params={"valueInputOption": value_input_option,
+                    "insertDataOption": "INSERT_ROWS"},
+            json={"values": values})
+        # Every row appended is a new row of the grid
+        self.spreadsheet.grow(self.title, "rowCount", len(values))
+        return response
+
+    async def add_rows(self, rows):
+        response = await self.spreadsheet._structure_update(
+            "add_rows", {"appendDimension": {
+                "sheetId": await self.spreadsheet.sheet_id(self.title),
+                "dimension": "ROWS", "length": rows}})
+        self.spreadsheet.grow(self.title, "rowCount", rows)
+        return response
+
+    async def add_cols(self, cols):
+        response = await self.spreadsheet._structure_update(
+            "add_cols", {"appendDimension": {
+                "sheetId": await self.spreadsheet.sheet_id(self.title),
+                "dimension": "COLUMNS", "length": cols}})
+        self.spreadsheet.grow(self.title, "columnCount", cols)
+        return response
+
+    async def delete_rows(self, start_index, end_index=None):
+        response = await self.spreadsheet._structure_update(
+            "delete_rows", {"deleteDimension": {"range": {
+                "sheetId": await self.spreadsheet.sheet_id(self.title),
+                "dimension": "ROWS",
+                "startIndex": start_index - 1,
+                "endIndex": end_index or start_index}}})
+        self.spreadsheet.grow(
+            self.title, "rowCount",
+            start_index - 1 - (end_index or start_index))
+        return response
+
+    async def delete_row(self, index):
+        return await self.delete_rows(index)
+
+
+class BlockingSpreadsheet:
+    """
+    An AsyncSpreadsheet for code that isn't async. Each call waits for
+    its coroutine to finish on the shared loop.
+    """
+
+    def __init__(self, spreadsheet, loop_thread):
+        self._spreadsheet = spreadsheet
+        self._loop_thread = loop_thread
+
+    def worksheet(self, title):
+        return BlockingWorksheet(
+            self._spreadsheet.worksheet(title), self._loop_thread)
+
+    def add_worksheet(self, title, rows, cols):
+        return BlockingWorksheet(
+            self._loop_thread.run(
+                self._spreadsheet.add_worksheet(title, rows, cols)),
+            self._loop_thread)
+
+    def del_worksheet(self, worksheet):
+        self._loop_thread.run(
+            self._spreadsheet.del_worksheet(worksheet._worksheet))
+
+    def has_worksheet(self, title):
+        return self._loop_thread.run(self._spreadsheet.has_worksheet(title))
+
+    def read_budget(self, category_worksheet, transactions_worksheet):
+        return self._loop_thread.run(self._spreadsheet.read_budget(
+            category_worksheet.title, transactions_worksheet.title))
+
+
+class BlockingWorksheet:
+    """
+    An AsyncWorksheet for code that isn't async
+    """
+
+    def __init__(self, worksheet, loop_thread):
+        self._worksheet = worksheet
+        self._loop_thread = loop_thread
+        self.title = worksheet.title
+
+    @property
+    def row_count(self):
+        """
+        The number of rows in the grid, as gspread's Worksheet has
+        """
+        return self._loop_thread.run(self._worksheet.row_count())
+
+    @property
+    def col_count(self):
+        """
+        The number of columns in the grid, as gspread's Worksheet has
+        """
+        return self._loop_thread.run(self._worksheet.col_count())
+
+    def __getattr__(self, name):
+        method = getattr(self._worksheet, name)
+
+        def blocking(*args, **kwargs):
+            return self._loop_thread.run(method(*args, **kwargs))
+        return blocking
+
+
+class AsyncSheetsBackend(SheetsBackend):
+    """
+    The Google Sheets backend on the asyncio client. Opening a budget
+    reads its snapshot and counts its transactions in one request.
+    """
+
+    def open_budget(self, username):
+        category_worksheet = self.spreadsheet.worksheet(username + "_main")
+        transactions_worksheet = self.spreadsheet.worksheet(
+            username + "_transactions")
+        journal_worksheet = self.open_journal(username)
+        categories, first_row, rows = self.spreadsheet.read_budget(
+            category_worksheet, transactions_worksheet)
+        store = SheetsBudgetStore(
+            category_worksheet, transactions_worksheet, journal_worksheet,
+            categories, (first_row, rows))
+        store.username = username
+        return store
+
+    def find_worksheet(self, title):
+        # Worksheets are opened without a request, so check it is there
+        if not self.spreadsheet.has_worksheet(title):
+            return None
+        return self.spreadsheet.worksheet(title)
+
+
+def connect():
+    """
+    Opens the app's spreadsheet with the service account in creds.json.
+    BUDGETAPP_SPREADSHEET_ID saves looking the spreadsheet up by name.
+    """
+    from google.oauth2.service_account import Credentials
+    from budgetapp.storage import SCOPE, SPREADSHEET_NAME
+
+    credentials = Credentials.from_service_account_file(
+        'creds.json').with_scopes(SCOPE)
+    spreadsheet = AsyncSpreadsheet(
+        credentials, os.environ.get("BUDGETAPP_SPREADSHEET_ID"),
+        SPREADSHEET_NAME)
+    return BlockingSpreadsheet(spreadsheet, LoopThread())
@@ -0,0 +1,80 @@
+"""
+Transaction dates, and an index for finding transactions by date.
+
+Dates are kept as the DD-MM-YY text the user types, which doesn't sort.
+parse_date() turns one into a datetime.date. A DateIndex keeps a
+ledger's row positions sorted by the dates' ordinals, so the
+transactions between two dates are found with a binary search (bisect)
+instead of by reading and parsing every row: O(log n + k) for k results.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
+
+# Two digit years are what the app has always written
+DATE_FORMATS = ["%d-%m-%y", "%d-%m-%Y"]
+
+
+def parse_date(text):
+    """
+    Turns a DD-MM-YY (or DD-MM-YYYY) date into a datetime.date,
+    or returns None if it isn't one
+    """
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(text).strip(), date_format).date()
+        except ValueError:
+            pass
+    return None
+
+
+@lru_cache(maxsize=4096)
+def date_ordinal(text):
+    """
+    Returns the ordinal of a date (see date.toordinal), or None if it
+    isn't one. A ledger has far fewer dates than rows, so they are
+    remembered.
+    """
+    parsed = parse_date(text)
+    return parsed.toordinal() if parsed else None
+
+
+class DateIndex:
+    """
+    The positions of a list of [amount, institution, date, category]
+    transactions, sorted by date. ordinals and positions are parallel
+    lists, and transactions on the same day stay in the order they were
+    logged. Transactions whose date can't be read aren't indexed.
+    """
+
+    def __init__(self, transactions=()):
+        ordinals = map(date_ordinal, map(itemgetter(2), transactions))
+        pairs = sorted(
+            (ordinal, position)
+            for position, ordinal in enumerate(ordinals)
+            if ordinal is not None)
+        self.ordinals = [ordinal for ordinal, _ in pairs]
+        self.positions = [position for _, position in pairs]
+
+    def add(self, position, transaction):
+        """
+        Indexes the transaction at position, which is after every
+        position already in the index
+        """
+        ordinal = date_ordinal(transaction[2])
+        if ordinal is None:
+            return
+        # New transactions are usually the latest, so this is an append
+        insert_at = bisect_right(self.ordinals, ordinal)
+        self.ordinals.insert(insert_at, ordinal)
+        self.positions.insert(insert_at, position)
+
+    def between(self, first, last):
+        """
+        Returns the positions of the transactions dated from first to
+        last, both datetime.dates and both included, in date order
+        """
+        return self.positions[
+            bisect_left(self.ordinals, first.toordinal()):
+            bisect_right(self.ordinals, last.toordinal())]
@@ -0,0 +1,267 @@
+"""
+Imports bank statements into a user's budget without the prompts.
+
+Each transaction becomes an [amount, institution, date, category] row,
+the same as the rows add_paycheck and add_transaction log. Payments are
+deducted from their category and income is added to the income
+category. The statement is read twice. The first pass checks every row,
+so a file that can't be read changes nothing, and the second appends the
+transactions a chunk at a time, changing their categories in a batch
+after each chunk. Only one chunk is held in memory at once.
+"""
+import csv
+import os
+import re
+from datetime import datetime
+from budgetapp.money import ZERO, to_money
+
+DATE_FORMATS = [
+    "%d-%m-%y", "%d-%m-%Y", "%d/%m/%y", "%d/%m/%Y", "%Y-%m-%d", "%Y%m%d"]
+
+INSTITUTION_COLUMNS = [
+    "institution", "payee", "name", "description", "merchant", "memo"]
+
+# Transactions are sent to storage in chunks of this many rows
+CHUNK_SIZE = 5000
+
+
+class StatementError(ValueError):
+    """
+    Raised when a statement file can't be read
+    """
+
+
+class ImportedError(Exception):
+    """
+    Raised when a statement's transactions were appended but the
+    categories couldn't then be changed, so importing it again would
+    log them twice
+    """
+
+
+def parse_date(value):
+    """
+    Turns a statement date into the app's DD-MM-YY format
+    """
+    value = value.strip()
+    # OFX dates may carry a time and timezone, e.g. 20220131120000[0:GMT]
+    if re.fullmatch(r"\d{8}(\d{6}(\.\d+)?)?(\[.*\])?", value):
+        value = value[:8]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).strftime("%d-%m-%y")
+        except ValueError:
+            pass
+    raise StatementError(f"Unrecognised date: {value}")
+
+
+def parse_amount(value):
+    """
+    Turns a statement amount such as '£1,234.50' or '(12.00)' into a
+    Decimal of pounds
+    """
+    value = value.strip().replace(",", "").replace("£", "")
+    if value.startswith("(") and value.endswith(")"):
+        value = "-" + value[1:-1]
+    try:
+        return to_money(value)
+    except ValueError:
+        raise StatementError(f"Unrecognised amount: {value}") from None
+
+
+def read_csv(path):
+    """
+    Yields (amount, institution, date, category) from a CSV statement,
+    or None for a row that can't be read. The header must have an
+    amount column (or debit and credit columns) and a date column.
+    The category column is optional.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as statement:
+        reader = csv.DictReader(statement)
+        columns = {
+            name.strip().lower(): name for name in reader.fieldnames or []}
+        if "date" not in columns or not (
+                "amount" in columns or "debit" in columns
+                or "credit" in columns):
+            raise StatementError(
+                "A CSV statement needs a date column and an amount column "
+                "(or debit and credit columns)")
+        institution_column = next(
+            (columns[name] for name in INSTITUTION_COLUMNS
+             if name in columns), None)
+        for row in reader:
+            try:
+                if "amount" in columns:
+                    amount = parse_amount(row[columns["amount"]] or "")
+                else:
+                    credit = row.get(columns.get("credit")) or "0"
+                    debit = row.get(columns.get("debit")) or "0"
+                    amount = parse_amount(credit) - abs(parse_amount(debit))
+                date = parse_date(row[columns["date"]] or "")
+            except StatementError:
+                yield None
+                continue
+            yield (
+                amount,
+                (row.get(institution_column) or "").strip(),
+                date,
+                (row.get(columns.get("category")) or "").strip())
+
+
+def read_ofx(path):
+    """
+    Yields (amount, institution, date, category) from an OFX or QFX
+    statement, or None for a transaction that can't be read.
+    OFX has no categories, so the category is always blank.
+    """
+    transaction = None
+    with open(path, encoding="utf-8", errors="replace") as statement:
+        for line in statement:
+            for tag, value in re.findall(r"<(/?[A-Z.]+)>([^<]*)", line):
+                if tag == "STMTTRN":
+                    transaction = {}
+                elif tag == "/STMTTRN" and transaction is not None:
+                    yield read_ofx_transaction(transaction)
+                    transaction = None
+                elif transaction is not None and not tag.startswith("/"):
+                    transaction[tag] = value.strip()
+
+
+def read_ofx_transaction(transaction):
+    """
+    Turns the tags of one OFX transaction into a statement row,
+    or None if it can't be read
+    """
+    try:
+        return (
+            parse_amount(transaction.get("TRNAMT", "")),
+            transaction.get("NAME") or transaction.get("PAYEE") or
+            transaction.get("MEMO", ""),
+            parse_date(transaction.get("DTPOSTED", "")),
+            "")
+    except StatementError:
+        return None
+
+
+def read_statement(path):
+    """
+    Picks the statement reader from the file's extension
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return read_csv(path)
+    if extension in (".ofx", ".qfx"):
+        return read_ofx(path)
+    raise StatementError(f"Statements must be .csv or .ofx files: {path}")
+
+
+def import_statement(store, path, default_category=None,
+                     income_category=None, chunk_size=CHUNK_SIZE):
+    """
+    Logs the rows of a statement file in a user's budget and applies
+    their balance changes. A payment whose category isn't in the budget
+    goes to default_category, and income goes to income_category. Rows
+    with nowhere to go, and rows that couldn't be read, are skipped.
+    The whole file is read and checked before anything is written. Then
+    it is read again, and the transactions are appended chunk_size at a
+    time, each chunk followed by a batch changing its categories.
+    Raises ImportedError if anything fails after the first chunk has
+    been appended.
+
+    Returns a dictionary with the number of rows imported and skipped,
+    and the total change to each category.
+    """
+    names = {
+        name.lower(): category_num
+        for category_num, name in enumerate(store.category_names(), 1)}
+    for option in (default_category, income_category):
+        if option is not None and option.lower() not in names:
+            raise StatementError(f"There is no {option} category")
+
+    def transactions():
+        """
+        Yields (category_num, transaction) for each row that can be
+        imported, and (None, None) for each row skipped
+        """
+        for row in read_statement(path):
+            if row is None:
+                yield None, None
+                continue
+            amount, institution, date, category = row
+            if amount > 0:
+                target = income_category
+                category = "Income"
+            else:
+                target = category if category.lower() in names else \
+                    default_category
+            if target is None or amount == 0:
+                yield None, None
+                continue
+            category_num = names[target.lower()]
+            if amount < 0:
+                category = store.get_category(category_num)[0]
+            yield category_num, [amount, institution, date, category]
+
+    # The first pass only checks the file, and counts what it would do
+    changes = {}
+    imported = skipped = 0
+    for category_num, transaction in transactions():
+        if category_num is None:
+            skipped += 1
+            continue
+        imported += 1
+        changes[category_num] = \
+            changes.get(category_num, ZERO) + transaction[0]
+
+    written = 0
+    chunk = []
+    chunk_changes = {}
+    try:
+        for category_num, transaction in transactions():
+            if category_num is None:
+                continue
+            chunk.append(transaction)
+            chunk_changes[category_num] = \
+                chunk_changes.get(category_num, ZERO) + transaction[0]
+            if len(chunk) >= chunk_size:
+                write_chunk(store, chunk, chunk_changes, written)
+                written += len(chunk)
+                chunk = []
+                chunk_changes = {}
+        if chunk:
+            write_chunk(store, chunk, chunk_changes, written)
+    except ImportedError:
+        raise
+    except Exception as error:
+        if not written:
+            # Nothing has been written, so it can be imported again
+            raise
+        raise ImportedError(
+            f"only the first {written} transactions were imported "
+            f"({error})") from error
+    return {
+        "imported": imported,
+        "skipped": skipped,
+        "changes": {
+            store.get_category(category_num)[0]: change
+            for category_num, change in changes.items()}}
+
+
+def write_chunk(store, chunk, changes, written):
+    """
+    Appends a chunk of transactions, then changes their categories in
+    one batch, the same order the recurring scheduler uses. written is
+    how many transactions earlier chunks appended.
+    """
+    # If this fails, this chunk hasn't been written. The other way round
+    # its categories would be changed twice if it were imported again.
+    store.append_transactions(chunk)
+    try:
+        with store.batch_changes():
+            for category_num, change in changes.items():
+                store.change_category_amount(category_num, change)
+    except Exception as error:
+        raise ImportedError(
+            f"{written + len(chunk)} transactions were imported but the "
+            f"categories of the last {len(chunk)} couldn't be changed "
+            f"({error})") from error
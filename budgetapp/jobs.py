@@ -0,0 +1,100 @@
+"""
+Jobs run across every user's budget without any prompts.
+
+run_for_users() hands each user to a job on a pool of threads. Each
+user's budget is opened and worked on by itself, so one that fails is
+reported and the rest carry on. Most of a job's time is spent waiting
+on Google Sheets, so users are worked on side by side. The calls from
+every thread still share the process's rate limit (see
+budgetapp.ratelimit), and threads beyond what the quota lets through
+in one burst would only queue there, so default_workers() stops at that.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from budgetapp import ratelimit
+from budgetapp.money import to_money
+from budgetapp.reports import month_name
+
+# The most users worked on at once, whatever the quota
+MAX_WORKERS = 32
+
+
+def default_workers():
+    """
+    Returns how many users to work on at once: as many as there are
+    calls in one burst of the smaller of the read and write quotas
+    """
+    burst = min(bucket.capacity for bucket in ratelimit.buckets.values())
+    return max(1, min(MAX_WORKERS, int(burst)))
+
+
+def run_for_users(usernames, work, workers=None, progress=None):
+    """
+    Calls work(username) for each user, up to workers of them at once.
+    Returns a [username, result, error] list for each user, in the
+    order of usernames, where error is what work raised for that user,
+    or None. progress is called with how many users are done and how
+    many there are each time one finishes.
+    """
+    usernames = list(dict.fromkeys(usernames))
+    outcomes = {}
+    with ThreadPoolExecutor(workers or default_workers()) as executor:
+        futures = {
+            executor.submit(work, username): username
+            for username in usernames}
+        for done, future in enumerate(as_completed(futures), 1):
+            username = futures[future]
+            try:
+                outcomes[username] = [username, future.result(), None]
+            except Exception as error:
+                outcomes[username] = [username, None, error]
+            if progress is not None:
+                progress(done, len(usernames))
+    return [outcomes[username] for username in usernames]
+
+
+def reconcile(backend, username, today):
+    """
+    Checks a user's budget against their transactions. Returns a line
+    giving the total budgeted, what the transactions add up to, and
+    any categories that are overspent.
+    """
+    store = backend.open_budget(username)
+    snapshot = store.snapshot()
+    report = store.spending_report()
+    ledger = report.income - report.spending
+    line = (
+        f"budgeted £{snapshot.total}, transactions add up to £{ledger}, "
+        f"difference £{snapshot.total - ledger}")
+    overspent = [
+        name for name, amount in snapshot.categories
+        if to_money(amount) < 0]
+    if overspent:
+        line += ", overspent in " + ", ".join(overspent)
+    return line
+
+
+def month_end(backend, username, today):
+    """
+    Sums up a user's last full month before today. Returns a line
+    giving its income and spending, and where the most was spent.
+    """
+    store = backend.open_budget(username)
+    report = store.spending_report()
+    month = today.year * 12 + today.month - 2
+    if month not in report.months:
+        return f"no transactions in {month_name(month)}"
+    line = (
+        f"{month_name(month)}: income £{report.month_income[month]}, "
+        f"spending £{report.month_spending[month]}")
+    categories = report.category_spending[month]
+    if categories:
+        name = next(iter(categories))
+        line += f", most on {name} (£{categories[name]})"
+    return line
+
+
+# The jobs `python3 run.py jobs` can run, by name
+JOBS = {
+    "reconcile": reconcile,
+    "month-end": month_end,
+    }
@@ -0,0 +1,41 @@
+"""
+Amounts of money, kept exactly as Decimal pounds rounded to the penny.
+
+Floats can't hold most amounts of pence exactly, so adding and taking
+them away drifts, and a loop waiting for a balance to reach 0 may never
+end. Every amount the app reads, from the user or from storage, goes
+through to_money() and the arithmetic is done on Decimals from then on.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+PENNY = Decimal("0.01")
+
+ZERO = Decimal("0.00")
+
+# No amount the app handles comes near this, and anything this size
+# would lose pennies when rounded
+MAX_AMOUNT = Decimal("1e15")
+
+
+def to_money(value):
+    """
+    Turns a number, or text such as '12.5' or '£1,234.50', into a
+    Decimal of pounds rounded to the penny. Raises ValueError if it
+    isn't an amount of money, or is MAX_AMOUNT or more either way.
+    """
+    if isinstance(value, Decimal):
+        amount = value
+    else:
+        text = str(value).strip().replace(",", "").replace("£", "")
+        try:
+            amount = Decimal(text)
+        except InvalidOperation:
+            amount = None
+    if amount is None or not amount.is_finite():
+        raise ValueError(f"{value} is not an amount of money")
+    if abs(amount) >= MAX_AMOUNT:
+        raise ValueError(f"{value} is too large an amount of money")
+    try:
+        return amount.quantize(PENNY, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f"{value} is not an amount of money") from None
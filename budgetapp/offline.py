@@ -0,0 +1,683 @@
+"""
+Offline-first storage, used when BUDGETAPP_OFFLINE is set to 'on'.
+
+The budget screens work from a copy of the budget kept on disk, so they
+never wait on Google Sheets and carry on when it can't be reached. Every
+write is appended to a write-ahead log and synced to disk before it is
+acknowledged. A background thread then sends the log to the real store
+in order, in as few calls as it can: category changes written one after
+another go in one batch (one journal append), and transactions in one
+append_rows call.
+
+Each user has three files in the offline directory
+(BUDGETAPP_OFFLINE_DIR, '.budgetapp-offline' by default):
+'<username>.wal', with one numbered JSON line per write;
+'<username>.ledger', the transactions as the real store last had them,
+one JSON line each and only ever appended to; and '<username>.json', a
+small checkpoint of the categories as the real store had them, how much
+of the ledger file goes with them and the numbers of the last write sent
+and the last one they include. The budget shown is the checkpoint and
+ledger with the log lines after that applied.
+
+Once the real store has taken a write its number is saved as sent, before
+the budget is read back from the real store, so a write is never sent
+again because the read failed. A process that is killed loses nothing
+it acknowledged: the log is sent when the budget is next opened, or when
+the app next starts on the same machine. A write the real store took
+just as the process was killed, before its number was saved, is sent
+twice.
+
+Writes are sent by category name. A set or delete is made on top of any
+change another session has made since (the last one sent wins), and a
+change to a category another session has deleted is dropped, since
+there is nowhere left to put it.
+
+Logging in, signing up and opening a budget for the first time on a
+machine still need the real store.
+"""
+import json
+import os
+import threading
+from urllib.parse import quote, unquote
+from budgetapp import ratelimit
+from budgetapp.reports import LedgerTotals, SpendingReport
+from budgetapp.search import TransactionIndex
+from budgetapp.money import to_money
+from budgetapp.storage import (
+    Backend, BudgetSnapshot, BudgetStore, ConflictError, apply_event,
+    build_in_background, category_name, cell_text, check_new_names)
+
+try:
+    import fcntl
+except ImportError:
+    # Without flock, two terminals on one machine could share a log
+    fcntl = None
+
+# Seconds to wait before trying the real store again, doubled each time
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+
+# A conflict is sent again after the backoff of ratelimit.retry_delay,
+# up to this many times
+CONFLICT_RETRIES = 3
+
+
+def write_file(path, text):
+    """
+    Replaces a file's contents in one step, so a process killed part
+    way through leaves the old file rather than half of the new one
+    """
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+
+class Outbox:
+    """
+    One user's write-ahead log, and the thread that sends it to the
+    real store. Only one process at a time can have a user's log open,
+    so the lock file is held with flock for as long as it is.
+
+    The log lines after _synced are kept in _lines as (number, kind,
+    rows), where kind is 'events', for journal events (see apply_event),
+    or 'transactions'. Lines up to _sent have reached the real store,
+    and lines up to _synced have also been read back from it:
+    _synced_categories are its categories then, and the first
+    _synced_count rows of _transactions its transactions, which the
+    ledger file holds up to byte _ledger_offset. The rest of
+    _transactions, and _categories, are the budget with the lines after
+    _synced made. They are kept up to date as lines are written, so
+    viewing the budget only copies the categories. generation goes up
+    whenever the budget is read back from the real store, which can put
+    the transactions in a different order, so a store can tell its copy
+    of the categories, and its index of the transactions, are out of
+    date.
+    """
+
+    def __init__(self, backend, username, directory, store=None):
+        self.backend = backend
+        self.username = username
+        self.path = os.path.join(directory, quote(username, safe=""))
+        self.condition = threading.Condition()
+        self.generation = 0
+        self._lock_file = open(self.path + ".lock", "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise
+        self._store = store
+        self._sent = self._synced = 0
+        self._synced_categories = []
+        self._synced_count = 0
+        self._ledger_offset = 0
+        self._transactions = []
+        self._lines = []
+        self._closed = False
+        self._wal = self._ledger = None
+        try:
+            self._open_files()
+        except BaseException:
+            # Otherwise the log would stay locked until the process ends
+            self._close_files()
+            raise
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _open_files(self):
+        """
+        Reads the log and opens its files, reading the budget from the
+        real store if there is no copy of it yet
+        """
+        if self._store is None:
+            self._read_files()
+        else:
+            # A new budget starts from whatever the real store has
+            for suffix in (".json", ".wal"):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+        self._next = max([self._sent] + [
+            number for number, _, _ in self._lines]) + 1
+        write_file(self.path + ".wal", "".join(
+            json.dumps(line) + "\n" for line in self._lines))
+        self._wal = open(self.path + ".wal", "a", encoding="utf-8")
+        self._ledger = open(self.path + ".ledger", "a", encoding="utf-8")
+        self._ledger.truncate(self._ledger_offset)
+        self._view_lines()
+        if not os.path.exists(self.path + ".json"):
+            # Nothing to show until the real store has been read
+            if self._store is None:
+                self._store = self.backend.open_budget(self.username)
+            self._sync()
+
+    def _close_files(self):
+        """
+        Closes the log's files and lets go of its lock
+        """
+        for file in (self._wal, self._ledger):
+            if file is not None:
+                file.close()
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+
+    def _read_files(self):
+        """
+        Reads the checkpoint, the ledger rows that go with it and the
+        lines of the log after it. A line cut short by the process being
+        killed, and anything after it, was never acknowledged, so it is
+        left out, as are ledger rows written after the checkpoint.
+        """
+        if os.path.exists(self.path + ".json"):
+            with open(self.path + ".json", encoding="utf-8") as file:
+                saved = json.load(file)
+            self._sent = saved["sent"]
+            self._synced = saved.get("synced", self._sent)
+            self._synced_categories = saved["categories"]
+            if "transactions" in saved:
+                # Saved before the ledger had a file of its own
+                write_file(self.path + ".ledger", "".join(
+                    json.dumps(row) + "\n" for row in saved["transactions"]))
+                saved["ledger"] = os.path.getsize(self.path + ".ledger")
+            self._ledger_offset = saved["ledger"]
+        if os.path.exists(self.path + ".ledger"):
+            with open(self.path + ".ledger", "rb") as file:
+                ledger = file.read(self._ledger_offset)
+            self._transactions = [
+                json.loads(text) for text in ledger.splitlines()]
+            self._synced_count = len(self._transactions)
+        if not os.path.exists(self.path + ".wal"):
+            return
+        with open(self.path + ".wal", encoding="utf-8") as file:
+            for text in file:
+                try:
+                    number, kind, rows = json.loads(text)
+                except ValueError:
+                    break
+                if number > self._synced:
+                    self._lines.append((number, kind, rows))
+
+    def _view_lines(self):
+        """
+        Works out the budget from what was last read back from the real
+        store and the lines after it
+        """
+        self._categories = [list(row) for row in self._synced_categories]
+        self._transactions[self._synced_count:] = []
+        for _, kind, rows in self._lines:
+            self._apply(kind, rows)
+
+    def _apply(self, kind, rows):
+        """
+        Makes a log line's writes to the budget in memory
+        """
+        if kind == "events":
+            for event in rows:
+                apply_event(self._categories, {}, 0, event)
+        else:
+            self._transactions.extend(list(row) for row in rows)
+
+    def write(self, kind, rows):
+        """
+        Adds a write to the log, returning once it is safely on disk
+        """
+        with self.condition:
+            line = (self._next, kind, rows)
+            self._wal.write(json.dumps(line) + "\n")
+            self._wal.flush()
+            os.fsync(self._wal.fileno())
+            self._lines.append(line)
+            self._apply(kind, rows)
+            self._next += 1
+            self.condition.notify_all()
+
+    def view(self):
+        """
+        Returns a copy of the categories with every write in the log
+        made, the transactions likewise and the generation they were
+        worked out from. The transactions are the outbox's own list,
+        which it appends to as transactions are written, so they must
+        not be changed.
+        """
+        with self.condition:
+            return (
+                [list(row) for row in self._categories], self._transactions,
+                self.generation)
+
+    def wait(self, timeout=None):
+        """
+        Waits until every write has been sent. Returns False if there
+        are still some left after timeout seconds.
+        """
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self._next - 1 <= self._sent, timeout)
+
+    def close(self):
+        """
+        Stops sending the log and lets another process open it
+        """
+        with self.condition:
+            self._closed = True
+            self.condition.notify_all()
+        self._close_files()
+
+    def _run(self):
+        """
+        Sends the log in order for as long as the process runs, reading
+        the budget back after each send. A call that fails is tried
+        again after a growing delay, so nothing is dropped however long
+        the real store can't be reached.
+        """
+        delay = RETRY_DELAY
+        conflicts = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self._next - 1 > self._synced
+                    or self._store is None or self._closed)
+                if self._closed:
+                    return
+                lines = self._next_lines()
+            try:
+                if self._store is None:
+                    self._store = self.backend.open_budget(self.username)
+                if lines:
+                    self._send(lines[0][1], [
+                        row for _, _, rows in lines for row in rows])
+                    self._acknowledge(lines[-1][0])
+                self._sync()
+            except ConflictError as error:
+                # The store has read the budget again, so try on top of
+                # it, after a random wait so that terminals sending at
+                # the same moment don't clash again
+                conflicts += 1
+                if conflicts <= CONFLICT_RETRIES:
+                    with self.condition:
+                        self.condition.wait_for(
+                            lambda: self._closed,
+                            ratelimit.retry_delay(conflicts - 1, error))
+                    continue
+            except Exception:
+                pass
+            else:
+                delay = RETRY_DELAY
+                conflicts = 0
+                continue
+            with self.condition:
+                self.condition.wait_for(lambda: self._closed, delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def _next_lines(self):
+        """
+        Returns the first line waiting to be sent and the ones of the
+        same kind straight after it, which can be sent together
+        """
+        unsent = [line for line in self._lines if line[0] > self._sent]
+        lines = unsent[:1]
+        for line in unsent[1:]:
+            if line[1] != lines[0][1]:
+                break
+            lines.append(line)
+        return lines
+
+    def _send(self, kind, rows):
+        """
+        Makes a list of writes of one kind to the real store
+        """
+        store = self._store
+        if kind == "transactions":
+            # The amount was written to the log as text
+            store.append_transactions(
+                [[to_money(row[0])] + row[1:] for row in rows])
+            return
+        with store.batch_changes():
+            for event, name, amount in rows:
+                names = store.category_names()
+                if event == "add":
+                    if name not in names:
+                        store.add_category(name, to_money(amount))
+                    # Otherwise added in another session
+                    continue
+                if name not in names:
+                    # Deleted in another session
+                    continue
+                category_num = names.index(name) + 1
+                if event == "set":
+                    store.set_category_amount(category_num, to_money(amount))
+                elif event == "change":
+                    store.change_category_amount(
+                        category_num, to_money(amount))
+                else:
+                    store.delete_category(category_num)
+
+    def _acknowledge(self, sent):
+        """
+        Records that the real store has every line up to sent, so none
+        of them are sent again
+        """
+        with self.condition:
+            self._sent = sent
+            self._save_checkpoint()
+            self.condition.notify_all()
+
+    def _sync(self):
+        """
+        Reads the budget back from the real store, which includes every
+        line up to _sent. Only the transactions added since the last
+        read are fetched and added to the ledger file.
+        """
+        sent = self._sent
+        categories = self._store.snapshot().categories
+        new_rows = self._store.transaction_count() - self._synced_count
+        added = self._store.recent_transactions(new_rows)[::-1] \
+            if new_rows > 0 else []
+        text = "".join(json.dumps(row) + "\n" for row in added)
+        self._ledger.write(text)
+        self._ledger.flush()
+        os.fsync(self._ledger.fileno())
+        with self.condition:
+            self._synced = sent
+            self._synced_categories = categories
+            self._transactions[self._synced_count:] = added
+            self._synced_count += len(added)
+            self._ledger_offset += len(text.encode("utf-8"))
+            self._save_checkpoint()
+            self._lines = [line for line in self._lines if line[0] > sent]
+            self._view_lines()
+            self.generation += 1
+            if not self._lines:
+                self._wal.truncate(0)
+                os.fsync(self._wal.fileno())
+            self.condition.notify_all()
+
+    def _save_checkpoint(self):
+        """
+        Saves the numbers of the lines sent and read back, and the
+        budget as it was read back, which is small: the transactions
+        are only referred to by how much of the ledger file they fill
+        """
+        write_file(self.path + ".json", json.dumps({
+            "sent": self._sent, "synced": self._synced,
+            "categories": self._synced_categories,
+            "ledger": self._ledger_offset}))
+
+
+class OfflineBudgetStore(BudgetStore):
+    """
+    A budget read from an Outbox's copy and written to its log. Reads
+    never leave memory and writes only wait for the disk.
+
+    Category changes are applied to the copy as they are made and kept
+    in _pending_events until their batch is committed, when they are
+    written to the log as one line. After a write, the copy is worked
+    out again if the outbox has since heard from the real store, so
+    other sessions' changes show up as they would with the real store.
+    The transactions aren't copied: _transactions is the outbox's own
+    list. The TransactionIndex, and the LedgerTotals that spending
+    reports are made from, catch up with it when they are used, or are
+    built again if the outbox has read the real store since.
+    """
+
+    def __init__(self, outbox):
+        self.outbox = outbox
+        self.username = outbox.username
+        self._index_lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        with self._index_lock:
+            self._categories, self._transactions, self._generation = \
+                self.outbox.view()
+            self._transaction_index = None
+            self._index_generation = None
+        self._ledger_totals = None
+        self._totals_generation = None
+        self._batch_depth = 0
+        self._batch_start = None
+        self._pending_events = []
+
+    def _write(self, kind, rows):
+        """
+        Writes to the log, catching up with the real store if the
+        outbox has heard from it since the copy was made
+        """
+        self.outbox.write(kind, rows)
+        if self._batch_depth == 0 \
+                and self.outbox.generation != self._generation:
+            self.refresh()
+
+    def start_batch(self):
+        if self._batch_depth == 0:
+            self._batch_start = [list(row) for row in self._categories]
+        self._batch_depth += 1
+
+    def commit_batch(self):
+        if self._batch_depth == 0:
+            return
+        self._batch_depth -= 1
+        if self._batch_depth > 0:
+            return
+        events = self._pending_events
+        self._batch_start = None
+        self._pending_events = []
+        if events:
+            self._write("events", events)
+
+    def discard_batch(self):
+        if self._batch_depth == 0:
+            return
+        self._categories = self._batch_start
+        self._batch_depth = 0
+        self._batch_start = None
+        self._pending_events = []
+
+    def snapshot(self):
+        return BudgetSnapshot(self._categories)
+
+    def category_names(self):
+        return [row[0] for row in self._categories]
+
+    def category_amounts(self):
+        return [row[1] for row in self._categories]
+
+    def category_count(self):
+        return len(self._categories)
+
+    def get_category(self, category_num):
+        return list(self._categories[category_num - 1])
+
+    def set_category_amount(self, category_num, amount):
+        with self.batch_changes():
+            name = category_name(self._categories, category_num, self)
+            self._queue_event(["set", name, cell_text(to_money(amount))])
+
+    def change_category_amount(self, category_num, change):
+        with self.batch_changes():
+            name = category_name(self._categories, category_num, self)
+            self._queue_event(["change", name, cell_text(to_money(change))])
+
+    def add_categories(self, categories):
+        with self.batch_changes():
+            check_new_names(
+                self._categories,
+                [cell_text(name) for name, _ in categories], self)
+            for name, amount in categories:
+                self._queue_event(
+                    ["add", cell_text(name), cell_text(to_money(amount))])
+
+    def delete_category(self, category_num):
+        with self.batch_changes():
+            name = category_name(self._categories, category_num, self)
+            self._queue_event(["delete", name, ""])
+
+    def _queue_event(self, event):
+        """
+        Applies an event to the copy and holds it back for the commit
+        """
+        apply_event(self._categories, {}, 0, event)
+        self._pending_events.append(event)
+
+    def get_transactions(self):
+        return [list(row) for row in self._transactions]
+
+    def transaction_count(self):
+        return len(self._transactions)
+
+    def transactions_between(self, first, last):
+        return [
+            list(self._transactions[position])
+            for position in self._index().dates.between(first, last)]
+
+    def search_transactions(self, **filters):
+        return [
+            list(self._transactions[position])
+            for position in self._index().search(**filters)]
+
+    def _index(self):
+        """
+        Returns the TransactionIndex of the transactions, building it
+        the first time it is needed and adding any written since.
+        _index_lock stops a search and the build started by
+        index_in_background() from both doing the work.
+        """
+        with self._index_lock:
+            if self._transaction_index is None \
+                    or self._index_generation != self.outbox.generation:
+                self._transaction_index = TransactionIndex()
+                self._index_generation = self.outbox.generation
+            index = self._transaction_index
+            transactions = self._transactions
+            for position in range(len(index.pence), len(transactions)):
+                index.add(position, transactions[position])
+            return index
+
+    def index_in_background(self):
+        return build_in_background(self._index)
+
+    def spending_report(self):
+        if self._ledger_totals is None \
+                or self._totals_generation != self.outbox.generation:
+            self._ledger_totals = LedgerTotals()
+            self._totals_generation = self.outbox.generation
+        totals = self._ledger_totals
+        totals.extend(self._transactions[totals.count:])
+        return SpendingReport(totals)
+
+    def append_transaction(self, transaction):
+        self.append_transactions([transaction])
+
+    def append_transactions(self, transactions):
+        self._write("transactions", [
+            [cell_text(x) for x in transaction]
+            for transaction in transactions])
+
+
+class OfflineBackend(Backend):
+    """
+    Wraps another Backend so that budgets are opened offline. Accounts
+    are still looked up and saved in the backend. A budget another
+    process on this machine already has open offline is opened straight
+    from the backend instead.
+    """
+
+    def __init__(self, backend, directory):
+        self.backend = backend
+        self.directory = directory
+        self._outboxes = {}
+        self._lock = threading.Lock()
+
+    def find_user(self, username_or_email):
+        return self.backend.find_user(username_or_email)
+
+    def usernames(self):
+        return self.backend.usernames()
+
+    def email_exists(self, email):
+        return self.backend.email_exists(email)
+
+    def username_exists(self, username):
+        return self.backend.username_exists(username)
+
+    def add_user(self, user):
+        self.backend.add_user(user)
+
+    def accepts_new_users(self):
+        return self.backend.accepts_new_users()
+
+    def delete_user(self, username):
+        self.backend.delete_user(username)
+        with self._lock:
+            outbox = self._outboxes.pop(username, None)
+        if outbox is not None:
+            outbox.close()
+        path = os.path.join(self.directory, quote(username, safe=""))
+        for suffix in (".wal", ".json", ".ledger", ".lock"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def create_budget(self, username):
+        store = self.backend.create_budget(username)
+        outbox = self._outbox(username, store)
+        return store if outbox is None else OfflineBudgetStore(outbox)
+
+    def open_budget(self, username):
+        outbox = self._outbox(username)
+        if outbox is None:
+            return self.backend.open_budget(username)
+        return OfflineBudgetStore(outbox)
+
+    def recurring_items(self, username=None):
+        return self.backend.recurring_items(username)
+
+    def add_recurring_item(self, item):
+        self.backend.add_recurring_item(item)
+
+    def update_recurring_items(self, changes):
+        self.backend.update_recurring_items(changes)
+
+    def delete_recurring_item(self, item):
+        self.backend.delete_recurring_item(item)
+
+    def _outbox(self, username, store=None):
+        """
+        Returns the Outbox for a user's budget, opening it if this
+        process hasn't yet, or None if another process has it open.
+        A new budget's store replaces anything left over in the files.
+        """
+        with self._lock:
+            if username in self._outboxes and store is None:
+                return self._outboxes[username]
+            os.makedirs(self.directory, exist_ok=True)
+            try:
+                outbox = Outbox(self.backend, username, self.directory, store)
+            except BlockingIOError:
+                return None
+            self._outboxes[username] = outbox
+            return outbox
+
+    def wait_for_writes(self, timeout=None):
+        with self._lock:
+            outboxes = list(self._outboxes.values())
+        return all([outbox.wait(timeout) for outbox in outboxes])
+
+    def warm_up(self):
+        self.backend.warm_up()
+        threading.Thread(target=self._send_left_over, daemon=True).start()
+
+    def _send_left_over(self):
+        """
+        Starts sending any log a process that has since stopped left
+        unsent. A log that can't be opened now is left for later.
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for file_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, file_name)
+            if file_name.endswith(".wal") and os.path.getsize(path):
+                try:
+                    self._outbox(unquote(file_name[:-len(".wal")]))
+                except Exception:
+                    pass
@@ -0,0 +1,43 @@
+"""
+How long the app pauses between screens and while typing out text.
+
+The pauses give a person time to read, but a scripted or automated
+session has no reason to wait. The mode comes from the BUDGETAPP_PACING
+environment variable or the --pacing option:
+
+- animated: the full pauses and typing effect (the default)
+- fast: a quarter of each pause
+- none: no pauses at all
+"""
+import os
+import time
+
+MODES = {
+    "animated": 1,
+    "fast": 0.25,
+    "none": 0,
+    }
+
+_scale = MODES["animated"]
+
+
+def set_mode(mode):
+    """
+    Switches to one of the MODES
+    """
+    global _scale
+    if mode not in MODES:
+        raise ValueError(
+            f"Pacing must be one of {', '.join(MODES)}, not {mode}")
+    _scale = MODES[mode]
+
+
+def pause(seconds):
+    """
+    Waits for the given number of seconds, scaled by the pacing mode
+    """
+    if _scale:
+        time.sleep(seconds * _scale)
+
+
+set_mode(os.environ.get("BUDGETAPP_PACING", "animated").lower())
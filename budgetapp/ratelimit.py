@@ -0,0 +1,159 @@
+"""
+Keeps calls to Google Sheets inside the API's quotas, and retries the
+ones that fail because of the quota or a server error.
+
+The Sheets API allows each user a set number of read and write requests
+a minute, and every terminal signs in as the same service account.
+Reads and writes each take a token from a bucket shared by the whole
+process, so a burst of calls is spread out instead of being refused.
+A call that still gets a 429 (quota) or 5xx (server) response is tried
+again after an exponential backoff with random jitter.
+
+Appends, deletes and new worksheets would be repeated if a server error
+came after Google had already made the change, so those are only retried
+after a 429, which means the request was turned away.
+"""
+import os
+import random
+import threading
+import time
+
+READS_PER_MINUTE = int(
+    os.environ.get("BUDGETAPP_SHEETS_READS_PER_MINUTE", 60))
+WRITES_PER_MINUTE = int(
+    os.environ.get("BUDGETAPP_SHEETS_WRITES_PER_MINUTE", 60))
+
+# How many seconds of quota can be used in one burst
+BURST_SECONDS = 10
+
+MAX_RETRIES = 5
+BASE_DELAY = 1
+MAX_DELAY = 32
+
+READ_METHODS = (
+    "open", "worksheet", "worksheets", "get", "get_all_values",
+    "get_all_records", "col_values", "row_values", "batch_get",
+    "values_batch_get", "acell", "cell", "find", "findall")
+
+# Writes that give the same result if they are sent twice
+REPEATABLE_WRITES = (
+    "update", "update_cell", "update_acell", "update_cells", "batch_update",
+    "values_batch_update", "clear", "batch_clear")
+
+WORKSHEET_METHODS = ("worksheet", "add_worksheet")
+
+
+class TokenBucket:
+    """
+    Hands out rate_per_minute tokens a minute, with up to
+    BURST_SECONDS worth saved up for bursts
+    """
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1, self.rate * BURST_SECONDS)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """
+        Waits until a token is free and takes it
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+buckets = {
+    "read": TokenBucket(READS_PER_MINUTE),
+    "write": TokenBucket(WRITES_PER_MINUTE),
+    }
+
+
+def limit_spreadsheet(spreadsheet):
+    """
+    Returns the spreadsheet with its calls rate limited and retried
+    """
+    return LimitedSheet(spreadsheet)
+
+
+def status_code(error):
+    """
+    Returns the HTTP status of a gspread APIError, or None
+    """
+    return getattr(getattr(error, "response", None), "status_code", None)
+
+
+def should_retry(method, error):
+    """
+    Returns True if a failed call is safe and worth trying again
+    """
+    status = status_code(error)
+    if status == 429:
+        return True
+    if status is not None and 500 <= status < 600:
+        return method in READ_METHODS or method in REPEATABLE_WRITES
+    return False
+
+
+def retry_delay(attempt, error):
+    """
+    Seconds to wait before retry number attempt (counting from 0).
+    Google's Retry-After header is used if it sent one.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    retry_after = headers.get("Retry-After") if headers else None
+    if retry_after and retry_after.isdigit():
+        return min(int(retry_after), MAX_DELAY)
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+def call(method, function, *args, **kwargs):
+    """
+    Makes one remote call within the quota, retrying it if it fails
+    with a retryable error
+    """
+    bucket = buckets["read" if method in READ_METHODS else "write"]
+    for attempt in range(MAX_RETRIES + 1):
+        bucket.take()
+        try:
+            return function(*args, **kwargs)
+        except Exception as error:
+            if attempt == MAX_RETRIES or not should_retry(method, error):
+                raise
+            time.sleep(retry_delay(attempt, error))
+
+
+class LimitedSheet:
+    """
+    Wraps a gspread Spreadsheet or Worksheet so that each method call
+    goes through call(). Worksheets it returns are wrapped too.
+    """
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        def limited(*args, **kwargs):
+            args = [
+                arg._target if isinstance(arg, LimitedSheet) else arg
+                for arg in args]
+            result = call(name, attribute, *args, **kwargs)
+            if name in WORKSHEET_METHODS:
+                return LimitedSheet(result)
+            return result
+        return limited
@@ -0,0 +1,247 @@
+"""
+Recurring transactions, and the scheduler that logs them when they
+come due.
+
+A recurring item is a [username, kind, institution, amount, category,
+frequency, next due, plan] list of text, kept by the Backend (see
+Backend.recurring_items). kind is 'payment' or 'income'. A payment is
+taken from category. Income goes to the 'Income' category and is
+delegated by its plan, a JSON list of [category, share] pairs where a
+share is an amount such as '500' or a percentage such as '50%'. Fixed
+amounts come off first and the percentages share out what is left, so
+they must add up to 100, unless the fixed amounts already use up the
+whole income and there are none. frequency is 'weekly' or 'monthly',
+and next due is the DD-MM-YY date the item will next be logged on.
+
+run_schedule() logs every item that has come due, for every user, in
+the fewest writes: one append of transactions and then one batch of
+category changes per user. Each item's next due date is moved on before
+anything is logged, in one write for everyone. It is put back for the
+items that couldn't be logged, if nothing was written for them, so the
+next run tries them again. Once a user's transactions are appended their
+items stay moved on, even if changing the categories then fails (which
+is reported), so nothing is ever logged or deducted twice. A run that
+dies part way misses items rather than logging them twice.
+"""
+import calendar
+import json
+from datetime import timedelta
+from budgetapp.dates import parse_date
+from budgetapp.jobs import run_for_users
+from budgetapp.money import ZERO, to_money
+from budgetapp.storage import cell_text
+
+FREQUENCIES = ("weekly", "monthly")
+
+
+class LoggedError(Exception):
+    """
+    Raised when a user's due transactions were appended but their
+    categories couldn't then be changed, so the items must not be
+    logged again. skipped is the items that were never going to be
+    logged, with their reasons.
+    """
+
+    def __init__(self, message, skipped):
+        super().__init__(message)
+        self.skipped = skipped
+
+
+def parse_plan(text):
+    """
+    Returns a delegation plan from its JSON text, as a list of
+    [category, share] pairs
+    """
+    return [[str(name), str(share)] for name, share in json.loads(text)]
+
+
+def plan_totals(plan):
+    """
+    Returns the total of the fixed amounts in a plan, and the total
+    of its percentages
+    """
+    fixed = ZERO
+    percent = ZERO
+    for _, share in plan:
+        if share.endswith("%"):
+            percent += to_money(share[:-1])
+        else:
+            fixed += to_money(share)
+    return fixed, percent
+
+
+def plan_is_complete(amount, plan):
+    """
+    Returns True if a plan delegates every pound of amount
+    """
+    fixed, percent = plan_totals(plan)
+    if percent:
+        return percent == 100 and fixed <= to_money(amount)
+    return fixed == to_money(amount)
+
+
+def split_income(amount, plan):
+    """
+    Returns the [category, amount] each category gets from an income
+    of amount under a complete plan. The pennies left over from
+    rounding the percentages go to the last of them.
+    """
+    fixed, _ = plan_totals(plan)
+    rest = to_money(amount) - fixed
+    parts = []
+    shared = ZERO
+    last = max(
+        [position for position, (_, share) in enumerate(plan)
+         if share.endswith("%")], default=None)
+    for position, (name, share) in enumerate(plan):
+        if not share.endswith("%"):
+            parts.append([name, to_money(share)])
+        elif position == last:
+            parts.append([name, rest - shared])
+        else:
+            part = to_money(rest * to_money(share[:-1]) / 100)
+            shared += part
+            parts.append([name, part])
+    return parts
+
+
+def next_date(due, frequency):
+    """
+    Returns the date after due that an item with this frequency is due
+    """
+    if frequency == "weekly":
+        return due + timedelta(days=7)
+    year, month = divmod(due.year * 12 + due.month, 12)
+    day = min(due.day, calendar.monthrange(year, month + 1)[1])
+    return due.replace(year=year, month=month + 1, day=day)
+
+
+def due_dates(item, today):
+    """
+    Returns every date up to today that an item is due on, and the
+    date it is next due after them
+    """
+    frequency, next_due = item[5], parse_date(item[6])
+    dates = []
+    while next_due <= today:
+        dates.append(next_due)
+        next_due = next_date(next_due, frequency)
+    return dates, next_due
+
+
+def describe(item):
+    """
+    Returns a line describing a recurring item for the user
+    """
+    _, kind, institution, amount, category, frequency, next_due, plan = item
+    if kind == "payment":
+        text = f"Payment of £{amount} to {institution} from {category}"
+    else:
+        shares = ", ".join(
+            f"{name} {share if share.endswith('%') else '£' + share}"
+            for name, share in parse_plan(plan))
+        text = f"Income of £{amount} from {institution} to {shares}"
+    return f"{text}, {frequency}, next on {next_due}"
+
+
+def log_due_items(store, items, today):
+    """
+    Logs every date each item is due on up to today to a user's store,
+    appending the transactions in one call and then changing the
+    categories in one batch. Returns the items that couldn't be logged,
+    because a category they use has been deleted, with the reason.
+    Raises LoggedError if the categories couldn't be changed after the
+    transactions were appended.
+    """
+    names = store.category_names()
+    changes = {}
+    transactions = []
+    skipped = []
+    for item in items:
+        _, kind, institution, amount, category, _, _, plan = item
+        if kind == "payment":
+            parts = [[category, -to_money(amount)]]
+        else:
+            parts = split_income(amount, parse_plan(plan))
+        missing = [name for name, _ in parts if name not in names]
+        if missing:
+            skipped.append([item, f"there is no {missing[0]} category"])
+            continue
+        for due in due_dates(item, today)[0]:
+            date = due.strftime("%d-%m-%y")
+            if kind == "payment":
+                transactions.append(
+                    [-to_money(amount), institution, date, category])
+            else:
+                transactions.append(
+                    [to_money(amount), institution, date, "Income"])
+            for name, part in parts:
+                category_num = names.index(name) + 1
+                changes[category_num] = changes.get(category_num, ZERO) + part
+    if not transactions:
+        return skipped
+    # If this fails nothing has been written, so the items can be tried
+    # again. The other way round, the categories would be changed twice.
+    store.append_transactions(transactions)
+    try:
+        with store.batch_changes():
+            for category_num, change in changes.items():
+                store.change_category_amount(category_num, change)
+    except Exception as error:
+        raise LoggedError(
+            f"the transactions were logged but the categories couldn't "
+            f"be changed ({error})", skipped) from error
+    return skipped
+
+
+def run_schedule(backend, today, workers=None, progress=None):
+    """
+    Logs the recurring items of every user that are due by today,
+    working on up to workers users at once (see jobs.run_for_users).
+    Returns a list of [username, items logged, items skipped with their
+    reasons, and what went wrong after the transactions were appended or
+    None].
+    """
+    due = {}
+    claims = []
+    for item in backend.recurring_items():
+        dates, next_due = due_dates(item, today)
+        if dates:
+            due.setdefault(item[0], []).append(item)
+            claims.append(
+                [item, item[:6] + [next_due.strftime("%d-%m-%y")] + item[7:]])
+    # Moved on first, so nothing is logged twice
+    backend.update_recurring_items(claims)
+
+    def log_user(username):
+        return log_due_items(
+            backend.open_budget(username), due[username], today)
+
+    results = []
+    unclaimed = []
+    claimed = {id(item): new_item for item, new_item in claims}
+    for username, skipped, error in run_for_users(
+            due, log_user, workers, progress):
+        items = due[username]
+        problem = None
+        if isinstance(error, LoggedError):
+            skipped, problem = error.skipped, str(error)
+        elif error is not None:
+            skipped = [[item, str(error)] for item in items]
+        unclaimed.extend(
+            [claimed[id(item)], item] for item, _ in skipped)
+        results.append(
+            [username, len(items) - len(skipped), skipped, problem])
+    if unclaimed:
+        backend.update_recurring_items(unclaimed)
+    return results
+
+
+def new_item(username, kind, institution, amount, category, frequency,
+             first_date, plan=None):
+    """
+    Returns a recurring item, all as text
+    """
+    return [
+        username, kind, institution, cell_text(to_money(amount)), category,
+        frequency, first_date, json.dumps(plan or [])]
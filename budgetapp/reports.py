@@ -0,0 +1,329 @@
+"""
+Spending reports worked out from a budget's transactions.
+
+The ledger is added up into LedgerTotals: the money in and out for each
+date and category, and the money spent with each institution, all in
+whole pence so the totals are exact. Amounts, dates and names repeat a
+great deal in a ledger, so each distinct one is only parsed once, and
+the transactions are turned into numbers by map() rather than a Python
+loop. The numbers are then added up a whole column at a time with
+NumPy, or by one Python loop if NumPy isn't installed. A store keeps
+its LedgerTotals
+between reports and only adds the transactions logged since (see
+BudgetStore.spending_report), so only the first report reads the whole
+ledger. A report then only takes a step for each date and category.
+"""
+from decimal import Decimal
+from itertools import repeat
+from operator import add, itemgetter, mul
+from budgetapp.dates import parse_date
+from budgetapp.money import to_money
+
+try:
+    import numpy
+except ImportError:
+    # Without it the totals are added up by a Python loop, which takes
+    # a few times as long on a large ledger
+    numpy = None
+
+# How many institutions a report lists
+TOP_INSTITUTIONS = 5
+
+
+MONTH_NAMES = [
+    "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+    "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def to_pence(text):
+    """
+    Turns an amount as stored into whole pence. An amount that can't be
+    read counts as nothing.
+    """
+    try:
+        return int(to_money(text) * 100)
+    except ValueError:
+        return 0
+
+
+def to_month(text):
+    """
+    Turns a transaction's date into a month number,
+    year * 12 + month - 1, or -1 if it isn't a date
+    """
+    parsed = parse_date(text)
+    return parsed.year * 12 + parsed.month - 1 if parsed else -1
+
+
+def month_name(month):
+    """
+    Returns a month number as text such as 'Jan 2022'
+    """
+    return f"{MONTH_NAMES[month % 12]} {month // 12}"
+
+
+def to_pounds(pence):
+    """
+    Turns whole pence back into a Decimal of pounds
+    """
+    return to_money(Decimal(pence).scaleb(-2))
+
+
+class Parsed(dict):
+    """
+    Remembers what parse returned for each value it has been given, so
+    looking a value up only parses it the first time
+    """
+
+    def __init__(self, parse):
+        super().__init__()
+        self.parse = parse
+
+    def __missing__(self, value):
+        result = self[value] = self.parse(value)
+        return result
+
+
+class Numbered(dict):
+    """
+    Gives each distinct name a number, counting from 0, and keeps the
+    names in the order they were numbered
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.names = []
+
+    def __missing__(self, name):
+        number = self[name] = len(self.names)
+        self.names.append(name)
+        return number
+
+
+def add_at(totals, keys, pence):
+    """
+    Returns a list of totals with a NumPy array of pence added to
+    them at keys, another array
+    """
+    array = numpy.array(totals, dtype=numpy.int64)
+    numpy.add.at(array, keys, pence)
+    return array.tolist()
+
+
+class LedgerTotals:
+    """
+    What a list of [amount, institution, date, category] transactions
+    adds up to, in pence. received and spent hold the money in and out
+    for each date and category, at date * width + category, and
+    by_institution the money spent with each institution. The dates,
+    categories and institutions are numbered in the order they turn up,
+    and date_names, category_names and institution_names turn those
+    numbers back into text. extend() adds more transactions.
+    """
+
+    def __init__(self, transactions=()):
+        self.count = 0
+        self.width = 1
+        self.received = []
+        self.spent = []
+        self.by_institution = []
+        self._amounts = Parsed(to_pence)
+        self._dates = Numbered()
+        self._categories = Numbered()
+        self._institutions = Numbered()
+        self.date_names = self._dates.names
+        self.category_names = self._categories.names
+        self.institution_names = self._institutions.names
+        self.extend(transactions)
+
+    def extend(self, transactions):
+        """
+        Adds transactions to the totals. Each column is first turned
+        into numbers, then they are added up into lists indexed by those
+        numbers, which are much quicker to add to than dictionaries.
+        """
+        columns = self._columns(transactions)
+        if numpy is None:
+            self._add_lists(*(list(column) for column in columns))
+        else:
+            # Amounts are under money.MAX_AMOUNT, so their pence fit in
+            # 64 bits
+            self._add_arrays(*(
+                numpy.fromiter(column, numpy.int64) for column in columns))
+
+    def _columns(self, transactions):
+        """
+        Returns the amounts of transactions in pence, and the numbers of
+        their dates, categories and institutions, as iterators
+        """
+        return [
+            map(numbers.__getitem__, map(itemgetter(column), transactions))
+            for column, numbers in (
+                (0, self._amounts), (2, self._dates),
+                (3, self._categories), (1, self._institutions))]
+
+    def _make_room(self):
+        """
+        Makes the totals long enough for every date, category and
+        institution numbered so far
+        """
+        if len(self.category_names) > self.width:
+            self._widen(len(self.category_names))
+        size = len(self.date_names) * self.width
+        self.received.extend([0] * (size - len(self.received)))
+        self.spent.extend([0] * (size - len(self.spent)))
+        self.by_institution.extend(
+            [0] * (len(self.institution_names) - len(self.by_institution)))
+
+    def _add_arrays(self, pence, dates, categories, institutions):
+        """
+        Adds NumPy arrays of transactions to the totals, a whole column
+        at a time
+        """
+        self._make_room()
+        keys = dates * self.width + categories
+        out = pence < 0
+        self.received = add_at(self.received, keys[~out], pence[~out])
+        self.spent = add_at(self.spent, keys[out], -pence[out])
+        self.by_institution = add_at(
+            self.by_institution, institutions[out], -pence[out])
+        self.count += len(pence)
+
+    def _add_lists(self, pence, dates, categories, institutions):
+        """
+        Adds lists of transactions to the totals in one Python loop
+        """
+        self._make_room()
+        received = self.received
+        spent = self.spent
+        by_institution = self.by_institution
+        keys = map(add, map(mul, dates, repeat(self.width)), categories)
+        for amount, key, institution in zip(pence, keys, institutions):
+            if amount < 0:
+                spent[key] -= amount
+                by_institution[institution] -= amount
+            else:
+                received[key] += amount
+        self.count += len(pence)
+
+    def _widen(self, width):
+        """
+        Makes room for more categories on each date, moving the totals
+        so far to where they go with the new width
+        """
+        for name in ("received", "spent"):
+            old = getattr(self, name)
+            new = [0] * (len(old) // self.width * width)
+            for key, pence in enumerate(old):
+                if pence:
+                    date, category = divmod(key, self.width)
+                    new[date * width + category] = pence
+            setattr(self, name, new)
+        self.width = width
+
+
+class SpendingReport:
+    """
+    What a ledger's transactions add up to. Money in (a positive amount)
+    is income, and money out (a negative one) is spending, which is
+    reported as a positive amount.
+
+    months lists the months with transactions, oldest first. income and
+    spending are the totals for the whole ledger, month_income and
+    month_spending the totals for each month, and category_spending
+    gives each month's spending by category. top_institutions is the
+    [name, spending] of the institutions the most was spent with.
+    Transactions whose date can't be read count towards the totals but
+    not towards any month. transactions can also be the LedgerTotals
+    of them.
+    """
+
+    def __init__(self, transactions):
+        self.transaction_count = 0
+        self.income = self.spending = to_pounds(0)
+        self.months = []
+        self.month_income = {}
+        self.month_spending = {}
+        self.category_spending = {}
+        self.top_institutions = []
+        if not isinstance(transactions, LedgerTotals):
+            transactions = LedgerTotals(transactions)
+        self._add_up(transactions)
+
+    def _add_up(self, totals):
+        """
+        Gathers the totals for each date and category into months,
+        which only takes a step for each of them
+        """
+        income = {}
+        spending = {}
+        by_category = {}
+        width = totals.width
+        date_months = [to_month(date) for date in totals.date_names]
+        for key, pence in enumerate(totals.received):
+            if pence:
+                month = date_months[key // width]
+                income[month] = income.get(month, 0) + pence
+        for key, pence in enumerate(totals.spent):
+            if pence:
+                date, category = divmod(key, width)
+                month = date_months[date]
+                spending[month] = spending.get(month, 0) + pence
+                by_category[month, category] = \
+                    by_category.get((month, category), 0) + pence
+
+        self.transaction_count = totals.count
+        self.income = to_pounds(sum(income.values()))
+        self.spending = to_pounds(sum(spending.values()))
+        self.months = sorted(
+            month for month in set(income) | set(spending) if month >= 0)
+        self.month_income = {
+            month: to_pounds(income.get(month, 0)) for month in self.months}
+        self.month_spending = {
+            month: to_pounds(spending.get(month, 0))
+            for month in self.months}
+        self.category_spending = {month: {} for month in self.months}
+        for (month, category), pence in sorted(
+                by_category.items(), key=lambda item: -item[1]):
+            if month >= 0:
+                self.category_spending[month][
+                    totals.category_names[category]] = to_pounds(pence)
+        self.top_institutions = [
+            [totals.institution_names[institution], to_pounds(pence)]
+            for institution, pence in sorted(
+                enumerate(totals.by_institution), key=lambda item: -item[1])
+            [:TOP_INSTITUTIONS] if pence]
+
+    def previous_month(self, month):
+        """
+        Returns the month before this one in the report, or None
+        """
+        position = self.months.index(month)
+        return self.months[position - 1] if position else None
+
+    def spending_change(self, month):
+        """
+        Returns how much more was spent this month than the one before
+        it, or None if it is the first
+        """
+        previous = self.previous_month(month)
+        if previous is None:
+            return None
+        return self.month_spending[month] - self.month_spending[previous]
+
+    def category_changes(self, month):
+        """
+        Returns how much more was spent in each category this month than
+        the one before it, biggest rise first. Empty for the first month.
+        """
+        previous = self.previous_month(month)
+        if previous is None:
+            return []
+        this_month = self.category_spending[month]
+        last_month = self.category_spending[previous]
+        changes = [
+            [name, this_month.get(name, to_pounds(0))
+             - last_month.get(name, to_pounds(0))]
+            for name in list(this_month) + [
+                name for name in last_month if name not in this_month]]
+        return sorted(changes, key=lambda change: -change[1])
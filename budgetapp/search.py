@@ -0,0 +1,90 @@
+"""
+Searching a budget's transactions.
+
+A TransactionIndex is an inverted index of a ledger: for each
+institution and each category, the positions of the transactions that
+have it. A search by institution only has to look through the distinct
+institution names, of which there are far fewer than transactions, and
+a search by category is one dictionary lookup. Dates go through a
+DateIndex and amounts are kept in pence alongside, so every filter is
+answered from memory. A store builds its index in the background
+after login (see BudgetStore.index_in_background) and adds the
+transactions appended since each time it is used, so it is only ever
+built once.
+"""
+from array import array
+from datetime import date
+from budgetapp.dates import DateIndex
+from budgetapp.reports import Parsed, to_pence
+
+
+class TransactionIndex:
+    """
+    An index of a list of [amount, institution, date, category]
+    transactions. institutions and categories map each name, in lower
+    case, to the positions of its transactions in order. pence holds
+    the size of each transaction's amount, and dates is a DateIndex.
+    """
+
+    def __init__(self, transactions=()):
+        self.dates = DateIndex(transactions)
+        self.institutions = {}
+        self.categories = {}
+        self.pence = array("q")
+        # Most amounts turn up many times, so each is only parsed once
+        self._amount_pence = Parsed(to_pence)
+        for position, transaction in enumerate(transactions):
+            self._add_terms(position, transaction)
+
+    def add(self, position, transaction):
+        """
+        Indexes the transaction at position, which is after every
+        position already in the index
+        """
+        self.dates.add(position, transaction)
+        self._add_terms(position, transaction)
+
+    def _add_terms(self, position, transaction):
+        """
+        Adds a transaction's institution, category and amount
+        """
+        amount, institution, _, category = transaction[:4]
+        self.institutions.setdefault(institution.lower(), []).append(
+            position)
+        self.categories.setdefault(category.lower(), []).append(position)
+        self.pence.append(abs(self._amount_pence[amount]))
+
+    def search(self, institution=None, category=None, min_amount=None,
+               max_amount=None, first_date=None, last_date=None):
+        """
+        Returns the positions, in order, of the transactions whose
+        institution contains institution and whose category is category
+        (both ignoring case), whose amount is from min_amount to
+        max_amount and whose date is from first_date to last_date.
+        Amounts are compared by size, so a payment of -12.00 is between
+        10 and 20. A filter left as None matches every transaction.
+        """
+        matches = None
+        if institution:
+            text = institution.lower()
+            matches = {
+                position
+                for name, positions in self.institutions.items()
+                if text in name for position in positions}
+        if category:
+            positions = self.categories.get(category.lower(), [])
+            matches = set(positions) if matches is None \
+                else matches.intersection(positions)
+        if first_date or last_date:
+            positions = self.dates.between(
+                first_date or date.min, last_date or date.max)
+            matches = set(positions) if matches is None \
+                else matches.intersection(positions)
+        if matches is None:
+            matches = range(len(self.pence))
+        low = to_pence(min_amount) if min_amount is not None else 0
+        high = to_pence(max_amount) if max_amount is not None else None
+        return sorted(
+            position for position in matches
+            if self.pence[position] >= low
+            and (high is None or self.pence[position] <= high))
@@ -0,0 +1,195 @@
+"""
+Serves many terminals from one Python process.
+
+Normally controllers/default.js starts a new `python3 run.py` for every
+browser tab, and each one imports gspread, signs in to Google and opens
+the spreadsheet before the user sees anything. `python3 run.py serve`
+starts a single process instead. It listens on a TCP port and runs each
+connection's session in its own thread. Every session shares the one
+signed-in client, the user directory, the rate limiter and the
+connection pool.
+
+The screens read input() and print() to sys.stdin and sys.stdout. While
+serving, those are replaced with routers that send each thread to its
+own connection. A connection carries the raw keystrokes and screen
+output that a pseudo-terminal would, so each Session echoes what is
+typed, handles backspace and turns Enter into the end of a line itself.
+"""
+import codecs
+import socketserver
+import sys
+import threading
+from colorama import AnsiToWin32
+
+_local = threading.local()
+
+ERASE = "\b \b"
+
+# Ctrl-C and Ctrl-D end the session, as they would in a terminal
+END_OF_SESSION = ("\x03", "\x04")
+
+
+class StreamRouter:
+    """
+    Stands in for sys.stdin or sys.stdout. A thread serving a session
+    uses that session's stream, any other thread uses the original.
+    """
+
+    def __init__(self, name, original):
+        self._name = name
+        self._original = original
+
+    def __getattr__(self, attribute):
+        session = getattr(_local, "session", None)
+        stream = getattr(session, self._name) if session else self._original
+        return getattr(stream, attribute)
+
+
+class SessionOutput:
+    """
+    Sends a session's output down its connection,
+    with newlines turned into the carriage return and line feed
+    a terminal expects
+    """
+
+    # colorama only resets colours on streams that are open
+    closed = False
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        data = text.replace("\r\n", "\n").replace("\n", "\r\n")
+        with self.lock:
+            try:
+                self.connection.sendall(data.encode("utf-8"))
+            except OSError:
+                # The terminal has gone. The next read will end the session
+                pass
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class SessionInput:
+    """
+    Reads a session's keystrokes from its connection a line at a time,
+    echoing them back as a terminal would
+    """
+
+    def __init__(self, connection, output):
+        self.connection = connection
+        self.output = output
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self.pending = ""
+        self.line = []
+        self.escape = ""
+        self.last_key = ""
+
+    def _keys(self):
+        """
+        Returns the next keys typed, or "" when the connection closes
+        """
+        if not self.pending:
+            data = self.connection.recv(1024)
+            if not data:
+                return ""
+            self.pending = self.decoder.decode(data)
+        keys, self.pending = self.pending, ""
+        return keys
+
+    def readline(self):
+        while True:
+            keys = self._keys()
+            if not keys:
+                return ""
+            for position, key in enumerate(keys):
+                line = self._key(key)
+                if line is not None:
+                    self.pending = keys[position + 1:]
+                    return line
+
+    def _key(self, key):
+        """
+        Handles one key, returning the line once Enter is pressed
+        """
+        previous_key, self.last_key = self.last_key, key
+        if self.escape:
+            # Skip arrow keys and other escape sequences
+            self.escape += key
+            if (len(self.escape) > 2 and key.isalpha()) or key == "~":
+                self.escape = ""
+            return None
+        if key == "\x1b":
+            self.escape = key
+        elif key in END_OF_SESSION:
+            raise EOFError
+        elif key == "\n" and previous_key == "\r":
+            pass
+        elif key in ("\r", "\n"):
+            self.output.write("\n")
+            line, self.line = "".join(self.line), []
+            return line + "\n"
+        elif key in ("\x7f", "\b"):
+            if self.line:
+                self.line.pop()
+                self.output.write(ERASE)
+        elif key.isprintable():
+            self.line.append(key)
+            self.output.write(key)
+        return None
+
+    def isatty(self):
+        return False
+
+
+class Session(socketserver.BaseRequestHandler):
+    """
+    Runs the app for one connection, on the server's thread for it
+    """
+
+    def handle(self):
+        output = SessionOutput(self.request)
+        _local.session = self
+        # Reset colours after every write, as colorama does for the app
+        self.stdout = AnsiToWin32(
+            output, convert=False, strip=False, autoreset=True).stream
+        self.stdin = SessionInput(self.request, output)
+        try:
+            self.server.app()
+        except EOFError:
+            pass
+        finally:
+            _local.session = None
+
+
+class SessionServer(socketserver.ThreadingTCPServer):
+    """
+    A server that runs app once for every connection, each in a thread
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, app):
+        self.app = app
+        super().__init__(address, Session)
+
+
+def serve(app, host, port):
+    """
+    Runs app for every connection to host:port until interrupted
+    """
+    sys.stdin = StreamRouter("stdin", sys.stdin)
+    sys.stdout = StreamRouter("stdout", sys.stdout)
+    with SessionServer((host, port), app) as server:
+        print(f"Serving sessions on {host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
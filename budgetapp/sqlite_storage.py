@@ -0,0 +1,606 @@
+"""
+SQLite storage, used instead of Google Sheets when
+BUDGETAPP_STORAGE is set to 'sqlite'.
+
+Everything lives in one database file with users, categories and
+transactions tables. Usernames and emails are unique (and so indexed),
+and categories and transactions are indexed by the user they belong to.
+Each transaction also has its date's ordinal (see budgetapp.dates),
+indexed with the user so transactions between two dates are a range
+scan of the index.
+
+Every change to a category is also recorded in the category_events
+table, the same journal of events the Google Sheets store keeps (see
+budgetapp.storage.apply_event). The categories table is brought up to
+date in the same database transaction, so it is always a snapshot of
+the whole journal.
+"""
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from budgetapp.dates import date_ordinal
+from budgetapp.money import to_money
+from budgetapp.reports import LedgerTotals, SpendingReport
+from budgetapp.storage import (
+    Backend, BudgetStore, ConflictError, cell_text, check_new_names)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    username TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS categories_by_user
+    ON categories (user_id, position);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    amount TEXT NOT NULL,
+    institution TEXT NOT NULL,
+    date TEXT NOT NULL,
+    category TEXT NOT NULL,
+    ordinal INTEGER
+);
+CREATE INDEX IF NOT EXISTS transactions_by_user
+    ON transactions (user_id, id);
+CREATE TABLE IF NOT EXISTS category_events (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    event TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS category_events_by_user
+    ON category_events (user_id, id);
+CREATE TABLE IF NOT EXISTS recurring (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    kind TEXT NOT NULL,
+    institution TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    category TEXT NOT NULL,
+    frequency TEXT NOT NULL,
+    next_due TEXT NOT NULL,
+    plan TEXT NOT NULL
+);
+"""
+
+
+class SqliteBackend(Backend):
+    """
+    Keeps every account and budget in a single SQLite database file
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self._add_versions()
+        self._add_date_ordinals()
+
+    def _add_versions(self):
+        """
+        Adds the categories' version column to a database made before
+        categories had versions
+        """
+        columns = [
+            row[1] for row in
+            self.connection.execute("PRAGMA table_info(categories)")]
+        if "version" not in columns:
+            self.connection.execute(
+                "ALTER TABLE categories "
+                "ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def _add_date_ordinals(self):
+        """
+        Adds the transactions' ordinal column to a database made before
+        transactions had one, working it out from their dates, and
+        indexes it
+        """
+        columns = [
+            row[1] for row in
+            self.connection.execute("PRAGMA table_info(transactions)")]
+        if "ordinal" not in columns:
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.execute(
+                    "ALTER TABLE transactions ADD COLUMN ordinal INTEGER")
+                self.connection.executemany(
+                    "UPDATE transactions SET ordinal = ? WHERE id = ?",
+                    [(date_ordinal(date), transaction_id)
+                     for transaction_id, date in self.connection.execute(
+                         "SELECT id, date FROM transactions").fetchall()])
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS transactions_by_date "
+            "ON transactions (user_id, ordinal)")
+
+    def find_user(self, username_or_email):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT first_name, email, username, password FROM users "
+                "WHERE username = ? OR email = ?",
+                (username_or_email, username_or_email)).fetchone()
+        return list(row) if row else None
+
+    def usernames(self):
+        with self.lock:
+            return [
+                row[0] for row in self.connection.execute(
+                    "SELECT username FROM users ORDER BY id")]
+
+    def email_exists(self, email):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM users WHERE email = ?",
+                (email,)).fetchone() is not None
+
+    def username_exists(self, username):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM users WHERE username = ?",
+                (username,)).fetchone() is not None
+
+    def add_user(self, user):
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO users (first_name, email, username, password) "
+                "VALUES (?, ?, ?, ?)", user)
+
+    def delete_user(self, username):
+        with self.lock:
+            user_id = self._user_id(username)
+            self.connection.execute("BEGIN")
+            try:
+                for table in ("categories", "transactions",
+                              "category_events", "recurring"):
+                    self.connection.execute(
+                        f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+                self.connection.execute(
+                    "DELETE FROM users WHERE id = ?", (user_id,))
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def create_budget(self, username):
+        return self.open_budget(username)
+
+    def open_budget(self, username):
+        store = SqliteBudgetStore(self, self._user_id(username))
+        store.username = username
+        return store
+
+    def recurring_items(self, username=None):
+        sql = (
+            "SELECT username, kind, institution, amount, category, "
+            "frequency, next_due, plan FROM recurring "
+            "JOIN users ON users.id = recurring.user_id")
+        parameters = ()
+        if username is not None:
+            sql += " WHERE username = ?"
+            parameters = (username,)
+        with self.lock:
+            return [
+                list(row) for row in self.connection.execute(
+                    sql + " ORDER BY recurring.id", parameters)]
+
+    def add_recurring_item(self, item):
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO recurring (user_id, kind, institution, amount, "
+                "category, frequency, next_due, plan) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._user_id(item[0])] + list(item[1:]))
+
+    def update_recurring_items(self, changes):
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                for item, new_item in changes:
+                    self.connection.execute(
+                        "UPDATE recurring SET next_due = ?, amount = ?, "
+                        "institution = ?, category = ?, frequency = ?, "
+                        "plan = ? WHERE id = ?",
+                        [new_item[6], new_item[3], new_item[2], new_item[4],
+                         new_item[5], new_item[7], self._recurring_id(item)])
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def delete_recurring_item(self, item):
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM recurring WHERE id = ?",
+                (self._recurring_id(item),))
+
+    def _recurring_id(self, item):
+        """
+        Looks up the id of the first row holding a recurring item
+        """
+        row = self.connection.execute(
+            "SELECT id FROM recurring WHERE user_id = ? AND kind = ? "
+            "AND institution = ? AND amount = ? AND category = ? "
+            "AND frequency = ? AND next_due = ? AND plan = ? "
+            "ORDER BY id LIMIT 1",
+            [self._user_id(item[0])] + list(item[1:])).fetchone()
+        if row is None:
+            raise KeyError(item)
+        return row[0]
+
+    def _user_id(self, username):
+        """
+        Looks up the id of a user from their username
+        """
+        row = self.connection.execute(
+            "SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            raise KeyError(username)
+        return row[0]
+
+
+class SqliteBudgetStore(BudgetStore):
+    """
+    A user's budget in the SQLite database. A category's number is its
+    position column, which is kept at 1, 2, 3... as categories are
+    added and deleted.
+
+    Category numbers are the ones the user was last shown: the
+    [name, amount, version, id] of every category is kept in _seen each
+    time they are all read, and changes are written to the row with that
+    id, so two categories with the same name are never mixed up. A
+    category added in this session is given its id when it is inserted.
+    Each write checks the version in its WHERE clause and bumps it, so a
+    category another session has changed is never overwritten (see
+    BudgetStore.set_category_amount and change_category_amount).
+
+    A batch starts from the categories in _seen, copied into _batch_rows,
+    and changes are queued in _batch_changes, then written in a single
+    database transaction on commit. No lock is held while the user
+    is typing, so other sessions are never kept waiting.
+
+    Spending reports are made from the LedgerTotals of the transactions,
+    kept in _ledger_totals with the id of the last one added, so each
+    report only reads the transactions logged since the one before.
+    """
+
+    def __init__(self, backend, user_id):
+        self.connection = backend.connection
+        self.lock = backend.lock
+        self.user_id = user_id
+        self._seen = None
+        self._batch_depth = 0
+        self._batch_rows = None
+        self._batch_changes = []
+        self._ledger_totals = None
+        self._ledger_id = 0
+
+    def _execute(self, sql, parameters=()):
+        """
+        Runs one statement for this user's budget
+        """
+        with self.lock:
+            return self.connection.execute(sql, parameters)
+
+    def _category_rows(self):
+        """
+        Returns the [name, amount] of every category in order
+        """
+        if self._batch_rows is not None:
+            return self._batch_rows
+        rows = self._execute(
+            "SELECT name, amount, version, id FROM categories "
+            "WHERE user_id = ? ORDER BY position", (self.user_id,)).fetchall()
+        self._seen = [list(row) for row in rows]
+        return [[name, amount] for name, amount, _, _ in rows]
+
+    def _seen_category(self, category_num):
+        """
+        Returns the [name, amount, version, id] of a category as the user
+        last saw it
+        """
+        if self._seen is None:
+            self._category_rows()
+        return self._seen[category_num - 1]
+
+    def category_names(self):
+        return [row[0] for row in self._category_rows()]
+
+    def category_amounts(self):
+        return [row[1] for row in self._category_rows()]
+
+    def category_count(self):
+        if self._batch_rows is not None:
+            return len(self._batch_rows)
+        return self._execute(
+            "SELECT COUNT(*) FROM categories WHERE user_id = ?",
+            (self.user_id,)).fetchone()[0]
+
+    def get_category(self, category_num):
+        if self._batch_rows is not None:
+            return list(self._batch_rows[category_num - 1])
+        if self._seen is None:
+            return list(self._category_rows()[category_num - 1])
+        seen = self._seen_category(category_num)
+        row = self._execute(
+            "SELECT name, amount FROM categories WHERE id = ?",
+            (seen[3],)).fetchone()
+        if row is None:
+            raise ConflictError(
+                f"{seen[0]} has been deleted in another session", self)
+        return list(row)
+
+    def set_category_amount(self, category_num, amount):
+        seen = self._seen_category(category_num)
+        self._change(category_num, (
+            self._write_amount, seen, seen[2], to_money(amount), None))
+
+    def change_category_amount(self, category_num, change):
+        seen = self._seen_category(category_num)
+        self._change(category_num, (
+            self._write_amount, seen, None, None, to_money(change)))
+
+    def _change(self, category_num, change):
+        """
+        Queues a change to a category's amount during a batch, or
+        makes it straight away
+        """
+        if self._batch_depth:
+            row = self._batch_rows[category_num - 1]
+            _, _, _, amount, difference = change
+            row[1] = cell_text(
+                amount if difference is None
+                else to_money(row[1]) + difference)
+            self._batch_changes.append(change)
+        else:
+            self._apply([change])
+
+    def _write_amount(self, seen, version, amount, difference):
+        """
+        Sets the amount of the category seen, or adds difference to it.
+        If version is given the category must still be on it.
+        """
+        name, _, _, category_id = seen
+        row = self.connection.execute(
+            "SELECT amount, version FROM categories WHERE id = ?",
+            (category_id,)).fetchone()
+        if row is None:
+            raise ConflictError(
+                f"{name} has been deleted in another session", self)
+        current, current_version = row
+        if version is not None and current_version != version:
+            raise ConflictError(
+                f"{name} has been changed in another session", self)
+        if difference is not None:
+            amount = to_money(current) + difference
+        updated = self.connection.execute(
+            "UPDATE categories SET amount = ?, version = version + 1 "
+            "WHERE id = ? AND version = ?",
+            (cell_text(amount), category_id, current_version))
+        if updated.rowcount != 1:
+            raise ConflictError(
+                f"{name} has been changed in another session", self)
+        if difference is None:
+            self._record("set", name, cell_text(amount))
+        else:
+            self._record("change", name, cell_text(difference))
+        # Recorded as what this session has seen of it
+        seen[1:3] = [cell_text(amount), current_version + 1]
+
+    def add_categories(self, categories):
+        rows = [[cell_text(name), cell_text(amount)]
+                for name, amount in categories]
+        if self._batch_depth:
+            check_new_names(
+                self._batch_rows, [name for name, _ in rows], self)
+        # Each is given its id once it is inserted
+        added = [[name, amount, 0, None] for name, amount in rows]
+        if self._batch_depth:
+            # Written with the rest of the batch, or not at all
+            self._batch_rows.extend(list(row) for row in rows)
+            self._batch_changes.append((self._insert_rows, added))
+        else:
+            self._apply([(self._insert_rows, added)])
+        if self._seen is not None:
+            self._seen.extend(added)
+
+    def delete_category(self, category_num):
+        seen = self._seen_category(category_num)
+        del self._seen[category_num - 1]
+        if self._batch_depth:
+            del self._batch_rows[category_num - 1]
+            self._batch_changes.append((self._delete_row, seen, seen[2]))
+        else:
+            self._apply([(self._delete_row, seen, seen[2])])
+
+    def _insert_rows(self, added):
+        """
+        Inserts [name, amount, version, id] categories at the end of the
+        budget, filling in their ids
+        """
+        names = self.connection.execute(
+            "SELECT name FROM categories WHERE user_id = ?",
+            (self.user_id,)).fetchall()
+        check_new_names(names, [seen[0] for seen in added], self)
+        for position, seen in enumerate(added, len(names) + 1):
+            name, amount, _, _ = seen
+            seen[3] = self.connection.execute(
+                "INSERT INTO categories (user_id, position, name, amount) "
+                "VALUES (?, ?, ?, ?)",
+                (self.user_id, position, name, amount)).lastrowid
+            self._record("add", name, amount)
+
+    def _delete_row(self, seen, version):
+        name, _, _, category_id = seen
+        row = self.connection.execute(
+            "SELECT position, version FROM categories WHERE id = ?",
+            (category_id,)).fetchone()
+        if row is None:
+            # Already deleted in another session
+            return
+        position, current_version = row
+        if current_version != version:
+            raise ConflictError(
+                f"{name} has been changed in another session", self)
+        self._execute(
+            "DELETE FROM categories WHERE id = ?", (category_id,))
+        self._execute(
+            "UPDATE categories SET position = position - 1 "
+            "WHERE user_id = ? AND position > ?",
+            (self.user_id, position))
+        self._record("delete", name, "")
+
+    def _record(self, event, name, amount):
+        """
+        Adds an event to the user's journal of category changes
+        """
+        self._execute(
+            "INSERT INTO category_events "
+            "(user_id, event, category, amount, date) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (self.user_id, event, name, amount,
+             datetime.now().strftime("%d-%m-%y %H:%M:%S")))
+
+    def get_transactions(self):
+        return [list(row) for row in self._execute(
+            "SELECT amount, institution, date, category FROM transactions "
+            "WHERE user_id = ? ORDER BY id", (self.user_id,))]
+
+    def transaction_count(self):
+        return self._execute(
+            "SELECT COUNT(*) FROM transactions WHERE user_id = ?",
+            (self.user_id,)).fetchone()[0]
+
+    def recent_transactions(self, count, skip=0):
+        return [list(row) for row in self._execute(
+            "SELECT amount, institution, date, category FROM transactions "
+            "WHERE user_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (self.user_id, count, skip))]
+
+    def transactions_between(self, first, last):
+        return [list(row) for row in self._execute(
+            "SELECT amount, institution, date, category FROM transactions "
+            "WHERE user_id = ? AND ordinal BETWEEN ? AND ? "
+            "ORDER BY ordinal, id",
+            (self.user_id, first.toordinal(), last.toordinal()))]
+
+    def search_transactions(self, institution=None, category=None,
+                            min_amount=None, max_amount=None,
+                            first_date=None, last_date=None):
+        conditions = ["user_id = ?"]
+        parameters = [self.user_id]
+        if institution:
+            conditions.append("institution LIKE ? ESCAPE '\\'")
+            parameters.append("%" + re.sub(r"([%_\\])", r"\\\1",
+                                           institution) + "%")
+        if category:
+            conditions.append("category = ? COLLATE NOCASE")
+            parameters.append(category)
+        if min_amount is not None:
+            conditions.append("ABS(CAST(amount AS REAL)) >= ?")
+            parameters.append(float(to_money(min_amount)))
+        if max_amount is not None:
+            conditions.append("ABS(CAST(amount AS REAL)) <= ?")
+            parameters.append(float(to_money(max_amount)))
+        if first_date:
+            conditions.append("ordinal >= ?")
+            parameters.append(first_date.toordinal())
+        if last_date:
+            conditions.append("ordinal <= ?")
+            parameters.append(last_date.toordinal())
+        return [list(row) for row in self._execute(
+            "SELECT amount, institution, date, category FROM transactions "
+            f"WHERE {' AND '.join(conditions)} ORDER BY id", parameters)]
+
+    def spending_report(self):
+        if self._ledger_totals is None:
+            self._ledger_totals = LedgerTotals()
+        rows = self._execute(
+            "SELECT id, amount, institution, date, category FROM transactions "
+            "WHERE user_id = ? AND id > ? ORDER BY id",
+            (self.user_id, self._ledger_id)).fetchall()
+        if rows:
+            self._ledger_id = rows[-1][0]
+            self._ledger_totals.extend([row[1:] for row in rows])
+        return SpendingReport(self._ledger_totals)
+
+    def append_transaction(self, transaction):
+        self.append_transactions([transaction])
+
+    def append_transactions(self, transactions):
+        self._apply([(self._insert_transactions, transactions)])
+
+    def _insert_transactions(self, transactions):
+        rows = [[cell_text(x) for x in transaction]
+                for transaction in transactions]
+        self.connection.executemany(
+            "INSERT INTO transactions "
+            "(user_id, amount, institution, date, category, ordinal) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            ((self.user_id, *row, date_ordinal(row[2])) for row in rows))
+
+    def _apply(self, changes):
+        """
+        Runs a list of (method, *args) changes in one database transaction.
+        It takes the write lock from the start, so the versions it checks
+        can't change before it commits.
+        """
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                for change, *args in changes:
+                    change(*args)
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                # What this session saw may be what conflicted
+                self._seen = None
+                raise
+            self.connection.execute("COMMIT")
+
+    def refresh(self):
+        self._seen = None
+
+    def start_batch(self):
+        if self._batch_depth == 0:
+            if self._seen is None:
+                self._category_rows()
+            self._batch_rows = [
+                [name, amount] for name, amount, _, _ in self._seen]
+            self._batch_changes = []
+        self._batch_depth += 1
+
+    def commit_batch(self):
+        if self._batch_depth == 0:
+            return
+        self._batch_depth -= 1
+        if self._batch_depth > 0:
+            return
+        changes = self._batch_changes
+        self._batch_rows = None
+        self._batch_changes = []
+        if changes:
+            self._apply(changes)
+
+    def discard_batch(self):
+        self._batch_depth = 0
+        self._batch_rows = None
+        self._batch_changes = []
+        self._seen = None
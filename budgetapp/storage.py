@@ -0,0 +1,1489 @@
+"""
+Storage layer for a user's budget.
+
+The screens in run.py only talk to a BudgetStore. The Google Sheets
+store reads the user's '_main' and '_transactions' worksheets once,
+answers every read from memory and writes straight through to the sheet.
+Changes to the categories are appended to the '_journal' worksheet, and
+'_main' is a snapshot of them. Changes made inside batch_changes() are
+held back and appended together when the block ends. Categories are
+changed by name and carry a version, so two sessions on the same budget
+don't lose each other's changes, and a change that can't be made raises
+ConflictError.
+
+A Backend holds the user accounts and hands out each user's BudgetStore.
+open_backend() picks Google Sheets or SQLite from BUDGETAPP_STORAGE,
+and can wrap it so budgets are worked on offline (BUDGETAPP_OFFLINE).
+The Google Sheets connection isn't made until it is first needed, and
+warm_up() can make it in the background while the start screen plays.
+"""
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+from budgetapp import ratelimit, tracing
+from budgetapp.dates import DateIndex
+from budgetapp.reports import LedgerTotals, SpendingReport
+from budgetapp.search import TransactionIndex
+from budgetapp.money import ZERO, to_money
+
+SCOPE = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/drive"
+    ]
+
+SPREADSHEET_NAME = 'commandline-budgetapp'
+
+TRANSACTION_HEADER = ['amount', 'insitution', 'date', 'budget category']
+
+JOURNAL_HEADER = [
+    'event', 'category', 'amount', 'date', 'expects', 'batch size']
+
+# What an 'add' event expects: that there is no category with its name
+NEW_CATEGORY = 'new'
+
+RECURRING_HEADER = [
+    'username', 'kind', 'institution', 'amount', 'category', 'frequency',
+    'next due', 'plan']
+
+# A snapshot of the categories is written after this many journal rows
+SNAPSHOT_EVERY = 50
+
+# Transactions are counted by reading this many rows at the bottom of
+# the '_transactions' grid, which are kept as the most recent ones
+TAIL_ROWS = 20
+
+# Google Sheets allows this many worksheets in a spreadsheet. 'users'
+# and 'recurring' take two and every user three more, for their
+# '_main', '_transactions' and '_journal' worksheets.
+MAX_WORKSHEETS = 200
+MAX_SHEETS_USERS = (MAX_WORKSHEETS - 2) // 3
+
+# A lookup in the 'users' worksheet that misses reads it again, in case
+# another terminal has added the user, but no more often than this many
+# seconds, so a run of misses doesn't read it every time
+USERS_REFRESH_SECONDS = 10
+
+
+def open_backend():
+    """
+    Opens the storage chosen by the BUDGETAPP_STORAGE environment variable.
+    'sheets' (the default) uses Google Sheets, through gspread or,
+    if BUDGETAPP_SHEETS_CLIENT is 'async', the asyncio client.
+    'sqlite' uses a local database file named by BUDGETAPP_SQLITE_PATH.
+    If BUDGETAPP_OFFLINE is 'on', budgets are worked on offline and
+    sent to the storage in the background (see budgetapp.offline).
+    """
+    backend = open_storage()
+    if os.environ.get('BUDGETAPP_OFFLINE', 'off').lower() == 'on':
+        from budgetapp.offline import OfflineBackend
+        return OfflineBackend(backend, os.environ.get(
+            'BUDGETAPP_OFFLINE_DIR', '.budgetapp-offline'))
+    return backend
+
+
+def open_storage():
+    """
+    Opens the Backend named by BUDGETAPP_STORAGE
+    """
+    storage = os.environ.get('BUDGETAPP_STORAGE', 'sheets').lower()
+    if storage == 'sqlite':
+        from budgetapp.sqlite_storage import SqliteBackend
+        return SqliteBackend(
+            os.environ.get('BUDGETAPP_SQLITE_PATH', 'budgetapp.db'))
+    if storage != 'sheets':
+        raise ValueError(f"Unknown BUDGETAPP_STORAGE: {storage}")
+    client = os.environ.get('BUDGETAPP_SHEETS_CLIENT', 'gspread').lower()
+    if client == 'async':
+        from budgetapp import async_sheets
+        return async_sheets.AsyncSheetsBackend(
+            lambda: tracing.trace_spreadsheet(async_sheets.connect()))
+    if client != 'gspread':
+        raise ValueError(f"Unknown BUDGETAPP_SHEETS_CLIENT: {client}")
+    return SheetsBackend(connect_to_sheets)
+
+
+def connect_to_sheets():
+    """
+    Authorises with the service account in creds.json
+    and opens the app's spreadsheet. Its calls are rate limited
+    and retried, and traced if tracing is on.
+    """
+    # Imported here so that starting the app doesn't wait on them
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    creds = Credentials.from_service_account_file('creds.json')
+    client = gspread.authorize(creds.with_scopes(SCOPE))
+    spreadsheet = ratelimit.limit_spreadsheet(client.open(SPREADSHEET_NAME))
+    return tracing.trace_spreadsheet(spreadsheet)
+
+
+def cell_text(value):
+    """
+    Returns a value the way Google Sheets hands it back,
+    so cached cells look the same as freshly read ones
+    """
+    if isinstance(value, Decimal):
+        return cell_text(sheet_value(value))
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def sheet_value(value):
+    """
+    Returns a Decimal as the number sent to Google Sheets, which only
+    takes JSON numbers. Other values are sent as they are.
+    """
+    if not isinstance(value, Decimal):
+        return value
+    if value == value.to_integral_value():
+        return int(value)
+    return float(value)
+
+
+def category_row(value):
+    """
+    Returns a row of a '_main' worksheet as [name, amount, version].
+    Rows written before categories had versions are version 0.
+    """
+    name, amount, version = (list(value) + ["", "", ""])[:3]
+    return [name, amount, int(version) if str(version).strip() else 0]
+
+
+def apply_event(categories, versions, row_num, event):
+    """
+    Applies a journal event, from row row_num of the journal, to a list
+    of [name, amount] categories and their versions. An event is a row
+    of the journal, [kind, category name, amount, date, expects, batch
+    size], of which only the first three are needed: 'add' adds a
+    category, 'set' sets its amount, 'change' adds to its amount and
+    'delete' deletes it. expects, if there is one, is the version the
+    category must be on, or NEW_CATEGORY if it mustn't be there yet.
+    Returns False, changing nothing, if the category isn't there or
+    isn't on the version expected. Deleting a category that has already
+    gone changes nothing, but isn't a failure.
+    """
+    kind, name, amount, _, expects = (list(event) + [""] * 5)[:5]
+    expects = str(expects).strip()
+    names = [category[0] for category in categories]
+    if kind == "add":
+        if expects == NEW_CATEGORY and name in names:
+            return False
+        categories.append([name, cell_text(to_money(amount))])
+        versions[name] = row_num
+        return True
+    if kind not in ("set", "change", "delete"):
+        return False
+    if name not in names:
+        return kind == "delete"
+    if expects and str(versions.get(name)) != expects:
+        return False
+    category = categories[names.index(name)]
+    if kind == "delete":
+        categories.remove(category)
+        versions.pop(name, None)
+        return True
+    if kind == "set":
+        category[1] = cell_text(to_money(amount))
+    else:
+        category[1] = cell_text(to_money(category[1]) + to_money(amount))
+    versions[name] = row_num
+    return True
+
+
+def apply_batch(categories, versions, row_num, events):
+    """
+    Applies a batch of journal events, the first from row row_num, to
+    copies of a list of [name, amount] categories and their versions:
+    all of them, or none if one can't be applied. Returns the copies,
+    how much the events change the categories' total and the event
+    that stopped the batch, or None. A stopped batch returns categories
+    and versions as they were.
+    """
+    new_categories = [list(category) for category in categories]
+    new_versions = dict(versions)
+    change = ZERO
+    for event_row, event in enumerate(events, row_num):
+        change += event_change(new_categories, event)
+        if not apply_event(new_categories, new_versions, event_row, event):
+            return categories, versions, ZERO, event
+    return new_categories, new_versions, change, None
+
+
+def journal_batches(row_num, rows):
+    """
+    Splits rows of the journal, the first from row row_num, into the
+    batches they were appended in. Returns a (row_num, rows) pair for
+    each. The first row of a batch has how many rows it has in column
+    F, and rows written before there were batches are one each.
+    """
+    batches = []
+    position = 0
+    while position < len(rows):
+        size = str((list(rows[position]) + [""] * 6)[5]).strip()
+        end = position + (int(size) if size else 1)
+        batches.append((row_num + position, rows[position:end]))
+        position = end
+    return batches
+
+
+def journal_rows(events, expected_versions, stamp):
+    """
+    Returns a batch of [kind, name, amount] events as rows for the
+    journal. The first event for each category in expected_versions
+    expects the category to be on that version, every 'add' expects
+    its category not to be there yet, and the first row has the number
+    of rows in the batch.
+    """
+    expected = dict(expected_versions)
+    rows = [
+        [kind, name, amount, stamp,
+         NEW_CATEGORY if kind == "add" else expected.pop(name, ""), ""]
+        for kind, name, amount in events]
+    rows[0][5] = len(rows)
+    return rows
+
+
+def event_change(categories, event):
+    """
+    Returns how much applying a journal event to a list of [name,
+    amount] categories changes their total, which is nothing if the
+    category isn't there
+    """
+    kind, name, amount = (list(event) + ["", "", ""])[:3]
+    if kind == "add":
+        return to_money(amount)
+    names = [category[0] for category in categories]
+    if name not in names or kind not in ("set", "change", "delete"):
+        return ZERO
+    old_amount = to_money(categories[names.index(name)][1])
+    if kind == "delete":
+        return -old_amount
+    if kind == "set":
+        return to_money(amount) - old_amount
+    return to_money(amount)
+
+
+class ConflictError(Exception):
+    """
+    Raised when another session has changed a budget in a way that this
+    session's changes can't be made on top of, or a change can't be
+    made to the budget as it stands, such as adding a category with a
+    name that is already taken. Nothing is written, and store will read
+    the budget again the next time it is used.
+    """
+
+    def __init__(self, message, store):
+        super().__init__(message)
+        self.store = store
+
+
+def category_name(categories, category_num, store):
+    """
+    Returns the name of a category in a list of [name, amount]
+    categories. Changes find a category by its name, so one with the
+    same name as a category before it, which budgets made before names
+    had to be unique can have, raises ConflictError rather than let the
+    change be made to the other one.
+    """
+    name = categories[category_num - 1][0]
+    if [category[0] for category in categories].index(name) \
+            != category_num - 1:
+        raise ConflictError(
+            f"There is more than one {name} category", store)
+    return name
+
+
+def check_new_names(categories, names, store):
+    """
+    Raises ConflictError if any of names is already the name of one of
+    a list of [name, amount] categories, or is given twice
+    """
+    taken = {category[0] for category in categories}
+    for name in names:
+        if name in taken:
+            raise ConflictError(f"There is already a {name} category", store)
+        taken.add(name)
+
+
+class BudgetSnapshot:
+    """
+    The categories of a budget at one moment, with everything the
+    dashboard and the category prompts work out from them. A store that
+    already knows the total can pass it in, otherwise it is added up
+    the first time it is asked for.
+    """
+
+    def __init__(self, categories, total=None):
+        self.categories = [list(category) for category in categories]
+        self._total = total
+
+    @property
+    def count(self):
+        return len(self.categories)
+
+    @property
+    def total(self):
+        if self._total is None:
+            self._total = sum(
+                (to_money(amount) for _, amount in self.categories),
+                ZERO)
+        return self._total
+
+    def get_category(self, category_num):
+        """
+        Returns the [name, amount] pair of a category
+        """
+        return list(self.categories[category_num - 1])
+
+
+def build_in_background(build):
+    """
+    Calls build in a daemon thread and returns the thread. A failure
+    there is left for the next real use to report, where the user will
+    see it.
+    """
+    def run():
+        try:
+            build()
+        except Exception:
+            pass
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+class BudgetStore:
+    """
+    The operations the app needs on a user's categories and transactions.
+    Categories are numbered from 1, in the order shown on the dashboard.
+    Amounts are returned as text, exactly as they are stored.
+    username is the user whose budget it is.
+    """
+
+    username = None
+
+    def category_names(self):
+        """
+        Returns the names of all the categories
+        """
+        raise NotImplementedError
+
+    def category_amounts(self):
+        """
+        Returns the amounts budgeted to each category
+        """
+        raise NotImplementedError
+
+    def category_count(self):
+        """
+        Returns how many categories the budget has
+        """
+        return len(self.category_names())
+
+    def get_category(self, category_num):
+        """
+        Returns the [name, amount] pair of a category
+        """
+        raise NotImplementedError
+
+    def snapshot(self):
+        """
+        Returns a BudgetSnapshot of the categories as they are now
+        """
+        return BudgetSnapshot(
+            zip(self.category_names(), self.category_amounts()))
+
+    def total_budgeted(self):
+        """
+        Returns the total budgeted across all the categories
+        """
+        return self.snapshot().total
+
+    def set_category_amount(self, category_num, amount):
+        """
+        Sets the amount budgeted to a category. Raises ConflictError if
+        another session has changed the category since it was read.
+        """
+        raise NotImplementedError
+
+    def change_category_amount(self, category_num, change):
+        """
+        Adds change, which may be negative, to the amount budgeted to a
+        category. If another session has changed the category since it
+        was read, the change is made on top of theirs.
+        """
+        self.set_category_amount(
+            category_num,
+            to_money(self.get_category(category_num)[1]) + to_money(change))
+
+    def add_category(self, name, amount=0):
+        """
+        Adds a category to the end of the budget
+        """
+        self.add_categories([[name, amount]])
+
+    def add_categories(self, categories):
+        """
+        Adds a list of [name, amount] categories to the end of the budget
+        """
+        raise NotImplementedError
+
+    def delete_category(self, category_num):
+        """
+        Deletes a category. The categories after it move up by one.
+        Raises ConflictError if another session has changed the category
+        since it was read.
+        """
+        raise NotImplementedError
+
+    def get_transactions(self):
+        """
+        Returns every transaction as [amount, institution, date, category],
+        oldest first
+        """
+        raise NotImplementedError
+
+    def transaction_count(self):
+        """
+        Returns how many transactions have been logged
+        """
+        return len(self.get_transactions())
+
+    def recent_transactions(self, count, skip=0):
+        """
+        Returns up to count transactions, newest first,
+        leaving out the skip newest ones
+        """
+        transactions = self.get_transactions()
+        end = max(len(transactions) - skip, 0)
+        return transactions[max(end - count, 0):end][::-1]
+
+    def transactions_between(self, first, last):
+        """
+        Returns the transactions dated from first to last, both
+        datetime.dates and both included, oldest first. Transactions
+        whose date can't be read are left out.
+        """
+        transactions = self.get_transactions()
+        return [
+            transactions[position]
+            for position in DateIndex(transactions).between(first, last)]
+
+    def search_transactions(self, institution=None, category=None,
+                            min_amount=None, max_amount=None,
+                            first_date=None, last_date=None):
+        """
+        Returns the transactions, oldest first, whose institution
+        contains institution and whose category is category (both
+        ignoring case), whose amount is from min_amount to max_amount
+        by size, and whose date is from first_date to last_date.
+        Filters left as None match everything.
+        """
+        transactions = self.get_transactions()
+        return [
+            transactions[position]
+            for position in TransactionIndex(transactions).search(
+                institution, category, min_amount, max_amount,
+                first_date, last_date)]
+
+    def spending_report(self):
+        """
+        Returns the SpendingReport of every transaction
+        """
+        return SpendingReport(self.get_transactions())
+
+    def index_in_background(self):
+        """
+        Starts getting ready for search_transactions in a background
+        thread, so the first search doesn't have to wait. Returns the
+        thread, or None if there is nothing to get ready.
+        """
+        return None
+
+    def append_transaction(self, transaction):
+        """
+        Adds a transaction to the end of the transaction list
+        """
+        raise NotImplementedError
+
+    def append_transactions(self, transactions):
+        """
+        Adds a list of transactions to the end of the transaction list
+        """
+        for transaction in transactions:
+            self.append_transaction(transaction)
+
+    def refresh(self):
+        """
+        Drops anything held in memory so the next read is fresh
+        """
+
+    @contextmanager
+    def batch_changes(self):
+        """
+        Holds back category changes made inside the with block and
+        commits them together when it ends. If the block is left by an
+        error (or the user quitting) the changes are rolled back instead.
+        """
+        self.start_batch()
+        try:
+            yield self
+        except BaseException:
+            self.discard_batch()
+            raise
+        self.commit_batch()
+
+    def start_batch(self):
+        """
+        Starts holding back category changes
+        """
+
+    def commit_batch(self):
+        """
+        Sends the held back category changes to storage
+        """
+
+    def discard_batch(self):
+        """
+        Forgets the held back category changes
+        """
+
+
+class SheetsBudgetStore(BudgetStore):
+    """
+    A budget kept in a user's '_main', '_transactions' and '_journal'
+    worksheets. The categories are read once, when the store is opened,
+    and the transactions the first time they are all asked for, then
+    reads come from memory. Recent transactions are read a window at a
+    time instead, so viewing the last few doesn't download the whole
+    ledger. Fetched rows are kept in _transaction_rows. Transactions
+    asked for between two dates, or searched for, are found with a
+    TransactionIndex of them all, kept in _transaction_index, and
+    spending reports are made from their LedgerTotals, kept in
+    _ledger_totals and only added to as transactions are logged.
+    A backend that has already read the snapshot, or the rows at the
+    bottom of the transactions (see _set_tail), can pass them in.
+    If a write to the sheet fails the cached copy is dropped, so the
+    next read goes back to the sheet rather than trusting stale data.
+
+    Every change to the categories is an event appended to the journal
+    (see apply_event), and '_main' holds a snapshot of them: a
+    [name, amount, version] row for each category, with the number of
+    journal rows it includes in D1 and how many categories it has in D2.
+    The categories are the snapshot with the journal rows after it
+    applied, and a new snapshot is written every SNAPSHOT_EVERY rows.
+    A category's version is the journal row that last changed it.
+
+    Changes are kept in _pending_events until the batch they are made
+    in is committed (a change made outside a batch is a batch of its
+    own). Committing reads the journal rows other sessions have added,
+    then appends this session's events in one call. A change to an
+    amount is added to whatever the amount is then. A category set to
+    an amount with set_category_amount(), or deleted, must still be on
+    the version this store read (kept in _expected_versions), or a
+    ConflictError is raised and nothing is written.
+
+    Another session can append between that check and this session's
+    append, so the check is also written into the journal: each row
+    says what version its category must be on (see journal_rows), and
+    a batch is applied whole, or skipped by every session reading the
+    journal if one of its events can't be made (see apply_batch). If
+    another session's rows turn out to have landed first, the journal
+    is read back in order, and ConflictError is raised if this
+    session's batch was skipped.
+
+    Meanwhile the cache shows the budget as it will look once the
+    batch is committed.
+
+    The total budgeted is added up once, from the cached categories, and
+    then kept in _total by adjusting it on every change, including
+    those read from the journal, so asking for it never goes back to
+    the sheet. It is only added up again after a refresh, which is also
+    what a failed write causes, or after a commit that finds another
+    session appended first and so has to read the budget again.
+    """
+
+    def __init__(self, category_worksheet, transactions_worksheet,
+                 journal_worksheet, categories=None, transaction_tail=None):
+        self.category_worksheet = category_worksheet
+        self.transactions_worksheet = transactions_worksheet
+        self.journal_worksheet = journal_worksheet
+        self._categories = None
+        self._versions = {}
+        self._journal_rows = 1
+        self._snapshot_rows = None
+        self._snapshot_height = 0
+        self._snapshot_grid = None
+        self._transactions = None
+        self._transaction_index = None
+        self._index_lock = threading.RLock()
+        self._ledger_totals = None
+        self._transaction_count = None
+        self._transaction_rows = {}
+        self._batch_depth = 0
+        self._batch_start = None
+        self._pending_events = []
+        self._expected_versions = {}
+        self._total = None
+        self._batch_start_total = None
+        if transaction_tail is not None:
+            self._set_tail(*transaction_tail)
+        if categories is not None:
+            # The snapshot has already been read by the backend
+            self._set_snapshot(categories)
+            self._catch_up()
+        self._load()
+
+    def _load(self):
+        """
+        Reads the categories into memory if they aren't there already
+        """
+        if self._categories is None:
+            # Columns A to D hold the whole snapshot, in one request
+            self._set_snapshot(self.category_worksheet.batch_get(["A:D"])[0])
+            self._catch_up()
+
+    def _set_snapshot(self, values):
+        """
+        Caches the categories and their versions from the rows of the
+        '_main' worksheet
+        """
+        column_d = [
+            (list(value) + ["", "", "", ""])[3] for value in values[:2]]
+        column_d += ["", ""]
+        self._snapshot_rows = int(column_d[0]) if column_d[0] else None
+        if self._snapshot_rows is None:
+            # Kept before there was a journal, so only the journal's
+            # header comes before it and the versions it has don't count
+            rows = [[name, amount, 0] for name, amount, _ in (
+                category_row(value) for value in values
+                if value and value[0])]
+        else:
+            rows = [category_row(value)
+                    for value in values[:int(column_d[1] or 0)]]
+        self._snapshot_height = len(values)
+        self._journal_rows = self._snapshot_rows or 1
+        self._categories = [[name, cell_text(amount)]
+                            for name, amount, _ in rows]
+        self._versions = {}
+        for name, _, version in rows:
+            self._versions.setdefault(name, version)
+
+    def _catch_up(self):
+        """
+        Applies the journal rows added since the store last read it, a
+        batch at a time. A batch that can't be made on top of the ones
+        before it is skipped rather than raising ConflictError, so
+        opening a budget never fails on one. Returns the first row of
+        each batch that was skipped, mapped to the event that stopped it.
+        """
+        # A range that starts below the grid is an error, so this starts
+        # on the last row already applied, which is always there
+        rows = self.journal_worksheet.get(f"A{self._journal_rows}:F")[1:]
+        skipped = {}
+        for row_num, batch in journal_batches(self._journal_rows + 1, rows):
+            stopped = self._apply(row_num, batch)
+            if stopped is not None:
+                skipped[row_num] = stopped
+        self._journal_rows += len(rows)
+        return skipped
+
+    def _apply(self, row_num, events):
+        """
+        Applies a batch of journal events to the cache, and their change
+        to the running total. Returns the event that stopped the batch,
+        or None if it was applied.
+        """
+        self._categories, self._versions, change, stopped = apply_batch(
+            self._categories, self._versions, row_num, events)
+        self._adjust_total(change)
+        return stopped
+
+    def _adjust_total(self, change):
+        """
+        Adds change to the running total, if it has been added up yet
+        """
+        if self._total is not None:
+            self._total += change
+
+    def _load_transactions(self):
+        """
+        Reads the transactions into memory if they aren't there already
+        """
+        with self._index_lock:
+            if self._transactions is None:
+                # The first row of the transactions worksheet is its header
+                self._transactions = [
+                    (row + ["", "", "", ""])[:4]
+                    for row in
+                    self.transactions_worksheet.get_all_values()[1:]]
+
+    def _write(self, remote_call, *args, **kwargs):
+        """
+        Sends a write to the sheet, dropping the cache if it fails
+        """
+        try:
+            return remote_call(*args, **kwargs)
+        except Exception:
+            self.refresh()
+            raise
+
+    def refresh(self):
+        self._categories = None
+        self._versions = {}
+        with self._index_lock:
+            self._transactions = None
+            self._transaction_index = None
+        self._ledger_totals = None
+        self._transaction_count = None
+        self._transaction_rows = {}
+        self._batch_depth = 0
+        self._batch_start = None
+        self._pending_events = []
+        self._expected_versions = {}
+        self._total = None
+        self._batch_start_total = None
+
+    def start_batch(self):
+        self._load()
+        if self._batch_depth == 0:
+            self._batch_start = [list(row) for row in self._categories]
+            self._batch_start_total = self._total
+        self._batch_depth += 1
+
+    def commit_batch(self):
+        if self._batch_depth == 0:
+            return
+        self._batch_depth -= 1
+        if self._batch_depth > 0:
+            return
+        events = self._pending_events
+        expected_versions = self._expected_versions
+        categories = self._batch_start
+        total = self._batch_start_total
+        self._pending_events = []
+        self._expected_versions = {}
+        self._batch_start = None
+        self._batch_start_total = None
+        if events:
+            self._write(
+                self._commit, events, expected_versions, categories, total)
+
+    def _commit(self, events, expected_versions, categories, total):
+        """
+        Appends a batch's events to the journal, after applying the
+        ones other sessions have added since, or raises ConflictError
+        if they can't be made on top of those
+        """
+        # Start again from the budget as it was before the batch
+        self._categories = categories
+        self._total = total
+        self._catch_up()
+        rows = journal_rows(
+            events, expected_versions,
+            datetime.now().strftime("%d-%m-%y %H:%M:%S"))
+        stopped = apply_batch(
+            self._categories, self._versions, self._journal_rows + 1,
+            rows)[3]
+        if stopped is not None:
+            raise self._conflict(stopped)
+
+        response = self.journal_worksheet.append_rows(
+            [[sheet_value(x) for x in row] for row in rows])
+        first_row = int(re.search(
+            r"![A-Z]+(\d+)", response["updates"]["updatedRange"]).group(1))
+        if first_row == self._journal_rows + 1:
+            self._apply(first_row, rows)
+            self._journal_rows += len(rows)
+        else:
+            # Another session appended first. Reading it all back in
+            # order applies this batch only if it can still be made on
+            # top of theirs, as it will be for every other session.
+            stopped = self._catch_up().get(first_row)
+            if stopped is not None:
+                raise self._conflict(stopped)
+        if self._journal_rows - (self._snapshot_rows or 1) >= SNAPSHOT_EVERY:
+            self._write_snapshot()
+
+    def _conflict(self, event):
+        """
+        Returns the ConflictError for an event that can't be made on top
+        of another session's changes
+        """
+        kind, name = event[:2]
+        if kind == "add":
+            return ConflictError(
+                f"A {name} category has been added in another session",
+                self)
+        if name in self._versions:
+            return ConflictError(
+                f"{name} has been changed in another session", self)
+        return ConflictError(
+            f"{name} has been deleted in another session", self)
+
+    def _write_snapshot(self):
+        """
+        Writes the categories to '_main' as a snapshot of the journal so
+        far. A snapshot another session wrote at the same time is just
+        as good, so there is nothing to check.
+        """
+        rows = [
+            [name, sheet_value(to_money(amount)),
+             self._versions.get(name, 0), ""]
+            for name, amount in self._categories]
+        height = max(len(rows), self._snapshot_height, 2)
+        rows.extend(["", "", "", ""] for _ in range(height - len(rows)))
+        rows[0][3] = self._journal_rows
+        rows[1][3] = len(self._categories)
+        if self._snapshot_grid is None:
+            self._snapshot_grid = self.category_worksheet.row_count
+        if height > self._snapshot_grid:
+            # Writing below the grid is an error, so it is made taller
+            self.category_worksheet.add_rows(height - self._snapshot_grid)
+            self._snapshot_grid = height
+        self.category_worksheet.update(f"A1:D{height}", rows)
+        self._snapshot_rows = self._journal_rows
+        self._snapshot_height = height
+
+    def discard_batch(self):
+        if self._batch_depth == 0:
+            return
+        if self._batch_start is not None:
+            self._categories = self._batch_start
+            self._total = self._batch_start_total
+        self._batch_depth = 0
+        self._batch_start = None
+        self._batch_start_total = None
+        self._pending_events = []
+        self._expected_versions = {}
+
+    def snapshot(self):
+        total = self.total_budgeted()
+        return BudgetSnapshot(self._categories, total)
+
+    def total_budgeted(self):
+        self._load()
+        if self._total is None:
+            self._total = BudgetSnapshot(self._categories).total
+        return self._total
+
+    def category_names(self):
+        self._load()
+        return [row[0] for row in self._categories]
+
+    def category_amounts(self):
+        self._load()
+        return [row[1] for row in self._categories]
+
+    def category_count(self):
+        self._load()
+        return len(self._categories)
+
+    def get_category(self, category_num):
+        self._load()
+        return list(self._categories[category_num - 1])
+
+    def set_category_amount(self, category_num, amount):
+        with self.batch_changes():
+            name = category_name(self._categories, category_num, self)
+            old_amount = self._categories[category_num - 1][1]
+            self._expect_version(name)
+            self._queue_event(
+                ["set", name, to_money(amount)],
+                to_money(amount) - to_money(old_amount))
+
+    def change_category_amount(self, category_num, change):
+        with self.batch_changes():
+            name = category_name(self._categories, category_num, self)
+            self._queue_event(
+                ["change", name, to_money(change)], to_money(change))
+
+    def add_categories(self, categories):
+        with self.batch_changes():
+            check_new_names(
+                self._categories,
+                [cell_text(name) for name, _ in categories], self)
+            for name, amount in categories:
+                self._queue_event(
+                    ["add", cell_text(name), to_money(amount)],
+                    to_money(amount))
+
+    def delete_category(self, category_num):
+        with self.batch_changes():
+            name = category_name(self._categories, category_num, self)
+            amount = self._categories[category_num - 1][1]
+            self._expect_version(name)
+            self._queue_event(["delete", name, ""], -to_money(amount))
+
+    def _expect_version(self, name):
+        """
+        Notes the version of a category that must not have changed when
+        the batch is committed. A category added in this batch has none.
+        """
+        if name in self._versions:
+            self._expected_versions.setdefault(name, self._versions[name])
+
+    def _queue_event(self, event, total_change):
+        """
+        Applies an event to the cache and holds it back for the commit
+        """
+        apply_event(self._categories, {}, 0, event)
+        self._pending_events.append(event)
+        self._adjust_total(total_change)
+
+    def get_transactions(self):
+        self._load_transactions()
+        return [list(row) for row in self._transactions]
+
+    def transaction_count(self):
+        if self._transactions is not None:
+            return len(self._transactions)
+        if self._transaction_count is None:
+            # The grid's size comes with the worksheet, so only its last
+            # rows are read, and only the first time
+            first_row = max(
+                self.transactions_worksheet.row_count - TAIL_ROWS + 1, 1)
+            self._set_tail(
+                first_row,
+                self.transactions_worksheet.get(f"A{first_row}:D"))
+        return self._transaction_count
+
+    def _set_tail(self, first_row, rows):
+        """
+        Counts the transactions from the rows read from first_row to the
+        last one with anything in it, keeping them for
+        recent_transactions. The range runs to the bottom of the sheet,
+        so rows appended since the grid's size was read are included.
+        If the rows read were all blank, the grid has blank rows at the
+        bottom, so column A is read to count them instead.
+        """
+        if not rows and first_row > 1:
+            self._transaction_count = max(
+                len(self.transactions_worksheet.col_values(1)) - 1, 0)
+            return
+        # Row 1 is the header, so transaction n is on row n + 1
+        self._transaction_count = max(first_row + len(rows) - 2, 0)
+        for row_num, row in enumerate(rows, first_row):
+            if row_num > 1:
+                self._transaction_rows[row_num] = (
+                    list(row) + ["", "", "", ""])[:4]
+
+    def recent_transactions(self, count, skip=0):
+        if self._transactions is not None:
+            return super().recent_transactions(count, skip)
+        # Row 1 is the header, so transaction n is on row n + 1
+        last_row = self.transaction_count() + 1 - skip
+        first_row = max(last_row - count + 1, 2)
+        missing = [
+            row_num for row_num in range(first_row, last_row + 1)
+            if row_num not in self._transaction_rows]
+        if missing:
+            rows = self.transactions_worksheet.get(
+                f"A{missing[0]}:D{missing[-1]}")
+            for row_num in missing:
+                row = rows[row_num - missing[0]] \
+                    if row_num - missing[0] < len(rows) else []
+                self._transaction_rows[row_num] = (
+                    list(row) + ["", "", "", ""])[:4]
+        return [
+            list(self._transaction_rows[row_num])
+            for row_num in range(last_row, first_row - 1, -1)]
+
+    def transactions_between(self, first, last):
+        return [
+            list(self._transactions[position])
+            for position in self._index().dates.between(first, last)]
+
+    def search_transactions(self, **filters):
+        return [
+            list(self._transactions[position])
+            for position in self._index().search(**filters)]
+
+    def _index(self):
+        """
+        Returns the TransactionIndex of every transaction, reading them
+        and building it the first time, and adding any logged since.
+        _index_lock stops a search and the build started by
+        index_in_background() from both doing the work.
+        """
+        with self._index_lock:
+            self._load_transactions()
+            transactions = self._transactions
+            if self._transaction_index is None:
+                self._transaction_index = TransactionIndex(transactions)
+            index = self._transaction_index
+            for position in range(len(index.pence), len(transactions)):
+                index.add(position, transactions[position])
+            return index
+
+    def index_in_background(self):
+        return build_in_background(self._index)
+
+    def spending_report(self):
+        self._load_transactions()
+        if self._ledger_totals is None:
+            self._ledger_totals = LedgerTotals()
+        totals = self._ledger_totals
+        # Only the transactions logged since the last report are added
+        totals.extend(self._transactions[totals.count:])
+        return SpendingReport(totals)
+
+    def append_transaction(self, transaction):
+        self.append_transactions([transaction])
+
+    def append_transactions(self, transactions):
+        self._write(self.transactions_worksheet.append_rows, [
+            [sheet_value(x) for x in transaction]
+            for transaction in transactions])
+        rows = [[cell_text(x) for x in transaction]
+                for transaction in transactions]
+        # If they haven't been read yet, the next read will include these.
+        # The index catches up with them the next time it is used.
+        with self._index_lock:
+            if self._transactions is not None:
+                self._transactions.extend(rows)
+                return
+        if self._transaction_count is not None:
+            for row in rows:
+                self._transaction_count += 1
+                self._transaction_rows[self._transaction_count + 1] = row
+
+
+class Backend:
+    """
+    Where user accounts and their budgets are kept.
+    A user is a [first name, email, username, password] list.
+    """
+
+    def find_user(self, username_or_email):
+        """
+        Returns the user with this username or email, or None
+        """
+        raise NotImplementedError
+
+    def usernames(self):
+        """
+        Returns the username of every account
+        """
+        raise NotImplementedError
+
+    def email_exists(self, email):
+        """
+        Returns True if an account already uses this email
+        """
+        raise NotImplementedError
+
+    def username_exists(self, username):
+        """
+        Returns True if an account already uses this username
+        """
+        raise NotImplementedError
+
+    def add_user(self, user):
+        """
+        Saves a new user account
+        """
+        raise NotImplementedError
+
+    def delete_user(self, username):
+        """
+        Deletes a user account along with its budget
+        """
+        raise NotImplementedError
+
+    def accepts_new_users(self):
+        """
+        Returns False if there is no room for another account
+        """
+        return True
+
+    def create_budget(self, username):
+        """
+        Creates an empty budget for a user and returns its store
+        """
+        raise NotImplementedError
+
+    def open_budget(self, username):
+        """
+        Returns the store for a user's existing budget
+        """
+        raise NotImplementedError
+
+    def recurring_items(self, username=None):
+        """
+        Returns the recurring items of a user, or of every user if
+        username is None, in the order they were added. An item is a
+        list of text laid out as RECURRING_HEADER (see
+        budgetapp.recurring).
+        """
+        raise NotImplementedError
+
+    def add_recurring_item(self, item):
+        """
+        Saves a new recurring item
+        """
+        raise NotImplementedError
+
+    def update_recurring_items(self, changes):
+        """
+        Replaces each item in a list of [item, new item] pairs, all in
+        one write
+        """
+        raise NotImplementedError
+
+    def delete_recurring_item(self, item):
+        """
+        Deletes a recurring item
+        """
+        raise NotImplementedError
+
+    def warm_up(self):
+        """
+        Starts any slow connection work in the background
+        """
+
+    def wait_for_writes(self, timeout=None):
+        """
+        Waits until every write made so far has reached storage.
+        Returns False if some are still waiting after timeout seconds.
+        """
+        return True
+
+
+class SheetsBackend(Backend):
+    """
+    Accounts live in the 'users' worksheet of the spreadsheet, and each
+    user has their own '_main', '_transactions' and '_journal' worksheets.
+    Every user's recurring items share the 'recurring' worksheet, a row
+    each under a RECURRING_HEADER row.
+    connect is called to open the spreadsheet the first time it is used.
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._connect_lock = threading.Lock()
+        self._spreadsheet = None
+        self._users_sheet = None
+        self._users = None
+        self._recurring_sheet = None
+
+    @property
+    def spreadsheet(self):
+        """
+        The app's spreadsheet, opened on first use
+        """
+        with self._connect_lock:
+            if self._spreadsheet is None:
+                spreadsheet = self._connect()
+                self._users_sheet = spreadsheet.worksheet('users')
+                self._spreadsheet = spreadsheet
+        return self._spreadsheet
+
+    @property
+    def users_sheet(self):
+        """
+        The 'users' worksheet, opened on first use
+        """
+        self.spreadsheet
+        return self._users_sheet
+
+    def warm_up(self):
+        threading.Thread(target=self._warm_up, daemon=True).start()
+
+    def _warm_up(self):
+        """
+        Connects in the background. A failure here is left for the
+        next real use to report, where the user will see it.
+        """
+        try:
+            self.users.load()
+        except Exception:
+            pass
+
+    @property
+    def users(self):
+        """
+        The UserDirectory for the 'users' worksheet, made on first use
+        """
+        users_sheet = self.users_sheet
+        with self._connect_lock:
+            if self._users is None:
+                self._users = UserDirectory(users_sheet)
+        return self._users
+
+    def find_user(self, username_or_email):
+        return self.users.find(username_or_email)
+
+    def usernames(self):
+        return self.users.usernames()
+
+    def email_exists(self, email):
+        return self.users.email_exists(email)
+
+    def username_exists(self, username):
+        return self.users.username_exists(username)
+
+    def add_user(self, user):
+        self.users.add(user)
+
+    def accepts_new_users(self):
+        return len(self.usernames()) < MAX_SHEETS_USERS
+
+    def delete_user(self, username):
+        self.users.delete(username)
+        self.spreadsheet.del_worksheet(
+            self.spreadsheet.worksheet(username + "_main"))
+        self.spreadsheet.del_worksheet(
+            self.spreadsheet.worksheet(username + "_transactions"))
+        journal_worksheet = self.find_worksheet(username + "_journal")
+        if journal_worksheet is not None:
+            self.spreadsheet.del_worksheet(journal_worksheet)
+        for item in self.recurring_items(username):
+            self.delete_recurring_item(item)
+
+    def create_budget(self, username):
+        # '_main' has two rows for the snapshot's D1 and D2, even when
+        # there are no categories
+        category_worksheet = self.spreadsheet.add_worksheet(
+            username + "_main", 2, 4)
+        transactions_worksheet = self.spreadsheet.add_worksheet(
+            username + "_transactions", 1, 4)
+        transactions_worksheet.update('A1:D1', [TRANSACTION_HEADER])
+        store = SheetsBudgetStore(
+            category_worksheet, transactions_worksheet,
+            self.add_journal(username), [], (1, [TRANSACTION_HEADER]))
+        store.username = username
+        return store
+
+    def open_budget(self, username):
+        store = SheetsBudgetStore(
+            self.spreadsheet.worksheet(username + "_main"),
+            self.spreadsheet.worksheet(username + "_transactions"),
+            self.open_journal(username))
+        store.username = username
+        return store
+
+    def find_worksheet(self, title):
+        """
+        Returns the worksheet with this title, or None if there isn't one
+        """
+        from gspread.exceptions import WorksheetNotFound
+
+        try:
+            return self.spreadsheet.worksheet(title)
+        except WorksheetNotFound:
+            return None
+
+    def recurring_sheet(self, create=False):
+        """
+        The 'recurring' worksheet, or None if no one has added a
+        recurring item yet. create adds it if it isn't there.
+        """
+        if self._recurring_sheet is None:
+            self._recurring_sheet = self.find_worksheet('recurring')
+            if self._recurring_sheet is None and create:
+                recurring_sheet = self.spreadsheet.add_worksheet(
+                    'recurring', 1, len(RECURRING_HEADER))
+                recurring_sheet.update('A1:H1', [RECURRING_HEADER])
+                self._recurring_sheet = recurring_sheet
+        return self._recurring_sheet
+
+    def _recurring_rows(self):
+        """
+        Returns every row of the 'recurring' worksheet after the header,
+        padded to a full item, as blank cells aren't returned
+        """
+        recurring_sheet = self.recurring_sheet()
+        if recurring_sheet is None:
+            return []
+        width = len(RECURRING_HEADER)
+        return [
+            (row + [""] * width)[:width]
+            for row in recurring_sheet.get_all_values()[1:]]
+
+    def recurring_items(self, username=None):
+        return [
+            row for row in self._recurring_rows()
+            if username is None or row[0] == username]
+
+    def add_recurring_item(self, item):
+        self.recurring_sheet(create=True).append_row(item)
+
+    def update_recurring_items(self, changes):
+        rows = self._recurring_rows()
+        data = []
+        for item, new_item in changes:
+            row_num = rows.index(item) + 2
+            rows[row_num - 2] = new_item
+            data.append({"range": f"A{row_num}:H{row_num}",
+                         "values": [new_item]})
+        if data:
+            self.recurring_sheet().batch_update(data)
+
+    def delete_recurring_item(self, item):
+        self.recurring_sheet().delete_rows(
+            self._recurring_rows().index(item) + 2)
+
+    def open_journal(self, username):
+        """
+        Opens a user's '_journal' worksheet. Budgets made before there
+        was a journal are given one, and their '_main' worksheet, which
+        only had two columns, is given the two the snapshot needs.
+        Journals made before rows recorded the version they expect are
+        given the columns for it, and their rows are applied as before.
+        """
+        journal_worksheet = self.find_worksheet(username + "_journal")
+        if journal_worksheet is None:
+            # Widened first, as doing it twice does no harm
+            self.spreadsheet.worksheet(username + "_main").add_cols(2)
+            return self.add_journal(username)
+        missing_cols = len(JOURNAL_HEADER) - journal_worksheet.col_count
+        if missing_cols > 0:
+            journal_worksheet.add_cols(missing_cols)
+            journal_worksheet.update('E1:F1', [JOURNAL_HEADER[4:]])
+        return journal_worksheet
+
+    def add_journal(self, username):
+        """
+        Adds an empty '_journal' worksheet for a user
+        """
+        journal_worksheet = self.spreadsheet.add_worksheet(
+            username + "_journal", 1, len(JOURNAL_HEADER))
+        journal_worksheet.update('A1:F1', [JOURNAL_HEADER])
+        return journal_worksheet
+
+
+class UserDirectory:
+    """
+    The 'users' worksheet held in memory, with dictionaries from email
+    and from username to the worksheet row. The worksheet is read once,
+    and again when a lookup misses, in case another terminal has added
+    the user since, if it was last read USERS_REFRESH_SECONDS or more
+    ago (_loaded_at). Adds and deletes keep the dictionaries in step.
+    """
+
+    def __init__(self, users_sheet):
+        self.users_sheet = users_sheet
+        self.lock = threading.Lock()
+        self._rows = None
+        self._loaded_at = None
+        self._by_email = {}
+        self._by_username = {}
+
+    def load(self):
+        """
+        Reads the worksheet into memory if it isn't there already
+        """
+        with self.lock:
+            if self._rows is None:
+                self._load()
+
+    def _load(self):
+        """
+        Reads the worksheet and rebuilds the indexes
+        """
+        self._rows = [
+            (row + ["", "", "", ""])[:4]
+            for row in self.users_sheet.get_all_values()]
+        self._loaded_at = time.monotonic()
+        self._index()
+
+    def _index(self):
+        """
+        Rebuilds the email and username indexes from the rows in memory
+        """
+        self._by_email = {}
+        self._by_username = {}
+        for row_num, user in enumerate(self._rows, 1):
+            self._by_email.setdefault(user[1], row_num)
+            self._by_username.setdefault(user[2], row_num)
+
+    def _lookup(self, index_names, key):
+        """
+        Returns the row of key in the first of index_names that has it,
+        reading the worksheet again if none of them do and it hasn't
+        been read in the last USERS_REFRESH_SECONDS
+        """
+        for attempt in range(2):
+            if self._rows is None:
+                self._load()
+            elif attempt:
+                if time.monotonic() - self._loaded_at \
+                        < USERS_REFRESH_SECONDS:
+                    break
+                self._load()
+            for index_name in index_names:
+                row_num = getattr(self, index_name).get(key)
+                if row_num is not None:
+                    return row_num
+        return None
+
+    def usernames(self):
+        """
+        Returns every username, reading the worksheet again so users
+        other terminals have added are included
+        """
+        with self.lock:
+            self._load()
+            return [user[2] for user in self._rows if user[2]]
+
+    def find(self, username_or_email):
+        """
+        Returns the [first name, email, username, password] of the
+        user with this username or email, or None
+        """
+        with self.lock:
+            row_num = self._lookup(
+                ("_by_username", "_by_email"), username_or_email)
+            return list(self._rows[row_num - 1]) if row_num else None
+
+    def email_exists(self, email):
+        """
+        Returns True if a user has this email
+        """
+        with self.lock:
+            return self._lookup(("_by_email",), email) is not None
+
+    def username_exists(self, username):
+        """
+        Returns True if a user has this username
+        """
+        with self.lock:
+            return self._lookup(("_by_username",), username) is not None
+
+    def add(self, user):
+        """
+        Appends a user to the worksheet and the indexes
+        """
+        with self.lock:
+            if self._rows is None:
+                self._load()
+            self.users_sheet.append_row(user)
+            self._rows.append([str(x) for x in user])
+            row_num = len(self._rows)
+            self._by_email.setdefault(self._rows[-1][1], row_num)
+            self._by_username.setdefault(self._rows[-1][2], row_num)
+
+    def delete(self, username):
+        """
+        Deletes a user's row. The row is read back first and, if
+        another terminal has moved it, the worksheet is read again.
+        """
+        with self.lock:
+            row_num = self._lookup(("_by_username",), username)
+            if row_num is None:
+                raise KeyError(username)
+            row = self.users_sheet.row_values(row_num)
+            if row[2:3] != [username]:
+                self._load()
+                row_num = self._by_username[username]
+            self.users_sheet.delete_row(row_num)
+            del self._rows[row_num - 1]
+            self._index()
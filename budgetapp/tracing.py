@@ -0,0 +1,243 @@
+"""
+Traces where a session's time goes.
+
+When tracing is on, every call made to Google Sheets and every screen
+the user visits is timed. Each one is written as a line of JSON to the
+trace file, and the totals for each screen (visits, remote calls,
+a histogram of call latency and the bytes sent and received) can be
+printed with summary_lines(). Tracing is turned on by setting
+BUDGETAPP_TRACE to the trace file's path, or with the --trace option.
+
+Every terminal is its own process, so the lines in a shared trace file
+carry the process id to tell sessions apart.
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+# Upper bounds, in milliseconds, of the latency histogram's buckets
+LATENCY_BUCKETS = [10, 50, 100, 250, 500, 1000, 2500]
+
+# Calls that return a worksheet, which is traced in turn
+WORKSHEET_METHODS = ("worksheet", "add_worksheet")
+
+_tracer = None
+
+
+def start(path):
+    """
+    Turns tracing on, appending to the trace file at path
+    """
+    global _tracer
+    _tracer = Tracer(path)
+
+
+def active():
+    """
+    Returns True if tracing is on
+    """
+    return _tracer is not None
+
+
+def screen(name):
+    """
+    Context manager that times one visit to a screen
+    """
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.screen(name)
+
+
+def trace_spreadsheet(spreadsheet):
+    """
+    Returns the spreadsheet with its calls traced, if tracing is on
+    """
+    if _tracer is None:
+        return spreadsheet
+    return TracedSheet(spreadsheet, _tracer)
+
+
+def summary_lines():
+    """
+    Returns the lines of the per-screen summary, or [] if tracing is off
+    """
+    if _tracer is None:
+        return []
+    return _tracer.summary_lines()
+
+
+def payload_size(value):
+    """
+    Roughly how many bytes a value takes up as JSON
+    """
+    return len(json.dumps(value, default=str))
+
+
+def latency_bucket(milliseconds):
+    """
+    Returns the label of the histogram bucket a latency falls into
+    """
+    for bound in LATENCY_BUCKETS:
+        if milliseconds <= bound:
+            return f"<={bound}ms"
+    return f">{LATENCY_BUCKETS[-1]}ms"
+
+
+class ScreenStats:
+    """
+    The running totals for one screen
+    """
+
+    def __init__(self):
+        self.visits = 0
+        self.seconds = 0
+        self.remote_seconds = 0
+        self.bytes = 0
+        self.calls = Counter()
+        self.latency = Counter()
+
+
+class Tracer:
+    """
+    Collects the timings of one process and writes them to the trace file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        # Each session thread is on its own screen
+        self.local = threading.local()
+        self.stats = {}
+
+    @property
+    def current_screen(self):
+        return getattr(self.local, "screen", None)
+
+    @current_screen.setter
+    def current_screen(self, name):
+        self.local.screen = name
+
+    def _stats(self, screen_name):
+        if screen_name not in self.stats:
+            self.stats[screen_name] = ScreenStats()
+        return self.stats[screen_name]
+
+    def write(self, record):
+        """
+        Appends one record to the trace file
+        """
+        record = dict(record, pid=self.pid, time=round(time.time(), 3))
+        with self.lock, open(self.path, "a", encoding="utf-8") as trace:
+            trace.write(json.dumps(record) + "\n")
+
+    @contextmanager
+    def screen(self, name):
+        """
+        Times a visit to a screen. Calls made during it are counted
+        against the screen.
+        """
+        previous_screen = self.current_screen
+        self.current_screen = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.current_screen = previous_screen
+            with self.lock:
+                stats = self._stats(name)
+                stats.visits += 1
+                stats.seconds += seconds
+            self.write({
+                "type": "screen", "screen": name,
+                "ms": round(seconds * 1000, 1)})
+
+    def call(self, target, method, function, args, kwargs):
+        """
+        Makes a remote call, recording how long it took and its size
+        """
+        screen_name = self.current_screen or "(no screen)"
+        error = None
+        result = None
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+            return result
+        except Exception as exception:
+            error = type(exception).__name__
+            raise
+        finally:
+            milliseconds = (time.perf_counter() - start) * 1000
+            size = payload_size([args, kwargs]) + payload_size(result)
+            with self.lock:
+                stats = self._stats(screen_name)
+                stats.calls[method] += 1
+                stats.remote_seconds += milliseconds / 1000
+                stats.bytes += size
+                stats.latency[latency_bucket(milliseconds)] += 1
+            self.write({
+                "type": "call", "screen": screen_name, "method": method,
+                "sheet": getattr(target, "title", None),
+                "ms": round(milliseconds, 1), "bytes": size,
+                "error": error})
+
+    def summary_lines(self):
+        """
+        Returns the totals for each screen, busiest first
+        """
+        lines = []
+        with self.lock:
+            ranked = sorted(
+                self.stats.items(),
+                key=lambda item: item[1].remote_seconds, reverse=True)
+            for screen_name, stats in ranked:
+                lines.append(
+                    f"{screen_name}: {stats.visits} visits, "
+                    f"{sum(stats.calls.values())} calls, "
+                    f"{stats.remote_seconds * 1000:.0f}ms remote, "
+                    f"{stats.bytes} bytes")
+                if stats.calls:
+                    lines.append("    " + ", ".join(
+                        f"{method} x{count}"
+                        for method, count in stats.calls.most_common()))
+                    lines.append("    " + ", ".join(
+                        f"{bucket}: {stats.latency[bucket]}"
+                        for bucket in [latency_bucket(bound) for bound in
+                                       LATENCY_BUCKETS + [float("inf")]]
+                        if stats.latency[bucket]))
+        return lines
+
+
+class TracedSheet:
+    """
+    Wraps a gspread Spreadsheet or Worksheet so that each method call
+    goes through the tracer. Worksheets it returns are wrapped too.
+    """
+
+    def __init__(self, target, tracer):
+        self._target = target
+        self._tracer = tracer
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        def traced(*args, **kwargs):
+            args = [
+                arg._target if isinstance(arg, TracedSheet) else arg
+                for arg in args]
+            result = self._tracer.call(
+                self._target, name, attribute, args, kwargs)
+            if name in WORKSHEET_METHODS:
+                return TracedSheet(result, self._tracer)
+            return result
+        return traced
+
+
+if os.environ.get("BUDGETAPP_TRACE"):
+    start(os.environ["BUDGETAPP_TRACE"])
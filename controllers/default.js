@@ -1,8 +1,19 @@
 const Pty = require('node-pty');
 const fs = require('fs');
+const net = require('net');
+const { spawn } = require('child_process');
+
+// With BUDGETAPP_SESSIONS=shared every terminal is served by one
+// long-lived `python3 run.py serve` instead of a process of its own
+const SHARED_SESSIONS = process.env.BUDGETAPP_SESSIONS === 'shared';
+const SESSION_PORT = parseInt(process.env.BUDGETAPP_SESSION_PORT || '8765');
 
 exports.install = function () {
 
+    if (SHARED_SESSIONS) {
+        startSessionServer();
+    }
+
     ROUTE('/');
     WEBSOCKET('/', socket, ['raw']);
 
@@ -15,6 +26,11 @@ function socket() {
 
     this.on('open', function (client) {
 
+        if (SHARED_SESSIONS) {
+            connectToSessionServer(client, 0);
+            return;
+        }
+
         // Spawn terminal
         client.tty = Pty.spawn('python3', ['run.py'], {
             name: 'xterm-color',
@@ -37,6 +53,10 @@ function socket() {
     });
 
     this.on('close', function (client) {
+        if (client.session) {
+            client.session.destroy();
+            client.session = null;
+        }
         if (client.tty) {
             client.tty.kill(9);
             client.tty = null;
@@ -46,6 +66,52 @@ function socket() {
 
     this.on('message', function (client, msg) {
         client.tty && client.tty.write(msg);
+        client.session && client.session.write(msg);
+    });
+}
+
+function startSessionServer() {
+
+    const server = spawn('python3', ['run.py', 'serve', '--port', String(SESSION_PORT)], {
+        cwd: process.env.PWD,
+        env: process.env,
+        stdio: 'inherit'
+    });
+
+    server.on('exit', function (code) {
+        console.log("Session server exited with code " + code + ", restarting");
+        setTimeout(startSessionServer, 1000);
+    });
+}
+
+function connectToSessionServer(client, attempt) {
+
+    const session = net.connect(SESSION_PORT, '127.0.0.1');
+    session.setEncoding('utf8');
+
+    session.on('connect', function () {
+        client.session = session;
+    });
+
+    session.on('data', function (data) {
+        client.send(data);
+    });
+
+    session.on('error', function () {
+        // The server may still be starting, so try again for a few seconds
+        if (!client.session && attempt < 20) {
+            setTimeout(function () {
+                connectToSessionServer(client, attempt + 1);
+            }, 250);
+        }
+    });
+
+    session.on('close', function () {
+        if (client.session === session) {
+            client.session = null;
+            client.close();
+            console.log("Session ended");
+        }
     });
 }
 
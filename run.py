@@ -1,42 +1,136 @@
-import os
-import time
 import sys
 import re
+import argparse
 from datetime import datetime, date
-import gspread
-from google.oauth2.service_account import Credentials
 from colorama import init
 from colorama import Fore, Style
+from budgetapp.storage import BudgetStore, ConflictError, open_backend
+from budgetapp.money import PENNY, to_money
+from budgetapp import importer
+from budgetapp import reports
+from budgetapp import recurring
+from budgetapp import jobs
+from budgetapp.dates import parse_date
+from budgetapp import sessions
+from budgetapp import pacing
+from budgetapp import ratelimit
+from budgetapp import tracing
+from budgetapp.pacing import pause
 init()
 init(autoreset=True)
 
-SCOPE = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive.file",
-    "https://www.googleapis.com/auth/drive"
-    ]
+# Google Sheets or SQLite, depending on BUDGETAPP_STORAGE.
+# Nothing is connected until the first time it is used.
+backend = open_backend()
 
-CREDS = Credentials.from_service_account_file('creds.json')
-SCOPED_CREDS = CREDS.with_scopes(SCOPE)
-GSPREAD_CLIENT = gspread.authorize(SCOPED_CREDS)
-SHEET = GSPREAD_CLIENT.open('commandline-budgetapp')
+# Seconds to wait, before exiting, for writes made offline to be sent
+SAVE_TIMEOUT = 30
 
-users_sheet = SHEET.worksheet('users')
+# How many search results are shown at a time
+SEARCH_PAGE_SIZE = 20
+
+# How often a command line job run into a log reports its progress
+PROGRESS_EVERY = 100
+
+
+# Running the app
+
+def run_app(first_screen=None):
+    """
+    Shows the app's screens one after another until the user quits.
+    Each screen function returns the next screen as a tuple of the
+    function and its arguments, e.g. (home_prompt, store), or None
+    to quit. Screens never call each other, so however long a session
+    runs the call stack stays the same size. If another session's
+    changes stop a screen saving its own, or Google Sheets answers with
+    an error or can't be reached, the user is told and taken back to
+    the dashboard.
+    """
+    next_screen = first_screen or (startup_prompt,)
+    while next_screen is not None:
+        screen, *args = next_screen
+        with tracing.screen(screen.__name__):
+            try:
+                next_screen = screen(*args)
+            except ConflictError as error:
+                next_screen = (show_conflict, error)
+            except Exception as error:
+                if not is_sheets_error(error):
+                    raise
+                store = next(
+                    (arg for arg in args if isinstance(arg, BudgetStore)),
+                    None)
+                next_screen = (show_sheets_error, error, store)
+
+
+def is_sheets_error(error):
+    """
+    Returns True if error is Google Sheets answering with an error,
+    through gspread or the async client. They are only imported once
+    there is an error to check.
+    """
+    from gspread.exceptions import APIError
+    from budgetapp.async_sheets import SheetsAPIError
+
+    return isinstance(error, (APIError, SheetsAPIError))
+
+
+def show_conflict(error):
+    """
+    Tells the user their changes weren't saved because the budget
+    was changed in another session, then goes back to the dashboard
+    """
+    clear_terminal()
+    print(f"{Fore.RESET}----------------------------------\n")
+    print(f"{Fore.RED}Your changes couldn't be saved.{Fore.RESET}\n")
+    print(f"{error}, so nothing was changed. Here is how your")
+    print("budget stands now.")
+    print_section_border()
+    pause(3.5)
+    clear_terminal()
+    return (home_prompt, error.store)
+
+
+def show_sheets_error(error, store):
+    """
+    Tells the user Google Sheets answered with an error, or didn't
+    answer, then goes back to the dashboard with the budget read again,
+    or to the start page if no budget was open
+    """
+    clear_terminal()
+    print(f"{Fore.RESET}----------------------------------\n")
+    print(f"{Fore.RED}Google Sheets couldn't be reached.{Fore.RESET}\n")
+    status = ratelimit.status_code(error)
+    if status is None:
+        print("It didn't answer, so your last change may not have been")
+        print("saved.")
+    else:
+        print(f"It answered with an error ({status}), so")
+        print("your last change may not have been saved.")
+    print_section_border()
+    pause(3.5)
+    clear_terminal()
+    if store is None:
+        return (startup_prompt,)
+    store.refresh()
+    return (home_prompt, store)
 
 
 # Functions for the startup prompt
 
 def startup_view():
     """
-    Plays the startup welcome effect
+    Plays the startup welcome effect.
+    The storage connection is made in the background meanwhile.
     """
+    backend.warm_up()
     clear_terminal()
     txt_effect("----------------------------------\n")
     print(" ")
     txt_effect("Welcome to Commandline BudgetApp\n")
     print(" ")
     txt_effect("----------------------------------\n")
-    time.sleep(1.7)
+    pause(1.7)
 
 
 def startup_prompt():
@@ -60,25 +154,25 @@ What would you like to do?
             break
     if keep_or_start == '1':
         clear_terminal()
-        log_in()
+        return (log_in,)
     elif keep_or_start == '2':
         clear_terminal()
-        get_username = create_account()
-        set_up_new_budget(get_username)
+        return (create_account,)
     elif keep_or_start == '3':
-        delete_account()
+        return (delete_account,)
     else:
         clear_terminal()
         print(f"{Fore.RESET}----------------------------------\n")
         print(f"{Style.BRIGHT}Quitting app...")
         print(" ")
         print("----------------------------------")
-        time.sleep(2)
+        pause(2)
         clear_terminal()
         print(f"{Fore.RESET}----------------------------------\n")
         print(f"{Style.BRIGHT}Thanks for using Commandline BudgetApp")
         print(" ")
         print("----------------------------------")
+        return None
 
 
 def log_in():
@@ -89,13 +183,10 @@ def log_in():
     print(f"{Style.BRIGHT}Log In")
     print_section_border()
 
-    emails_list = users_sheet.col_values(2)
-    usernames_list = users_sheet.col_values(3)
-    usernames_email_list = emails_list + usernames_list
-
     while True:
         username = input(f"{Fore.YELLOW}Enter your username or email:\n")
-        if username not in usernames_email_list:
+        user = backend.find_user(username)
+        if user is None:
             print(" ")
             print("Sorry, that username doesn't exist.")
             print("""
@@ -110,7 +201,7 @@ Would you like to create an account?
                     break
             if username_fail == '1':
                 clear_terminal()
-                create_account()
+                return (create_account,)
             else:
                 clear_terminal()
                 print(f"{Fore.RESET}----------------------------------\n")
@@ -119,15 +210,14 @@ Would you like to create an account?
         else:
             break
 
-    username_row = users_sheet.find(username).row
-    user_first_name = users_sheet.row_values(username_row)[0]
+    user_first_name = user[0]
 
     while_count = 0
     while True:
         print(" ")
         password = input(f"{Fore.YELLOW}Enter your password:\n")
 
-        if password == users_sheet.row_values(username_row)[3]:
+        if password == user[3]:
             break
         else:
             print(f"{Fore.RESET} ")
@@ -151,15 +241,14 @@ Would you like to create an account?
                         break
                 if password_fail == '1':
                     clear_terminal()
-                    create_account()
+                    return (create_account,)
                 else:
                     print(" ")
 
-    category_worksheet_name = username + "_"
-    transaction_name = username + "_"
-    category_worksheet = SHEET.worksheet(category_worksheet_name + 'main')
-    transactions_worksheet = SHEET.worksheet(transaction_name + 'transactions')
-    time.sleep(1)
+    store = backend.open_budget(user[2])
+    # Ready by the time they search, rather than built on the first one
+    store.index_in_background()
+    pause(1)
 
     clear_terminal()
     print(f"{Fore.RESET}----------------------------------\n")
@@ -167,24 +256,29 @@ Would you like to create an account?
         f"{Style.BRIGHT}Welcome Back, {user_first_name}. Retrieving your "
         "Budget...")
     print_section_border()
-    time.sleep(2)
+    pause(2)
     clear_terminal()
 
-    home_prompt(category_worksheet, transactions_worksheet)
+    return (home_prompt, store)
 
 
 def create_account():
     """
     Allows user to create their own budgeting account
     """
+    if not backend.accepts_new_users():
+        print(f"{Fore.RESET}")
+        print("Sorry, there's no room for any more accounts")
+        print(" ")
+        pause(2)
+        clear_terminal()
+        return (startup_prompt,)
     print(f"{Fore.RESET}----------------------------------\n")
     print(f"{Style.BRIGHT}Let's get your account set up")
     print_section_border()
 
     first_name = input(f"{Fore.YELLOW}What is your first name?\n").capitalize()
     print(" ")
-    emails_list = users_sheet.col_values(2)
-    usernames_list = users_sheet.col_values(3)
 
     while True:
         email = input(f"{Fore.YELLOW}Enter your email address:\n")
@@ -192,7 +286,7 @@ def create_account():
         # See the README for links and more details
         regex_email = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
         if re.fullmatch(regex_email, email):
-            if email in emails_list:
+            if backend.email_exists(email):
                 print(" ")
                 print("That email already exists")
                 print("""
@@ -206,7 +300,7 @@ Would you like to log in?
                     print(" ")
                     if email_fail in ["1"]:
                         clear_terminal()
-                        log_in()
+                        return (log_in,)
                     elif email_fail in ["2"]:
                         break
                     else:
@@ -226,7 +320,7 @@ Would you like to log in?
             print(f"{Fore.RESET}")
             print("Your username had a space in it. Try again without spaces.")
         else:
-            if new_username in usernames_list:
+            if backend.username_exists(new_username):
                 print(" ")
                 print("That username already exists")
                 print("""
@@ -240,7 +334,7 @@ Would you like to log in?
                     print(" ")
                     if email_fail in ["1"]:
                         clear_terminal()
-                        log_in()
+                        return (log_in,)
                     elif email_fail in ["2"]:
                         break
                     else:
@@ -261,15 +355,15 @@ Would you like to log in?
             print(f"{Fore.RESET}")
             print("Your passwords do not match. Try again.")
     new_user_info = [first_name, email, new_username, password_entry_2]
-    users_sheet.append_row(new_user_info)
+    backend.add_user(new_user_info)
 
     clear_terminal()
     print(f"{Fore.RESET}----------------------------------\n")
     print(f"{Style.BRIGHT}Setting up your account...")
     print_section_border()
-    time.sleep(2)
+    pause(2)
 
-    return new_username
+    return (set_up_new_budget, new_username)
 
 
 def delete_account():
@@ -283,55 +377,42 @@ def delete_account():
         "account will be deleted.")
     print_section_border()
 
-    emails_list = users_sheet.col_values(2)
-    usernames_list = users_sheet.col_values(3)
-    usernames_email_list = emails_list + usernames_list
-
     while True:
         username = input(f"{Fore.YELLOW}Enter your username or email:\n")
-        if username not in usernames_email_list:
+        user = backend.find_user(username)
+        if user is None:
             print(f"{Fore.RESET}")
             print("Sorry, there's no account with that username or email")
             print(" ")
-            time.sleep(2)
+            pause(2)
             clear_terminal()
             print(f"{Fore.RESET}----------------------------------\n")
             print(
                 f"{Style.BRIGHT}Redirecting you back to the start page...")
             print_section_border()
-            time.sleep(2)
-            startup_prompt()
+            pause(2)
+            return (startup_prompt,)
         else:
             break
 
-    username_row = users_sheet.find(username).row
-
     while True:
         print(" ")
         password = input(f"{Fore.YELLOW}Enter your password:\n")
 
-        if password == users_sheet.row_values(username_row)[3]:
+        if password == user[3]:
             break
         else:
             print(f"{Fore.RESET} ")
             print("Sorry, that password is incorrect")
 
-    username_text = users_sheet.row_values(username_row)[2]
-    category_worksheet_name = username_text + "_"
-    transaction_name = username_text + "_"
-    category_worksheet = SHEET.worksheet(category_worksheet_name + 'main')
-    transactions_worksheet = SHEET.worksheet(transaction_name + 'transactions')
-
-    users_sheet.delete_row(username_row)
-    SHEET.del_worksheet(category_worksheet)
-    SHEET.del_worksheet(transactions_worksheet)
+    backend.delete_user(user[2])
 
     clear_terminal()
     print(f"{Fore.RESET}----------------------------------\n")
     print(f"{Style.BRIGHT}Your account has been deleted...")
     print_section_border()
-    time.sleep(2)
-    startup_prompt()
+    pause(2)
+    return (startup_prompt,)
 
 
 # Functions for building a new budget
@@ -373,33 +454,23 @@ def set_up_new_budget(username):
         preset_or_build = input(f"{Fore.YELLOW}Type 1 or 2\n")
         if validate_y_n_entry(preset_or_build):
             break
-    SHEET.add_worksheet(username + "_main", 1, 2)
-    SHEET.add_worksheet(username + "_transactions", 1, 4)
-    category_worksheet_name = username + "_"
-    transaction_name = username + "_"
-    category_worksheet = SHEET.worksheet(category_worksheet_name + 'main')
-    transactions_worksheet = SHEET.worksheet(transaction_name + 'transactions')
-    transactions_worksheet.update_acell('A1', 'amount')
-    transactions_worksheet.update_acell('B1', 'insitution')
-    transactions_worksheet.update_acell('C1', 'date')
-    transactions_worksheet.update_acell('D1', 'budget category')
+    store = backend.create_budget(username)
     if preset_or_build == '1':
         clear_terminal()
         print(f"{Fore.RESET}----------------------------------\n")
         print(f"{Style.BRIGHT}Setting up your budget...")
         print_section_border()
-        time.sleep(2)
+        pause(2)
         clear_terminal()
 
-        set_up_preset_budget(category_worksheet, transactions_worksheet)
-        add_money_to_new_budget(category_worksheet, transactions_worksheet)
+        set_up_preset_budget(store)
+        return (add_money_to_new_budget, store)
     else:
         clear_terminal()
-        build_new_budget(category_worksheet, transactions_worksheet)
-        add_money_to_new_budget(category_worksheet, transactions_worksheet)
+        return (build_new_budget, store)
 
 
-def set_up_preset_budget(category_worksheet, transactions_worksheet):
+def set_up_preset_budget(store):
     """
     Fills the budget spreadsheet with preset data
     """
@@ -408,10 +479,10 @@ def set_up_preset_budget(category_worksheet, transactions_worksheet):
         ["Insurance", 0], ["Debt", 0], ["Retirement", 0], ["Groceries", 0],
         ["Transportation", 0], ["Entertainment", 0], ["Travel", 0],
         ["Miscellaneous", 0], ["Spending Money", 0]]
-    category_worksheet.append_rows(preset_categories)
+    store.add_categories(preset_categories)
 
 
-def build_new_budget(category_worksheet, transactions_worksheet):
+def build_new_budget(store):
     """
     Allows the user to input their own categories into the cleared budget
     """
@@ -428,36 +499,35 @@ def build_new_budget(category_worksheet, transactions_worksheet):
         if categories_entered > 0:
             print("Your budget so far:")
             print(" ")
-            get_current_budget(category_worksheet)
+            snapshot = store.snapshot()
+            get_current_budget(snapshot)
             print(" ")
 
         print(
             f"You have entered {categories_entered} out of 5 required "
             "categories\n")
 
-        new_category_name = input(
-            f"{Fore.YELLOW}Type the name of a category "
-            "to add it\n")
+        new_category_name = input_category_name(
+            store, f"{Fore.YELLOW}Type the name of a category to add it\n")
 
         print(" ")
         print(
             f"Adding a {new_category_name} category to your category "
             "list...\n")
-        time.sleep(1)
+        pause(1)
         print(f"Setting {new_category_name}'s starting amount to £0...")
-        time.sleep(1)
-        new_category_list = [new_category_name, 0]
-        category_worksheet.append_row(new_category_list)
+        pause(1)
+        store.add_category(new_category_name)
         categories_entered += 1
         clear_terminal()
-    add_another_category_intro(categories_entered, category_worksheet)
+    return (add_another_category_intro, store)
 
 
-def add_another_category_intro(categories_entered, category_worksheet):
+def add_another_category_intro(store):
     """
     Allows user to add more than 5 categories during build new budget
     """
-    category_count = len(category_worksheet.col_values(1))
+    category_count = store.category_count()
     print(f"{Fore.RESET}----------------------------------\n")
     print(
         f"{Style.BRIGHT}Great! You have added {category_count} categories to "
@@ -479,31 +549,31 @@ def add_another_category_intro(categories_entered, category_worksheet):
 
         print("Your budget so far:")
         print(" ")
-        get_current_budget(category_worksheet)
+        snapshot = store.snapshot()
+        get_current_budget(snapshot)
         print(" ")
 
         print(f"You have entered {category_count} categories so far\n")
 
-        new_category_name = input(
-            f"{Fore.YELLOW}Type the name of a category "
-            "to add it\n")
+        new_category_name = input_category_name(
+            store, f"{Fore.YELLOW}Type the name of a category to add it\n")
 
         print(" ")
         print(
             f"Adding a {new_category_name} category to your category "
             "list...\n")
-        time.sleep(1)
+        pause(1)
         print(f"Setting {new_category_name}'s starting amount to £0...")
-        time.sleep(1)
-        new_category_list = [new_category_name, 0]
-        category_worksheet.append_row(new_category_list)
+        pause(1)
+        store.add_category(new_category_name)
         clear_terminal()
-        add_another_category_intro(category_count, category_worksheet)
+        return (add_another_category_intro, store)
     else:
         clear_terminal()
+        return (add_money_to_new_budget, store)
 
 
-def add_money_to_new_budget(category_worksheet, transactions_worksheet):
+def add_money_to_new_budget(store):
     """
     Prompts the user to input their bank balance and then delegate money
     """
@@ -512,7 +582,8 @@ def add_money_to_new_budget(category_worksheet, transactions_worksheet):
     print_section_border()
 
     print("Here is your current Budget\n")
-    get_current_budget(category_worksheet)
+    snapshot = store.snapshot()
+    get_current_budget(snapshot)
 
     print(" ")
     print(
@@ -524,82 +595,81 @@ def add_money_to_new_budget(category_worksheet, transactions_worksheet):
             f"{Fore.YELLOW}How much is currently in your bank account?\n")
         if validate_number_entry(bank_balance):
             break
-    left_to_delegate = float(bank_balance)
+    left_to_delegate = to_money(bank_balance)
     get_today = date.today()
     today = get_today.strftime("%d-%m-%y")
 
     initial_transaction = [
         left_to_delegate, "Initial Bank Balance", today, "Income"]
-    append_transaction_row(initial_transaction, transactions_worksheet)
 
     clear_terminal()
-    while left_to_delegate != 0:
-        print_section_border()
-        print(f"{Style.BRIGHT}Time to delegate the money from this balance")
-        print_section_border()
-        print(
-            f"{Fore.BLUE}{Style.BRIGHT}To make sure you don't have any "
-            "unbudgeted money, you must delegate all this balance.\n")
-        print("Here is how your current budget stands:")
-        print(" ")
-        get_current_budget(category_worksheet)
-        print(" ")
+    with store.batch_changes():
+        while left_to_delegate != 0:
+            print_section_border()
+            print(
+                f"{Style.BRIGHT}Time to delegate the money from this balance")
+            print_section_border()
+            print(
+                f"{Fore.BLUE}{Style.BRIGHT}To make sure you don't have any "
+                "unbudgeted money, you must delegate all this balance.\n")
+            print("Here is how your current budget stands:")
+            print(" ")
+            snapshot = store.snapshot()
+            get_current_budget(snapshot)
+            print(" ")
 
-        left_to_delegate = round(float(left_to_delegate), 2)
-        print(
-            f"You have {Fore.GREEN}£{left_to_delegate}{Fore.RESET} left to "
-            "delegate from your balance.\n")
-        while True:
-            selected_category = input(
-                f"{Fore.YELLOW}Type the number of the "
-                "category you wish to delegate money to:\n")
-            if validate_category_num_entry(selected_category,
-                                           category_worksheet):
-                break
-        print(" ")
-        category_name = category_worksheet.row_values(
-            int(selected_category))[0]
-        while True:
-            amount_to_delegate = input(
-                f"{Fore.YELLOW}How much would you like "
-                f"to put towards {category_name}?\n")
-            if validate_number_entry(amount_to_delegate):
-                if validate_delegation_max(amount_to_delegate,
-                                           left_to_delegate):
+            print(
+                f"You have {Fore.GREEN}£{left_to_delegate}{Fore.RESET} left "
+                "to delegate from your balance.\n")
+            while True:
+                selected_category = input(
+                    f"{Fore.YELLOW}Type the number of the "
+                    "category you wish to delegate money to:\n")
+                if validate_category_num_entry(selected_category, snapshot):
                     break
-        rounded_down_amount_to_delegate = round(float(amount_to_delegate), 2)
-        print(" ")
-        print(
-            f"Perfect. Adding {Fore.GREEN}£{rounded_down_amount_to_delegate}"
-            f"{Fore.RESET} to {category_name}...\n")
-        initial_category_amount = category_worksheet.row_values(
-            int(selected_category))[1]
-        new_category_amount = float(initial_category_amount) + \
-            rounded_down_amount_to_delegate
-        category_worksheet.update_cell(
-            int(selected_category), 2, new_category_amount)
-        left_to_delegate -= rounded_down_amount_to_delegate
-        time.sleep(2)
-        clear_terminal()
+            print(" ")
+            category_name = snapshot.get_category(int(selected_category))[0]
+            while True:
+                amount_to_delegate = input(
+                    f"{Fore.YELLOW}How much would you like "
+                    f"to put towards {category_name}?\n")
+                if validate_number_entry(amount_to_delegate):
+                    if validate_delegation_max(amount_to_delegate,
+                                               left_to_delegate):
+                        break
+            rounded_down_amount_to_delegate = to_money(amount_to_delegate)
+            print(" ")
+            print(
+                f"Perfect. Adding {Fore.GREEN}£"
+                f"{rounded_down_amount_to_delegate}"
+                f"{Fore.RESET} to {category_name}...\n")
+            store.change_category_amount(
+                int(selected_category), rounded_down_amount_to_delegate)
+            left_to_delegate -= rounded_down_amount_to_delegate
+            pause(2)
+            clear_terminal()
+    # Logged once the delegation is saved, so a delegation that fails
+    # or is abandoned doesn't leave the balance logged without it
+    append_transaction_row(initial_transaction, store)
 
     clear_terminal()
     print("----------------------------------\n")
     print("You have delegated all your bank balance! Well done!")
     print_section_border()
-    time.sleep(2)
+    pause(2)
     clear_terminal()
     print("----------------------------------\n")
     print("Setting up your dashboard...")
     print_section_border()
-    time.sleep(2)
+    pause(2)
     clear_terminal()
-    home_prompt(category_worksheet, transactions_worksheet)
+    return (home_prompt, store)
 
 # Functions for running the budgeting app once user
 # has logged in or created a new budget
 
 
-def home_prompt(category_worksheet, transactions_worksheet):
+def home_prompt(store):
     """
     Print the current budget details and
     ask user which action they would like to perform
@@ -607,10 +677,12 @@ def home_prompt(category_worksheet, transactions_worksheet):
     print(f"{Fore.RESET}----------------------------------\n")
     print(f"{Style.BRIGHT}Commandline BudgetApp Dashboard")
     print_section_border()
-    total_budgeted = get_total_budgeted_amount(category_worksheet)
+    # One read of the categories covers the whole dashboard
+    snapshot = store.snapshot()
+    total_budgeted = get_total_budgeted_amount(snapshot)
     print(f"Your current budgeted amount is {Fore.GREEN} £{total_budgeted} \n")
     print("Current Budget\n")
-    get_current_budget(category_worksheet)
+    get_current_budget(snapshot)
     print("")
     print(f"{Fore.YELLOW}What would you like to do?")
     print("""
@@ -620,7 +692,11 @@ def home_prompt(category_worksheet, transactions_worksheet):
     4. View Recent Transactions
     5. Add or Delete Categories
     6. My Bank Balance Doesn't Match the Budgeted Amount
-    7. Log out
+    7. View Spending Report
+    8. View Transactions Between Dates
+    9. Search Transactions
+    10. Recurring Transactions
+    11. Log out
     """)
     while True:
         action = input(
@@ -632,57 +708,58 @@ def home_prompt(category_worksheet, transactions_worksheet):
             clear_terminal()
             break
     if int(action) == 1:
-        add_paycheck(category_worksheet, transactions_worksheet)
+        return (add_paycheck, store)
     elif int(action) == 2:
-        add_transaction(category_worksheet, transactions_worksheet)
+        return (add_transaction, store)
     elif int(action) == 3:
-        redelegate(category_worksheet, transactions_worksheet)
+        return (redelegate, store)
     elif int(action) == 4:
-        view_recent_transactions(category_worksheet, transactions_worksheet)
+        return (view_recent_transactions, store)
     elif int(action) == 5:
-        adjust_categories(category_worksheet, transactions_worksheet)
+        return (adjust_categories, store)
     elif int(action) == 6:
         clear_terminal()
         print("----------------------------------\n")
         print("We get it. We sometimes forget to budget too...")
         print_section_border()
-        time.sleep(2)
+        pause(2)
         clear_terminal()
-        update_balance(category_worksheet)
-        home_prompt(category_worksheet, transactions_worksheet)
+        update_balance(store)
+        return (home_prompt, store)
+    elif int(action) == 7:
+        return (view_spending_report, store)
+    elif int(action) == 8:
+        return (view_transactions_between_dates, store)
+    elif int(action) == 9:
+        return (search_transactions, store)
+    elif int(action) == 10:
+        return (manage_recurring, store)
     else:
         print("----------------------------------\n")
         print(f"{Style.BRIGHT}Thanks for budgeting! Logging out...")
         print(" ")
         print("----------------------------------")
-        time.sleep(2)
-        startup_prompt()
+        print_trace_summary()
+        pause(2)
+        return (startup_prompt,)
 
 
-def get_total_budgeted_amount(category_worksheet):
+def get_total_budgeted_amount(snapshot):
     """
-    Calculates the total budgeted amount from the budget
+    Calculates the total budgeted amount from a snapshot of the budget
     """
-    budgeted_amount = category_worksheet.col_values(2)
-    column_list = [float(x) for x in budgeted_amount]
-
-    return round(sum(column_list), 2)
+    return snapshot.total
 
 
-def get_current_budget(category_worksheet):
+def get_current_budget(snapshot):
     """
-    Gets the values of the categories and their budgeted amounts,
-    then prints these values in a comprehensible way for the user.
+    Gets the values of the categories and their budgeted amounts
+    from a snapshot of the budget, then prints these values in a
+    comprehensible way for the user.
     """
-    categories = category_worksheet.col_values(1)
-    amount = category_worksheet.col_values(2)
-
-    budget_list = {
-        category: amount for category, amount in zip(categories, amount)}
-    category_num = 1
     space = " "
     dash = "-"
-    for k, v in budget_list.items():
+    for category_num, (k, v) in enumerate(snapshot.categories, 1):
         num_1_spacing_amount = 3 - len(str(category_num))
         num_2_spacing_amount = 28 - len(str(k))
         spacing_1_amount = space*num_1_spacing_amount
@@ -690,10 +767,9 @@ def get_current_budget(category_worksheet):
         print(
             str(category_num) + "." + spacing_1_amount + str(k) + ":" +
             spacing_2_amount + Fore.GREEN + "£" + str(v))
-        category_num += 1
 
 
-def add_paycheck(category_worksheet, transactions_worksheet):
+def add_paycheck(store):
     """
     Receive Paycheck information, validate entries.
     If valid, allow the user to delegate money to various categories.
@@ -707,7 +783,7 @@ def add_paycheck(category_worksheet, transactions_worksheet):
         paycheck = input(f"{Fore.YELLOW}How much is the income amount?\n")
         if validate_number_entry(paycheck):
             break
-    left_to_delegate = float(paycheck)
+    left_to_delegate = to_money(paycheck)
 
     print(" ")
     transaction_institution = input(
@@ -721,58 +797,56 @@ def add_paycheck(category_worksheet, transactions_worksheet):
             break
 
     paycheck_transaction = [
-        float(paycheck), transaction_institution, date, "Income"]
-    append_transaction_row(paycheck_transaction, transactions_worksheet)
+        left_to_delegate, transaction_institution, date, "Income"]
 
     clear_terminal()
-    while left_to_delegate != 0:
-        print_section_border()
-        print(f"{Style.BRIGHT}Time to delegate the money from this income!")
-        print_section_border()
-        print(
-            f"{Fore.BLUE}{Style.BRIGHT}To make sure you don't have any "
-            "unbudgeted money, you must delegate all the paycheck.\n")
-        print("Here is how your current budget stands:")
-        print(" ")
-        get_current_budget(category_worksheet)
-        print(" ")
+    with store.batch_changes():
+        while left_to_delegate != 0:
+            print_section_border()
+            print(
+                f"{Style.BRIGHT}Time to delegate the money from this income!")
+            print_section_border()
+            print(
+                f"{Fore.BLUE}{Style.BRIGHT}To make sure you don't have any "
+                "unbudgeted money, you must delegate all the paycheck.\n")
+            print("Here is how your current budget stands:")
+            print(" ")
+            snapshot = store.snapshot()
+            get_current_budget(snapshot)
+            print(" ")
 
-        left_to_delegate = round(float(left_to_delegate), 2)
-        print(
-            f"You have {Fore.GREEN}£{left_to_delegate}{Fore.RESET} left to "
-            "delegate from your paycheck.\n")
-        while True:
-            selected_category = input(
-                f"{Fore.YELLOW}Type the number of the category you wish to "
-                "delegate money to:\n")
-            if validate_category_num_entry(selected_category,
-                                           category_worksheet):
-                break
-        print(" ")
-        category_name = category_worksheet.row_values(
-            int(selected_category))[0]
-        while True:
-            amount_to_delegate = input(
-                f"{Fore.YELLOW}How much would you like "
-                f"to put towards {category_name}?\n")
-            if validate_number_entry(amount_to_delegate):
-                if validate_delegation_max(amount_to_delegate,
-                                           left_to_delegate):
+            print(
+                f"You have {Fore.GREEN}£{left_to_delegate}{Fore.RESET} left "
+                "to delegate from your paycheck.\n")
+            while True:
+                selected_category = input(
+                    f"{Fore.YELLOW}Type the number of the category you wish "
+                    "to delegate money to:\n")
+                if validate_category_num_entry(selected_category, snapshot):
                     break
-        rounded_down_amount_to_delegate = round(float(amount_to_delegate), 2)
-        print(" ")
-        print(
-            f"Perfect. Adding {Fore.GREEN}£{rounded_down_amount_to_delegate}"
-            f"{Fore.RESET} to {category_name}...\n")
-        initial_category_amount = category_worksheet.row_values(
-            int(selected_category))[1]
-        new_category_amount = float(initial_category_amount) + \
-            rounded_down_amount_to_delegate
-        category_worksheet.update_cell(
-            int(selected_category), 2, new_category_amount)
-        left_to_delegate -= rounded_down_amount_to_delegate
-        time.sleep(1.7)
-        clear_terminal()
+            print(" ")
+            category_name = snapshot.get_category(int(selected_category))[0]
+            while True:
+                amount_to_delegate = input(
+                    f"{Fore.YELLOW}How much would you like "
+                    f"to put towards {category_name}?\n")
+                if validate_number_entry(amount_to_delegate):
+                    if validate_delegation_max(amount_to_delegate,
+                                               left_to_delegate):
+                        break
+            rounded_down_amount_to_delegate = to_money(amount_to_delegate)
+            print(" ")
+            print(
+                f"Perfect. Adding {Fore.GREEN}£"
+                f"{rounded_down_amount_to_delegate}"
+                f"{Fore.RESET} to {category_name}...\n")
+            store.change_category_amount(
+                int(selected_category), rounded_down_amount_to_delegate)
+            left_to_delegate -= rounded_down_amount_to_delegate
+            pause(1.7)
+            clear_terminal()
+    # Logged once the delegation is saved, as in add_money_to_new_budget
+    append_transaction_row(paycheck_transaction, store)
 
     clear_terminal()
     print("----------------------------------\n")
@@ -789,13 +863,13 @@ def add_paycheck(category_worksheet, transactions_worksheet):
             break
     if end_of_transaction_decision == '1':
         clear_terminal()
-        add_paycheck(category_worksheet, transactions_worksheet)
+        return (add_paycheck, store)
     else:
         clear_terminal()
-        home_prompt(category_worksheet, transactions_worksheet)
+        return (home_prompt, store)
 
 
-def add_transaction(category_worksheet, transactions_worksheet):
+def add_transaction(store):
     """
     Receives new transaction information, deducts money from appropriate
     budget categories, adds transaction to transaction list.
@@ -807,8 +881,8 @@ def add_transaction(category_worksheet, transactions_worksheet):
     while True:
         transaction = input(f"{Fore.YELLOW}How much is the transaction?\n")
         if validate_number_entry(transaction):
-            max_transaction = get_total_budgeted_amount(category_worksheet)
-            if float(transaction) > float(max_transaction):
+            max_transaction = store.total_budgeted()
+            if to_money(transaction) > max_transaction:
                 clear_terminal()
                 print(f"{Fore.RESET}----------------------------------\n")
                 print("You don't have enough money for this transaction\n")
@@ -816,11 +890,11 @@ def add_transaction(category_worksheet, transactions_worksheet):
                     "Please adjust your balance or add an income "
                     "transaction")
                 print_section_border()
-                time.sleep(4)
+                pause(4)
                 clear_terminal()
-                home_prompt(category_worksheet, transactions_worksheet)
+                return (home_prompt, store)
             break
-    transaction_amount = float(transaction)
+    transaction_amount = to_money(transaction)
     print(" ")
     transaction_institution = input(
         f"{Fore.YELLOW}Which institution or person "
@@ -832,38 +906,35 @@ def add_transaction(category_worksheet, transactions_worksheet):
             f"{Fore.YELLOW}When did you make this payment? (DD-MM-YY)\n")
         if validate_date_entry(transaction_date):
             break
-    transaction_amount = round(float(transaction_amount), 2)
     print_section_border()
     print(
         f"Great! From which category should this {Fore.RED}£"
         f"{transaction_amount}{Fore.RESET} payment to "
         f"{transaction_institution} be deducted?\n")
-    get_current_budget(category_worksheet)
+    snapshot = store.snapshot()
+    get_current_budget(snapshot)
     print(" ")
 
     while True:
         transaction_selected_category = input(
             f"{Fore.YELLOW}Type the number of the category this transaction "
             "falls under:\n")
-        if validate_category_num_entry(transaction_selected_category,
-                                       category_worksheet):
+        if validate_category_num_entry(
+                transaction_selected_category, snapshot):
             break
-    transaction_category_name = category_worksheet.row_values(
+    transaction_category_name = snapshot.get_category(
         int(transaction_selected_category))[0]
     print(" ")
     print(
         f"Deducting {Fore.RED}£{transaction_amount}{Fore.RESET} "
         f"{transaction_institution} payment from "
         f"{transaction_category_name}...")
-    initial_category_amount = category_worksheet.row_values(
-        int(transaction_selected_category))[1]
-    new_category_amount = float(initial_category_amount) - transaction_amount
-    category_worksheet.update_cell(
-        int(transaction_selected_category), 2, new_category_amount)
+    store.change_category_amount(
+        int(transaction_selected_category), -transaction_amount)
     new_transaction_list = [
         -transaction_amount, transaction_institution,
         transaction_date, transaction_category_name]
-    append_transaction_row(new_transaction_list, transactions_worksheet)
+    append_transaction_row(new_transaction_list, store)
 
     clear_terminal()
     print("----------------------------------\n")
@@ -879,13 +950,13 @@ def add_transaction(category_worksheet, transactions_worksheet):
             break
     if end_of_transaction_decision == '1':
         clear_terminal()
-        add_transaction(category_worksheet, transactions_worksheet)
+        return (add_transaction, store)
     else:
         clear_terminal()
-        home_prompt(category_worksheet, transactions_worksheet)
+        return (home_prompt, store)
 
 
-def redelegate(category_worksheet, transactions_worksheet):
+def redelegate(store):
     """
     Allows the user to move money between the various budgeted categories
     """
@@ -894,25 +965,25 @@ def redelegate(category_worksheet, transactions_worksheet):
     print_section_border()
 
     print("Here is how your current budget stands:\n")
-    get_current_budget(category_worksheet)
+    snapshot = store.snapshot()
+    get_current_budget(snapshot)
     print(" ")
 
     while True:
         from_category_input = input(
             f"{Fore.YELLOW}Type the number of the category you wish to move "
             "money from:\n")
-        selected_category_amount = category_worksheet.row_values(
+        if validate_category_num_entry(from_category_input, snapshot):
+            selected_category_amount = snapshot.get_category(
                 int(from_category_input))[1]
-        if validate_category_num_entry(from_category_input,
-                                       category_worksheet):
-            if float(selected_category_amount) <= 0:
+            if to_money(selected_category_amount) <= 0:
                 print(" ")
                 print("That category has £0. Select another category.\n")
             else:
                 break
-    from_category_name = category_worksheet.row_values(
+    from_category_name = snapshot.get_category(
         int(from_category_input))[0]
-    from_category_amount = category_worksheet.row_values(
+    from_category_amount = snapshot.get_category(
         int(from_category_input))[1]
 
     while True:
@@ -920,10 +991,10 @@ def redelegate(category_worksheet, transactions_worksheet):
         to_category_input = input(
             f"{Fore.YELLOW}Type the number of the category "
             f"you wish to move money from {from_category_name} towards:\n")
-        if validate_category_num_entry(to_category_input, category_worksheet):
+        if validate_category_num_entry(to_category_input, snapshot):
             break
-    to_category_name = category_worksheet.row_values(int(to_category_input))[0]
-    to_category_amount = category_worksheet.row_values(
+    to_category_name = snapshot.get_category(int(to_category_input))[0]
+    to_category_amount = snapshot.get_category(
         int(to_category_input))[1]
 
     print(" ")
@@ -940,7 +1011,7 @@ def redelegate(category_worksheet, transactions_worksheet):
             f"to the {Fore.BLUE}{to_category_name}{Fore.YELLOW} category?\n")
         if validate_delegation_max(transfer_amount_input,
                                    from_category_amount):
-            if float(transfer_amount_input) <= 0:
+            if to_money(transfer_amount_input) <= 0:
                 print(" ")
                 print("Please input a number above 0\n")
             else:
@@ -948,19 +1019,18 @@ def redelegate(category_worksheet, transactions_worksheet):
     print(f"{Fore.RESET}")
     print(f"{Fore.RESET}Moving your money...")
 
-    transfer_amount_input = round(float(transfer_amount_input), 2)
-
-    new_from_category_amount = float(from_category_amount) - \
-        float(transfer_amount_input)
-    new_from_category_amount = round(new_from_category_amount, 2)
-    category_worksheet.update_cell(
-        int(from_category_input), 2, new_from_category_amount)
-
-    new_to_category_amount = float(to_category_amount) + \
-        float(transfer_amount_input)
-    category_worksheet.update_cell(
-        int(to_category_input), 2, new_to_category_amount)
-    time.sleep(.7)
+    transfer_amount_input = to_money(transfer_amount_input)
+
+    new_from_category_amount = to_money(from_category_amount) - \
+        transfer_amount_input
+    new_to_category_amount = to_money(to_category_amount) + \
+        transfer_amount_input
+    with store.batch_changes():
+        store.change_category_amount(
+            int(from_category_input), -transfer_amount_input)
+        store.change_category_amount(
+            int(to_category_input), transfer_amount_input)
+    pause(.7)
     clear_terminal()
 
     print("----------------------------------\n")
@@ -973,7 +1043,8 @@ def redelegate(category_worksheet, transactions_worksheet):
         f"now has {Fore.GREEN}£{new_to_category_amount}{Fore.RESET}")
     print_section_border()
 
-    get_current_budget(category_worksheet)
+    snapshot = store.snapshot()
+    get_current_budget(snapshot)
 
     print_section_border()
     while True:
@@ -987,13 +1058,13 @@ Would you like to move more money?
             break
     if end_of_transaction_decision == '1':
         clear_terminal()
-        redelegate(category_worksheet, transactions_worksheet)
+        return (redelegate, store)
     else:
         clear_terminal()
-        home_prompt(category_worksheet, transactions_worksheet)
+        return (home_prompt, store)
 
 
-def update_balance(category_worksheet):
+def update_balance(store):
     """
     Allows the user to input their current bank balance
     then prompts them to redelegate or add money so that
@@ -1010,17 +1081,17 @@ def update_balance(category_worksheet):
         if validate_number_entry(bank_balance_input):
             break
 
-    bank_balance = round(float(bank_balance_input), 2)
-    budgeted_amount = float(get_total_budgeted_amount(category_worksheet))
+    bank_balance = to_money(bank_balance_input)
+    budgeted_amount = store.total_budgeted()
 
     print(f"{Fore.RESET}")
     if bank_balance > budgeted_amount:
-        update_higher_bank_balance(bank_balance, category_worksheet)
+        update_higher_bank_balance(bank_balance, store)
     else:
-        update_lower_bank_balance(bank_balance, category_worksheet)
+        update_lower_bank_balance(bank_balance, store)
 
 
-def adjust_categories(category_worksheet, transactions_worksheet):
+def adjust_categories(store):
     """
     Lets the user select to either add or delete a category
     """
@@ -1036,17 +1107,17 @@ Would you like to add or delete a category?
     print(f"{Fore.RESET}")
     if adjust_decision == '1':
         clear_terminal()
-        add_category(category_worksheet, transactions_worksheet)
+        return (add_category, store)
     else:
         clear_terminal()
-        delete_category(category_worksheet, transactions_worksheet)
+        return (delete_category, store)
 
 
-def view_recent_transactions(category_worksheet, transactions_worksheet):
+def view_recent_transactions(store):
     """
     Lets the user request to see a specified amount of recent transactions
     """
-    amount_of_transactions = len(transactions_worksheet.col_values(1)) - 1
+    amount_of_transactions = store.transaction_count()
 
     print_section_border()
     print(
@@ -1061,23 +1132,39 @@ def view_recent_transactions(category_worksheet, transactions_worksheet):
         if validate_transaction_list_num_entry(transaction_amount_request,
                                                amount_of_transactions):
             break
-    amounts = transactions_worksheet.col_values(1)
-    institutions = transactions_worksheet.col_values(2)
-    transaction_date = transactions_worksheet.col_values(3)
-    category = transactions_worksheet.col_values(4)
+    page_size = int(transaction_amount_request)
+    shown = 0
+    while True:
+        # Only this page of transactions is read from storage
+        transactions = store.recent_transactions(page_size, shown)
+        print_section_border()
+        if shown == 0:
+            print(
+                f"{Fore.BLUE}Your {transaction_amount_request} most recent "
+                "transactions are:\n")
+        else:
+            print(
+                f"{Fore.BLUE}Your next {len(transactions)} "
+                "transactions are:\n")
+        print_transactions(transactions, shown + 1)
+        shown += len(transactions)
+        if shown >= amount_of_transactions:
+            break
 
-    print_section_border()
-    print(
-        f"{Fore.BLUE}Your {transaction_amount_request} most recent "
-        "transactions are:\n")
-    print("   Amount — Institution — Date — Category\n")
-    for i in range(int(transaction_amount_request)):
-        counter = i + 1
-        print(
-            str(counter) + ". £ " + amounts[-counter] + " — " +
-            institutions[-counter] + " — " +
-            transaction_date[-counter] + " — " +
-            category[-counter])
+        print_section_border()
+        print("""
+Would you like to see older transactions?
+1. Yes
+2. No
+""")
+        while True:
+            older_transactions_decision = input(
+                f"{Fore.YELLOW}Type 1 or 2\n")
+            if validate_y_n_entry(older_transactions_decision):
+                break
+        if older_transactions_decision == '2':
+            break
+        clear_terminal()
 
     print_section_border()
     print("""
@@ -1091,13 +1178,469 @@ Would you like to view more transactions?
             break
     if end_of_view_transaction_decision == '1':
         clear_terminal()
-        view_recent_transactions(category_worksheet, transactions_worksheet)
+        return (view_recent_transactions, store)
+    else:
+        clear_terminal()
+        return (home_prompt, store)
+
+
+def print_transactions(transactions, first_number=1):
+    """
+    Prints a numbered list of transactions under a heading
+    """
+    print("   Amount — Institution — Date — Category\n")
+    for counter, transaction in enumerate(transactions, first_number):
+        print(
+            str(counter) + ". £ " + transaction[0] + " — " +
+            transaction[1] + " — " +
+            transaction[2] + " — " +
+            transaction[3])
+
+
+def view_transactions_between_dates(store):
+    """
+    Lets the user see every transaction between two dates, oldest first
+    """
+    print_section_border()
+    while True:
+        first_date = input(
+            f"{Fore.YELLOW}What is the first date you would like to see? "
+            "(DD-MM-YY)\n")
+        if validate_date_entry(first_date):
+            break
+    while True:
+        last_date = input(
+            f"{Fore.YELLOW}What is the last date you would like to see? "
+            "(DD-MM-YY)\n")
+        if validate_date_entry(last_date) and \
+                validate_date_range(first_date, last_date):
+            break
+
+    # Found through the store's date index, not by reading every row
+    transactions = store.transactions_between(
+        parse_date(first_date), parse_date(last_date))
+    print_section_border()
+    if transactions:
+        print(
+            f"{Fore.BLUE}Your {len(transactions)} transactions from "
+            f"{first_date} to {last_date} are:\n")
+        print_transactions(transactions)
+    else:
+        print(
+            f"{Fore.BLUE}You have no transactions from {first_date} "
+            f"to {last_date}.")
+
+    print_section_border()
+    print("""
+Would you like to see transactions between other dates?
+1. Yes
+2. No
+""")
+    while True:
+        other_dates_decision = input(f"{Fore.YELLOW}Type 1 or 2\n")
+        if validate_y_n_entry(other_dates_decision):
+            break
+    clear_terminal()
+    if other_dates_decision == '1':
+        return (view_transactions_between_dates, store)
+    return (home_prompt, store)
+
+
+def search_transactions(store):
+    """
+    Lets the user find transactions by institution, category, amount
+    and date. Any of them can be left blank. The matches are shown
+    newest first, a page at a time.
+    """
+    print_section_border()
+    print(f"{Fore.BLUE}Search your transactions.")
+    print("Leave any question blank to skip it.")
+    print_section_border()
+    institution = input(
+        f"{Fore.YELLOW}What should the institution's name include?\n")
+    category = input(f"{Fore.YELLOW}Which category are they in?\n")
+    while True:
+        min_amount = input(
+            f"{Fore.YELLOW}What is the smallest amount to find? £")
+        if not min_amount or validate_number_entry(min_amount):
+            break
+    while True:
+        max_amount = input(
+            f"{Fore.YELLOW}What is the largest amount to find? £")
+        if not max_amount or (
+                validate_number_entry(max_amount) and
+                validate_amount_range(min_amount, max_amount)):
+            break
+    while True:
+        first_date = input(
+            f"{Fore.YELLOW}What is the earliest date to find? "
+            "(DD-MM-YY)\n")
+        if not first_date or validate_date_entry(first_date):
+            break
+    while True:
+        last_date = input(
+            f"{Fore.YELLOW}What is the latest date to find? (DD-MM-YY)\n")
+        if not last_date or (
+                validate_date_entry(last_date) and
+                (not first_date or
+                 validate_date_range(first_date, last_date))):
+            break
+
+    # Answered from the store's index of transactions, in memory
+    transactions = store.search_transactions(
+        institution=institution.strip() or None,
+        category=category.strip() or None,
+        min_amount=to_money(min_amount) if min_amount else None,
+        max_amount=to_money(max_amount) if max_amount else None,
+        first_date=parse_date(first_date) if first_date else None,
+        last_date=parse_date(last_date) if last_date else None)[::-1]
+    print_section_border()
+    if not transactions:
+        print(f"{Fore.BLUE}No transactions match your search.")
+    shown = 0
+    while shown < len(transactions):
+        page = transactions[shown:shown + SEARCH_PAGE_SIZE]
+        print(
+            f"{Fore.BLUE}{len(transactions)} transactions match your "
+            f"search. Showing {shown + 1} to {shown + len(page)}, "
+            "newest first:\n")
+        print_transactions(page, shown + 1)
+        shown += len(page)
+        if shown >= len(transactions):
+            break
+
+        print_section_border()
+        print("""
+Would you like to see more of them?
+1. Yes
+2. No
+""")
+        while True:
+            more_results_decision = input(f"{Fore.YELLOW}Type 1 or 2\n")
+            if validate_y_n_entry(more_results_decision):
+                break
+        if more_results_decision == '2':
+            break
+        clear_terminal()
+
+    print_section_border()
+    print("""
+Would you like to search again?
+1. Yes
+2. No
+""")
+    while True:
+        search_again_decision = input(f"{Fore.YELLOW}Type 1 or 2\n")
+        if validate_y_n_entry(search_again_decision):
+            break
+    clear_terminal()
+    if search_again_decision == '1':
+        return (search_transactions, store)
+    return (home_prompt, store)
+
+
+def view_spending_report(store):
+    """
+    Shows the user where their money has gone, a month at a time
+    starting with the latest, and lets them page back to earlier months
+    """
+    report = store.spending_report()
+    months = report.months[::-1]
+
+    print_section_border()
+    print(f"{Fore.BLUE}Your spending report\n")
+    print_report_totals(report)
+    shown = 0
+    while shown < len(months):
+        print_section_border()
+        print_month_report(report, months[shown])
+        shown += 1
+        if shown >= len(months):
+            break
+
+        print_section_border()
+        print("""
+Would you like to see the month before?
+1. Yes
+2. No
+""")
+        while True:
+            earlier_month_decision = input(f"{Fore.YELLOW}Type 1 or 2\n")
+            if validate_y_n_entry(earlier_month_decision):
+                break
+        if earlier_month_decision == '2':
+            break
+        clear_terminal()
+
+    print_section_border()
+    print("""
+Would you like to see the report again?
+1. Yes
+2. No
+""")
+    while True:
+        end_of_report_decision = input(f"{Fore.YELLOW}Type 1 or 2\n")
+        if validate_y_n_entry(end_of_report_decision):
+            break
+    clear_terminal()
+    if end_of_report_decision == '1':
+        return (view_spending_report, store)
+    return (home_prompt, store)
+
+
+def print_report_totals(report):
+    """
+    Prints the money in and out across every transaction in a report,
+    and the institutions the most was spent with
+    """
+    print(f"Across your {report.transaction_count} transactions:")
+    print(f"  Money in:  £{report.income}")
+    print(f"  Money out: £{report.spending}")
+    if report.top_institutions:
+        print("\nWhere you spent the most:")
+        for name, amount in report.top_institutions:
+            print(f"  {name} — £{amount}")
+
+
+def print_month_report(report, month):
+    """
+    Prints one month of a report: the money in and out, what was spent
+    in each category and how each compares with the month before
+    """
+    previous = report.previous_month(month)
+    changes = dict(report.category_changes(month))
+    print(reports.month_name(month))
+    print(f"  Money in:  £{report.month_income[month]}")
+    spending_change = report.spending_change(month)
+    if spending_change is None:
+        print(f"  Money out: £{report.month_spending[month]}")
     else:
+        print(
+            f"  Money out: £{report.month_spending[month]} "
+            f"({spending_change:+} on {reports.month_name(previous)})")
+    spending = report.category_spending[month]
+    for name in list(spending) + [
+            name for name in changes if name not in spending]:
+        amount = spending.get(name, 0)
+        if name in changes:
+            print(f"    {name} — £{amount:.2f} ({changes[name]:+})")
+        else:
+            print(f"    {name} — £{amount:.2f}")
+
+
+def manage_recurring(store):
+    """
+    Shows the user's recurring transactions, which are logged for them
+    when they come due, and lets them add or delete one
+    """
+    items = backend.recurring_items(store.username)
+    print_section_border()
+    print(f"{Fore.BLUE}Your recurring transactions\n")
+    if not items:
+        print("You don't have any recurring transactions yet.")
+    for number, item in enumerate(items, 1):
+        print(f"{number}. {recurring.describe(item)}")
+    print_section_border()
+    print("""
+What would you like to do?
+1. Add a recurring payment
+2. Add a recurring income and how to delegate it
+3. Delete a recurring transaction
+4. Go back to the dashboard
+""")
+    while True:
+        recurring_decision = input(f"{Fore.YELLOW}Type 1, 2, 3 or 4\n")
+        if validate_4_entry(recurring_decision):
+            break
+    clear_terminal()
+    if recurring_decision == '1':
+        return (add_recurring_payment, store)
+    elif recurring_decision == '2':
+        return (add_recurring_income, store)
+    elif recurring_decision == '3':
+        if not items:
+            return (manage_recurring, store)
+        return (delete_recurring, store, items)
+    return (home_prompt, store)
+
+
+def ask_recurring_schedule(kind):
+    """
+    Asks how often a recurring transaction happens and when it is
+    next due. Returns the frequency and the date.
+    """
+    print("""
+How often does it happen?
+1. Every week
+2. Every month
+""")
+    while True:
+        frequency_decision = input(f"{Fore.YELLOW}Type 1 or 2\n")
+        if validate_y_n_entry(frequency_decision):
+            break
+    frequency = recurring.FREQUENCIES[int(frequency_decision) - 1]
+    print(" ")
+    while True:
+        first_date = input(
+            f"{Fore.YELLOW}When is the next {kind} due? (DD-MM-YY)\n")
+        if validate_date_entry(first_date) and \
+                validate_recurring_date(first_date, frequency):
+            break
+    return frequency, first_date
+
+
+def add_recurring_payment(store):
+    """
+    Receives a payment that happens every week or month, such as rent,
+    so it can be logged without the user entering it each time
+    """
+    print("----------------------------------\n")
+    print(f"{Style.BRIGHT}Just a few questions about your recurring payment:")
+    print_section_border()
+    while True:
+        amount = input(f"{Fore.YELLOW}How much is the payment?\n")
+        if validate_number_entry(amount):
+            break
+    print(" ")
+    institution = input(
+        f"{Fore.YELLOW}Which institution or person receives the money?\n")
+    frequency, first_date = ask_recurring_schedule("payment")
+    print_section_border()
+    snapshot = store.snapshot()
+    get_current_budget(snapshot)
+    print(" ")
+    while True:
+        selected_category = input(
+            f"{Fore.YELLOW}Type the number of the category it should be "
+            "deducted from:\n")
+        if validate_category_num_entry(selected_category, snapshot):
+            break
+    category_name = snapshot.get_category(int(selected_category))[0]
+    backend.add_recurring_item(recurring.new_item(
+        store.username, "payment", institution, amount, category_name,
+        frequency, first_date))
+
+    clear_terminal()
+    print("----------------------------------\n")
+    print(
+        f"{Style.BRIGHT}Success! It will be deducted from {category_name} "
+        f"{frequency} from {first_date}.")
+    print_section_border()
+    pause(2)
+    clear_terminal()
+    return (manage_recurring, store)
+
+
+def add_recurring_income(store):
+    """
+    Receives an income that comes every week or month, such as a
+    paycheck, and a plan for delegating it: a fixed amount or a
+    percentage for each category. It is then added and delegated
+    without the user going through each category every time.
+    """
+    print("----------------------------------\n")
+    print(f"{Style.BRIGHT}Just a few questions about your recurring income:")
+    print_section_border()
+    while True:
+        amount = input(f"{Fore.YELLOW}How much is the income amount?\n")
+        if validate_number_entry(amount):
+            break
+    print(" ")
+    institution = input(
+        f"{Fore.YELLOW}Who or what institution gives you this income?\n")
+    frequency, first_date = ask_recurring_schedule("income")
+
+    plan = []
+    while not recurring.plan_is_complete(amount, plan):
         clear_terminal()
-        home_prompt(category_worksheet, transactions_worksheet)
+        print_section_border()
+        print(f"{Style.BRIGHT}Time to plan how to delegate this income!")
+        print_section_border()
+        print(
+            f"{Fore.BLUE}{Style.BRIGHT}Give each category an amount, or a "
+            "percentage such as 50%. The amounts are taken first, and the "
+            "percentages share out what is left, so they must add up to "
+            "100%.\n")
+        fixed, percent = recurring.plan_totals(plan)
+        print(
+            f"So far {Fore.GREEN}£{fixed}{Fore.RESET} of "
+            f"£{to_money(amount)} is given as amounts and "
+            f"{Fore.GREEN}{percent}%{Fore.RESET} of the rest as "
+            "percentages.\n")
+        snapshot = store.snapshot()
+        get_current_budget(snapshot)
+        print(" ")
+        while True:
+            selected_category = input(
+                f"{Fore.YELLOW}Type the number of the category you wish "
+                "to delegate money to:\n")
+            if validate_category_num_entry(selected_category, snapshot):
+                break
+        category_name = snapshot.get_category(int(selected_category))[0]
+        print(" ")
+        while True:
+            share = input(
+                f"{Fore.YELLOW}How much should go to {category_name}? "
+                "Type an amount, or a percentage such as 50%\n").strip()
+            if validate_plan_share(share, amount, plan):
+                break
+        if share.endswith("%"):
+            share = f"{to_money(share[:-1])}%"
+        else:
+            share = str(to_money(share))
+        plan.append([category_name, share])
+
+    backend.add_recurring_item(recurring.new_item(
+        store.username, "income", institution, amount, "Income",
+        frequency, first_date, plan))
+    clear_terminal()
+    print("----------------------------------\n")
+    print(
+        f"{Style.BRIGHT}Success! It will be added and delegated "
+        f"{frequency} from {first_date}.")
+    print_section_border()
+    pause(2)
+    clear_terminal()
+    return (manage_recurring, store)
+
 
+def delete_recurring(store, items):
+    """
+    Lets the user stop one of their recurring transactions
+    """
+    print_section_border()
+    for number, item in enumerate(items, 1):
+        print(f"{number}. {recurring.describe(item)}")
+    print(" ")
+    while True:
+        selected_item = input(
+            f"{Fore.YELLOW}Type the number of the recurring transaction "
+            "to delete:\n")
+        if validate_transaction_list_num_entry(selected_item, len(items)):
+            break
+    backend.delete_recurring_item(items[int(selected_item) - 1])
+    clear_terminal()
+    print("----------------------------------\n")
+    print(f"{Style.BRIGHT}Deleted. It won't be logged again.")
+    print_section_border()
+    pause(2)
+    clear_terminal()
+    return (manage_recurring, store)
 
-def add_category(category_worksheet, transactions_worksheet):
+
+def input_category_name(store, prompt):
+    """
+    Asks for the name of a new category until it is one the budget
+    doesn't already have
+    """
+    snapshot = store.snapshot()
+    while True:
+        new_category_name = input(prompt)
+        if validate_category_name(new_category_name, snapshot):
+            return new_category_name
+
+
+def add_category(store):
     """
     Adds a category to the the category list. Allows the user to
     select the name and the starting amount
@@ -1106,14 +1649,13 @@ def add_category(category_worksheet, transactions_worksheet):
     print(f"{Style.BRIGHT}Let's add your new category:")
     print_section_border()
 
-    new_category_name = input(
-        f"{Fore.YELLOW}What is the name of the new category?\n")
+    new_category_name = input_category_name(
+        store, f"{Fore.YELLOW}What is the name of the new category?\n")
 
     print(" ")
     print(f"Adding a {new_category_name} category to your category list...\n")
     print(f"Setting {new_category_name}'s starting amount to £0...")
-    new_category_list = [new_category_name, 0]
-    category_worksheet.append_row(new_category_list)
+    store.add_category(new_category_name)
     print_section_border()
     print("""
 Would you like to adjust another category?
@@ -1127,13 +1669,13 @@ Would you like to adjust another category?
             break
     if end_of_add_category_decision == '1':
         clear_terminal()
-        adjust_categories(category_worksheet, transactions_worksheet)
+        return (adjust_categories, store)
     else:
         clear_terminal()
-        home_prompt(category_worksheet, transactions_worksheet)
+        return (home_prompt, store)
 
 
-def delete_category(category_worksheet, transactions_worksheet):
+def delete_category(store):
     """
     Allows the user to select the category to delete from the category list.
     Then prompts the user to redelegate the money from that category.
@@ -1144,87 +1686,86 @@ def delete_category(category_worksheet, transactions_worksheet):
         "to delete:")
     print_section_border()
     print(f"{Fore.RESET}Here is a list of your current categories:\n")
-    get_current_budget(category_worksheet)
+    snapshot = store.snapshot()
+    get_current_budget(snapshot)
     print(" ")
     while True:
         delete_selected_category = input(
             f"{Fore.YELLOW}Type the number of the category you "
             "wish to delete:\n")
-        if validate_category_num_entry(delete_selected_category,
-                                       category_worksheet):
+        if validate_category_num_entry(delete_selected_category, snapshot):
             break
     category_to_delete = int(delete_selected_category)
 
-    category_to_delete_name = category_worksheet.row_values(
+    category_to_delete_name = snapshot.get_category(
         category_to_delete)[0]
-    category_to_delete_amount = float(category_worksheet.row_values(
+    category_to_delete_amount = to_money(snapshot.get_category(
         category_to_delete)[1])
 
     clear_terminal()
     print(f"{Fore.RESET}----------------------------------\n")
     print(f"Deleting {category_to_delete_name} category...")
     print_section_border()
-    category_worksheet.delete_rows(category_to_delete)
-    category_to_delete_amount = round(float(category_to_delete_amount), 2)
-    print(
-        f"{Fore.BLUE}The {category_to_delete_name} category "
-        f"had {Fore.GREEN}£{category_to_delete_amount}"
-        f"{Fore.BLUE} delegated to it.\n")
-    print("You will need to delegate this amount to another category.\n")
-    while_count = 0
-    while category_to_delete_amount != 0:
-        if while_count > 0:
-            clear_terminal()
-            print(f"{Fore.RESET}----------------------------------\n")
-            print(
-                f"{Fore.GREEN}£{amount_to_delegate}{Fore.RESET} added to "
-                f"{delegation_category_name}")
-            print_section_border()
-        category_to_delete_amount = round(float(category_to_delete_amount), 2)
+    with store.batch_changes():
+        store.delete_category(category_to_delete)
         print(
-            f"There is {Fore.GREEN}£{category_to_delete_amount}"
-            f"{Fore.RESET} left to delegate from {category_to_delete_name}. "
-            f"Where do you wish to delegate it?\n")
-        while True:
-            get_current_budget(category_worksheet)
-            print(" ")
-            delegation_category_input = input(
-                f"{Fore.YELLOW}Type the number of the category "
-                "you wish to delegate money to:\n")
-            if validate_category_num_entry(delegation_category_input,
-                                           category_worksheet):
-                break
-        delegation_category = int(delegation_category_input)
-        delegation_category_name = category_worksheet.row_values(
-            delegation_category)[0]
-        original_delegation_category_amount = float(
-            category_worksheet.row_values(delegation_category)[1])
+            f"{Fore.BLUE}The {category_to_delete_name} category "
+            f"had {Fore.GREEN}£{category_to_delete_amount}"
+            f"{Fore.BLUE} delegated to it.\n")
+        print("You will need to delegate this amount to another category.\n")
+        while_count = 0
+        while category_to_delete_amount != 0:
+            if while_count > 0:
+                clear_terminal()
+                print(f"{Fore.RESET}----------------------------------\n")
+                print(
+                    f"{Fore.GREEN}£{amount_to_delegate}{Fore.RESET} added to "
+                    f"{delegation_category_name}")
+                print_section_border()
+            print(
+                f"There is {Fore.GREEN}£{category_to_delete_amount}"
+                f"{Fore.RESET} left to delegate from "
+                f"{category_to_delete_name}. "
+                f"Where do you wish to delegate it?\n")
+            while True:
+                snapshot = store.snapshot()
+                get_current_budget(snapshot)
+                print(" ")
+                delegation_category_input = input(
+                    f"{Fore.YELLOW}Type the number of the category "
+                    "you wish to delegate money to:\n")
+                if validate_category_num_entry(
+                        delegation_category_input, snapshot):
+                    break
+            delegation_category = int(delegation_category_input)
+            delegation_category_name = snapshot.get_category(
+                delegation_category)[0]
+            original_delegation_category_amount = to_money(
+                snapshot.get_category(delegation_category)[1])
 
-        while True:
+            while True:
+                print(" ")
+                print(
+                    f"{delegation_category_name} has {Fore.GREEN}£"
+                    f"{original_delegation_category_amount}{Fore.RESET}.\n")
+                amount_to_delegate_input = input(
+                    f"{Fore.YELLOW}How much of the "
+                    f"{category_to_delete_name}'s {Fore.GREEN}£"
+                    f"{category_to_delete_amount}{Fore.YELLOW} do you wish "
+                    f"to put towards {delegation_category_name}?\n")
+                if validate_delegation_max(amount_to_delegate_input,
+                                           category_to_delete_amount):
+                    break
+            amount_to_delegate = to_money(amount_to_delegate_input)
             print(" ")
             print(
-                f"{delegation_category_name} has {Fore.GREEN}£"
-                f"{original_delegation_category_amount}{Fore.RESET}.\n")
-            amount_to_delegate_input = input(
-                f"{Fore.YELLOW}How much of the "
-                f"{category_to_delete_name}'s {Fore.GREEN}£"
-                f"{category_to_delete_amount}{Fore.YELLOW} do you wish "
-                f"to put towards {delegation_category_name}?\n")
-            if validate_delegation_max(amount_to_delegate_input,
-                                       category_to_delete_amount):
-                break
-        amount_to_delegate = round(float(amount_to_delegate_input), 2)
-        print(" ")
-        print(
-            f"Adding {Fore.GREEN}£{amount_to_delegate}"
-            f"{Fore.RESET} to {delegation_category_name}...")
-        new_delegation_category_amount = amount_to_delegate + \
-            original_delegation_category_amount
-        category_worksheet.update_cell(
-            delegation_category, 2, new_delegation_category_amount)
-        category_to_delete_amount -= amount_to_delegate
-        time.sleep(2)
-        while_count += 1
+                f"Adding {Fore.GREEN}£{amount_to_delegate}"
+                f"{Fore.RESET} to {delegation_category_name}...")
+            store.change_category_amount(
+                delegation_category, amount_to_delegate)
+            category_to_delete_amount -= amount_to_delegate
+            pause(2)
+            while_count += 1
     clear_terminal()
     print("----------------------------------\n")
     print(
@@ -1244,13 +1785,13 @@ Would you like to adjust another category?
             break
     if end_of_add_category_decision == '1':
         clear_terminal()
-        adjust_categories(category_worksheet, transactions_worksheet)
+        return (adjust_categories, store)
     else:
         clear_terminal()
-        home_prompt(category_worksheet, transactions_worksheet)
+        return (home_prompt, store)
 
 
-def update_higher_bank_balance(bank_balance, category_worksheet):
+def update_higher_bank_balance(bank_balance, store):
     """
     Tells the user their bank balance is higher than their budget
     Then calculates how much money they have to delegate to make
@@ -1266,72 +1807,66 @@ def update_higher_bank_balance(bank_balance, category_worksheet):
         "delegate money to your budget.")
     print_section_border()
 
-    budgeted_amount = get_total_budgeted_amount(category_worksheet)
-    left_to_delegate = round(bank_balance, 2) - round(budgeted_amount, 2)
+    budgeted_amount = store.total_budgeted()
+    left_to_delegate = to_money(bank_balance) - budgeted_amount
 
     while_count = 0
-    while left_to_delegate != 0:
-        left_to_delegate = round(float(left_to_delegate), 2)
-        if while_count > 0:
-            clear_terminal()
-            print(f"{Fore.RESET}----------------------------------\n")
+    with store.batch_changes():
+        while left_to_delegate != 0:
+            if while_count > 0:
+                clear_terminal()
+                print(f"{Fore.RESET}----------------------------------\n")
+                print(
+                    f"{Fore.GREEN}£{left_to_delegate}{Fore.RESET} "
+                    f"added to {category_name}")
+                print_section_border()
+            print("Here is how your current budget stands:")
+            print(" ")
+            snapshot = store.snapshot()
+            get_current_budget(snapshot)
+            print(" ")
             print(
-                f"{Fore.GREEN}£{left_to_delegate}{Fore.RESET} "
-                f"added to {category_name}")
-            print_section_border()
-        print("Here is how your current budget stands:")
-        print(" ")
-        get_current_budget(category_worksheet)
-        print(" ")
-        left_to_delegate = round(left_to_delegate, 2)
-        print(
-            f"You have {Fore.GREEN}£{left_to_delegate}"
-            f"{Fore.RESET} left to delegate.\n")
-        while True:
-            selected_category = input(
-                f"{Fore.YELLOW}Type the number of the "
-                "category you wish to delegate money to:\n")
-            if validate_category_num_entry(selected_category,
-                                           category_worksheet):
-                break
-
-        print(" ")
-        category_name = category_worksheet.row_values(
-            int(selected_category))[0]
-        while True:
-            amount_to_delegate = input(
-                f"{Fore.YELLOW}How much would you like to "
-                f"put towards {category_name}?\n")
-            if validate_number_entry(amount_to_delegate):
-                if validate_delegation_max(amount_to_delegate,
-                                           left_to_delegate):
+                f"You have {Fore.GREEN}£{left_to_delegate}"
+                f"{Fore.RESET} left to delegate.\n")
+            while True:
+                selected_category = input(
+                    f"{Fore.YELLOW}Type the number of the "
+                    "category you wish to delegate money to:\n")
+                if validate_category_num_entry(selected_category, snapshot):
                     break
-        amount_to_delegate = round(float(amount_to_delegate), 2)
 
-        print(" ")
-        print(
-            f"Perfect. Adding {Fore.GREEN}£{amount_to_delegate}"
-            f"{Fore.RESET} to {category_name}...\n")
-        initial_category_amount = category_worksheet.row_values(
-            int(selected_category))[1]
-        new_category_amount = float(initial_category_amount) + \
-            float(amount_to_delegate)
-        category_worksheet.update_cell(
-            int(selected_category), 2, new_category_amount)
-        time.sleep(2)
-        left_to_delegate -= float(amount_to_delegate)
-        while_count += 1
+            print(" ")
+            category_name = snapshot.get_category(int(selected_category))[0]
+            while True:
+                amount_to_delegate = input(
+                    f"{Fore.YELLOW}How much would you like to "
+                    f"put towards {category_name}?\n")
+                if validate_number_entry(amount_to_delegate):
+                    if validate_delegation_max(amount_to_delegate,
+                                               left_to_delegate):
+                        break
+            amount_to_delegate = to_money(amount_to_delegate)
+
+            print(" ")
+            print(
+                f"Perfect. Adding {Fore.GREEN}£{amount_to_delegate}"
+                f"{Fore.RESET} to {category_name}...\n")
+            store.change_category_amount(
+                int(selected_category), amount_to_delegate)
+            pause(2)
+            left_to_delegate -= amount_to_delegate
+            while_count += 1
     clear_terminal()
     print("----------------------------------\n")
     print(
         "Success! You've finished delegating and your "
         "bank balance now matches the budget")
     print_section_border()
-    time.sleep(2.5)
+    pause(2.5)
     clear_terminal()
 
 
-def update_lower_bank_balance(bank_balance, category_worksheet):
+def update_lower_bank_balance(bank_balance, store):
     """
     Tells the user their bank balance is lower than their budget
     Then prompts them to withdraw money from their budget in order
@@ -1347,76 +1882,72 @@ def update_lower_bank_balance(bank_balance, category_worksheet):
         "money from your budgeted categories")
     print_section_border()
 
-    budgeted_amount = get_total_budgeted_amount(category_worksheet)
-    left_to_deduct = round(float(budgeted_amount), 2) - \
-        round(float(bank_balance), 2)
+    budgeted_amount = store.total_budgeted()
+    left_to_deduct = budgeted_amount - to_money(bank_balance)
 
     while_count = 0
-    while left_to_deduct != 0:
-        left_to_deduct = round(float(left_to_deduct), 2)
-        if while_count > 0:
-            clear_terminal()
-            print(f"{Fore.RESET}----------------------------------\n")
-            print(
-                f"{Fore.RED}£{left_to_deduct}{Fore.RESET} "
-                f"deducted from {category_name}")
-            print_section_border()
-        print("Here is how your current budget stands:")
-        print(" ")
-        get_current_budget(category_worksheet)
-        print(" ")
+    with store.batch_changes():
+        while left_to_deduct != 0:
+            if while_count > 0:
+                clear_terminal()
+                print(f"{Fore.RESET}----------------------------------\n")
+                print(
+                    f"{Fore.RED}£{left_to_deduct}{Fore.RESET} "
+                    f"deducted from {category_name}")
+                print_section_border()
+            print("Here is how your current budget stands:")
+            print(" ")
+            snapshot = store.snapshot()
+            get_current_budget(snapshot)
+            print(" ")
 
-        left_to_deduct = round(float(left_to_deduct), 2)
-        print(
-            f"You have {Fore.RED}£{left_to_deduct}"
-            f"{Fore.RESET} left to deduct.\n")
-        while True:
-            selected_category = input(
-                f"{Fore.YELLOW}Type the number of "
-                "the category you wish to deduct money from:\n")
-            selected_category_amount = category_worksheet.row_values(
+            print(
+                f"You have {Fore.RED}£{left_to_deduct}"
+                f"{Fore.RESET} left to deduct.\n")
+            while True:
+                selected_category = input(
+                    f"{Fore.YELLOW}Type the number of "
+                    "the category you wish to deduct money from:\n")
+                if validate_category_num_entry(selected_category, snapshot):
+                    selected_category_amount = snapshot.get_category(
+                        int(selected_category))[1]
+                    if to_money(selected_category_amount) <= 0:
+                        print(" ")
+                        print(
+                            "That category has £0. Select another "
+                            "category.\n")
+                    else:
+                        break
+            print(" ")
+            category_name = snapshot.get_category(int(selected_category))[0]
+            selected_category_amount = snapshot.get_category(
                 int(selected_category))[1]
-            if validate_category_num_entry(selected_category,
-                                           category_worksheet):
-                if float(selected_category_amount) <= 0:
-                    print(" ")
-                    print("That category has £0. Select another category.\n")
-                else:
-                    break
-        print(" ")
-        category_name = category_worksheet.row_values(
-            int(selected_category))[0]
-        selected_category_amount = category_worksheet.row_values(
-            int(selected_category))[1]
-        while True:
-            amount_to_deduct = input(
-                f"{Fore.YELLOW}How much would you like "
-                f"to deduct from {category_name}?\n")
-            if validate_number_entry(amount_to_deduct):
-                if validate_delegation_max(amount_to_deduct, left_to_deduct):
+            while True:
+                amount_to_deduct = input(
+                    f"{Fore.YELLOW}How much would you like "
+                    f"to deduct from {category_name}?\n")
+                if validate_number_entry(amount_to_deduct):
                     if validate_delegation_max(amount_to_deduct,
-                                               selected_category_amount):
-                        break
-        amount_to_deduct = round(float(amount_to_deduct), 2)
+                                               left_to_deduct):
+                        if validate_delegation_max(amount_to_deduct,
+                                                   selected_category_amount):
+                            break
+            amount_to_deduct = to_money(amount_to_deduct)
 
-        print(" ")
-        print(
-            f"Deducting {Fore.RED}£{amount_to_deduct}"
-            f"{Fore.RESET} from {category_name}\n")
-        initial_category_amount = category_worksheet.row_values(
-            int(selected_category))[1]
-        new_category_amount = float(initial_category_amount) - \
-            float(amount_to_deduct)
-        category_worksheet.update_cell(
-            int(selected_category), 2, new_category_amount)
-        left_to_deduct -= float(amount_to_deduct)
-        while_count += 1
+            print(" ")
+            print(
+                f"Deducting {Fore.RED}£{amount_to_deduct}"
+                f"{Fore.RESET} from {category_name}\n")
+            store.change_category_amount(
+                int(selected_category), -amount_to_deduct)
+            left_to_deduct -= amount_to_deduct
+            while_count += 1
     clear_terminal()
     print("----------------------------------\n")
     print("Success! You've finished deducting money from your categories")
     print("and your bank balance now matches the budget")
     print_section_border()
-    time.sleep(2.5)
+    pause(2.5)
     clear_terminal()
 
 
@@ -1431,10 +1962,10 @@ def validate_home_data(value):
     Validates the user input from the home page.
     """
     try:
-        if int(value) > 7:
+        if int(value) > 11:
             raise ValueError(
                 f"You must enter a {Fore.BLUE}number{Fore.RESET} "
-                f"between {Fore.BLUE}1{Fore.RESET} and {Fore.BLUE}7"
+                f"between {Fore.BLUE}1{Fore.RESET} and {Fore.BLUE}11"
                 f"{Fore.RESET}. You entered {Fore.RED}{value}{Fore.RESET}.")
     except ValueError as e:
         print(" ")
@@ -1448,7 +1979,7 @@ def validate_number_entry(value):
     Validate entries that need a number
     """
     try:
-        if float(value) < .01:
+        if to_money(value) < PENNY:
             raise ValueError(
                 f"You must enter a {Fore.BLUE}number greater "
                 f"than 1{Fore.RESET}. You entered "
@@ -1460,12 +1991,12 @@ def validate_number_entry(value):
     return True
 
 
-def validate_category_num_entry(value, category_worksheet):
+def validate_category_num_entry(value, snapshot):
     """
     Used to validate whether an input entry exceeds
-    the number of budget categories.
+    the number of budget categories in a snapshot of the budget.
     """
-    entry_amount = len(category_worksheet.col_values(1))
+    entry_amount = snapshot.count
     try:
         if int(value) > int(entry_amount):
             raise ValueError(
@@ -1483,6 +2014,23 @@ def validate_category_num_entry(value, category_worksheet):
     return True
 
 
+def validate_category_name(value, snapshot):
+    """
+    Used to validate that a new category's name isn't already the
+    name of a category in a snapshot of the budget
+    """
+    try:
+        if value in [name for name, _ in snapshot.categories]:
+            raise ValueError(
+                f"You already have a {Fore.BLUE}{value}{Fore.RESET} "
+                "category")
+    except ValueError as e:
+        print(" ")
+        print(f"Invalid entry: {e}.\n")
+        return False
+    return True
+
+
 def validate_delegation_max(value, max):
     """
     Validates whether a one number is greater than another.
@@ -1490,7 +2038,7 @@ def validate_delegation_max(value, max):
     are not larger than the paycheck.
     """
     try:
-        if float(value) > float(max):
+        if to_money(value) > to_money(max):
             raise ValueError(
                 f"You must enter a {Fore.BLUE}number{Fore.RESET} "
                 f"between {Fore.BLUE}1{Fore.RESET} and {Fore.BLUE}"
@@ -1519,6 +2067,86 @@ def validate_date_entry(value):
         return False
 
 
+def validate_amount_range(min_amount, max_amount):
+    """
+    Validates that the largest amount of a range isn't below the
+    smallest, if a smallest was given
+    """
+    try:
+        if min_amount and to_money(max_amount) < to_money(min_amount):
+            raise ValueError(
+                f"The largest amount must be at least {Fore.BLUE}"
+                f"{min_amount}{Fore.RESET}. You entered {Fore.RED}"
+                f"{max_amount}{Fore.RESET}")
+    except ValueError as e:
+        print(" ")
+        print(f"Invalid entry: {e}.\n")
+        return False
+    return True
+
+
+def validate_date_range(first_date, last_date):
+    """
+    Validates that the last date of a range isn't before the first
+    """
+    try:
+        if parse_date(last_date) < parse_date(first_date):
+            raise ValueError(
+                f"The last date must be on or after {Fore.BLUE}"
+                f"{first_date}{Fore.RESET}. You entered {Fore.RED}"
+                f"{last_date}{Fore.RESET}")
+    except ValueError as e:
+        print(" ")
+        print(f"Invalid entry: {e}.\n")
+        return False
+    return True
+
+
+def validate_recurring_date(value, frequency):
+    """
+    Validates that a monthly transaction's date is on one of the days
+    every month has, so it stays on the same day each month
+    """
+    try:
+        if frequency == "monthly" and parse_date(value).day > 28:
+            raise ValueError(
+                f"Monthly transactions must be due on day {Fore.BLUE}1"
+                f"{Fore.RESET} to {Fore.BLUE}28{Fore.RESET} of the month. "
+                f"You entered {Fore.RED}{value}{Fore.RESET}")
+    except ValueError as e:
+        print(" ")
+        print(f"Invalid entry: {e}.\n")
+        return False
+    return True
+
+
+def validate_plan_share(value, amount, plan):
+    """
+    Validates a category's share of a recurring income: an amount, or
+    a percentage such as 50%, that the rest of the plan leaves room for
+    """
+    fixed, percent = recurring.plan_totals(plan)
+    try:
+        if value.endswith("%"):
+            if not 0 < to_money(value[:-1]) <= 100 - percent:
+                raise ValueError(
+                    f"You must enter a percentage between {Fore.BLUE}0%"
+                    f"{Fore.RESET} and {Fore.BLUE}{100 - percent}%"
+                    f"{Fore.RESET}. You entered {Fore.RED}{value}"
+                    f"{Fore.RESET}")
+        elif not PENNY <= to_money(value) <= to_money(amount) - fixed:
+            raise ValueError(
+                f"You must enter an amount between {Fore.BLUE}0.01"
+                f"{Fore.RESET} and {Fore.BLUE}{to_money(amount) - fixed}"
+                f"{Fore.RESET}, or a percentage. You entered {Fore.RED}"
+                f"{value}{Fore.RESET}")
+    except ValueError as e:
+        print(" ")
+        print(f"Invalid entry: {e}.\n")
+        return False
+    return True
+
+
 def validate_y_n_entry(value):
     """
     Validates any inputs which require 2 options
@@ -1578,11 +2206,23 @@ def validate_transaction_list_num_entry(value, max):
 # Miscellaneous functions
 
 
-def append_transaction_row(value, transactions_worksheet):
+def append_transaction_row(value, store):
     """
     Append a row to the transaction list
     """
-    transactions_worksheet.append_row(value)
+    store.append_transaction(value)
+
+
+def print_trace_summary():
+    '''
+    Prints where the session's time went, if tracing is on.
+    '''
+    summary = tracing.summary_lines()
+    if summary:
+        print(f"{Fore.BLUE}Where this session's time went:\n")
+        for line in summary:
+            print(line)
+        print("----------------------------------")
 
 
 def print_section_border():
@@ -1602,7 +2242,9 @@ def clear_terminal():
     the terminal of the last section.
     It resets colorama colors also.
     '''
-    os.system('cls' if os.name == 'nt' else 'clear')
+    # The same codes `clear` prints, written to this session's terminal
+    sys.stdout.write("\033[H\033[2J\033[3J")
+    sys.stdout.flush()
 
 
 def txt_effect(text_to_print):
@@ -1612,7 +2254,208 @@ def txt_effect(text_to_print):
     for character in text_to_print:
         sys.stdout.write(character)
         sys.stdout.flush()
-        time.sleep(0.03)
+        pause(0.03)
+
+
+# Command line tools, run as `python3 run.py <command> ...`.
+# With no command the interactive app starts as usual.
+
+
+def import_command(options):
+    """
+    Imports a bank statement into a user's budget without any prompts
+    """
+    user = backend.find_user(options.user)
+    if user is None:
+        sys.exit(f"There is no account for {options.user}")
+    store = backend.open_budget(user[2])
+    try:
+        result = importer.import_statement(
+            store, options.statement,
+            default_category=options.default_category,
+            income_category=options.income_category)
+    except importer.StatementError as e:
+        sys.exit(f"Import failed: {e}")
+    except importer.ImportedError as e:
+        sys.exit(f"Import incomplete: {e}. Don't import it again.")
+    if not backend.wait_for_writes(SAVE_TIMEOUT):
+        print("Storage can't be reached, so the import is saved offline "
+              "and will be sent the next time the app starts")
+    print(
+        f"Imported {result['imported']} transactions, "
+        f"skipped {result['skipped']}")
+    for category, change in result["changes"].items():
+        print(f"  {category}: {change:+.2f}")
+
+
+def report_command(options):
+    """
+    Prints a user's spending report without any prompts
+    """
+    user = backend.find_user(options.user)
+    if user is None:
+        sys.exit(f"There is no account for {options.user}")
+    store = backend.open_budget(user[2])
+    report = store.spending_report()
+    print_report_totals(report)
+    for month in report.months[::-1][:options.months]:
+        print("")
+        print_month_report(report, month)
+
+
+def schedule_command(options):
+    """
+    Logs every user's recurring transactions that are due, without any
+    prompts. Meant to be run once a day, by cron for example.
+    """
+    today = parse_date(options.date) if options.date else date.today()
+    if today is None:
+        sys.exit(f"{options.date} is not a DD-MM-YY date")
+    results = recurring.run_schedule(
+        backend, today, options.workers, print_progress)
+    if not backend.wait_for_writes(SAVE_TIMEOUT):
+        print("Storage can't be reached, so the transactions are saved "
+              "offline and will be sent the next time the app starts")
+    if not results:
+        print("Nothing is due")
+    for username, logged, skipped, problem in results:
+        print(f"{username}: logged what was due for {logged} recurring "
+              "transactions")
+        if problem is not None:
+            print(f"  But {problem}")
+        for item, reason in skipped:
+            print(f"  Skipped {recurring.describe(item)}: {reason}")
+
+
+def jobs_command(options):
+    """
+    Runs a job over every user's budget, or the users named, without
+    any prompts, and prints a line for each user
+    """
+    today = parse_date(options.date) if options.date else date.today()
+    if today is None:
+        sys.exit(f"{options.date} is not a DD-MM-YY date")
+    job = jobs.JOBS[options.job]
+    outcomes = jobs.run_for_users(
+        options.user or backend.usernames(),
+        lambda username: job(backend, username, today),
+        options.workers, print_progress)
+    failed = 0
+    for username, line, error in outcomes:
+        if error is None:
+            print(f"{username}: {line}")
+        else:
+            failed += 1
+            print(f"{username}: failed, {error!r}")
+    print(f"{len(outcomes) - failed} users done, {failed} failed")
+    if failed:
+        sys.exit(1)
+
+
+def print_progress(done, total):
+    """
+    Shows how many users a command line job has got through so far on
+    stderr, so it stays out of the results. A terminal sees one line
+    counting up, and a log a line every PROGRESS_EVERY users.
+    """
+    if sys.stderr.isatty():
+        sys.stderr.write(f"\r{done}/{total} users done")
+        if done == total:
+            sys.stderr.write("\n")
+    elif done % PROGRESS_EVERY == 0 or done == total:
+        sys.stderr.write(f"{done}/{total} users done\n")
+    sys.stderr.flush()
+
+
+def serve_command(options):
+    """
+    Runs the app for many terminals at once from this one process
+    """
+    backend.warm_up()
+    sessions.serve(run_app, options.host, options.port)
+
+
+def main(args):
+    """
+    Runs a command line tool, or the interactive app if none is given
+    """
+    parser = argparse.ArgumentParser(
+        prog="run.py", description="Commandline BudgetApp")
+    parser.add_argument(
+        "--pacing", choices=pacing.MODES,
+        help="animated (the default), fast, or none for no pauses")
+    parser.add_argument(
+        "--trace", metavar="PATH",
+        help="time every screen and Google Sheets call, "
+             "appending them to this JSON lines file")
+    commands = parser.add_subparsers(dest="command")
+
+    import_parser = commands.add_parser(
+        "import", help="import a CSV or OFX bank statement")
+    import_parser.add_argument(
+        "--user", required=True, help="username or email of the account")
+    import_parser.add_argument(
+        "--default-category",
+        help="category for payments whose category isn't in the budget")
+    import_parser.add_argument(
+        "--income-category", help="category that income is added to")
+    import_parser.add_argument("statement", help="a .csv or .ofx file")
+    import_parser.set_defaults(run=import_command)
+
+    report_parser = commands.add_parser(
+        "report", help="print a spending report for a user's budget")
+    report_parser.add_argument(
+        "--user", required=True, help="username or email of the account")
+    report_parser.add_argument(
+        "--months", type=int, default=3,
+        help="how many months to show, latest first (3 by default)")
+    report_parser.set_defaults(run=report_command)
+
+    schedule_parser = commands.add_parser(
+        "schedule",
+        help="log every user's recurring transactions that are due")
+    schedule_parser.add_argument(
+        "--date", help="log what is due by this DD-MM-YY date (today by "
+                       "default)")
+    schedule_parser.add_argument(
+        "--workers", type=int,
+        help="how many users to work on at once (by default as many as "
+             "the Google Sheets quota allows)")
+    schedule_parser.set_defaults(run=schedule_command)
+
+    jobs_parser = commands.add_parser(
+        "jobs", help="run a job over every user's budget")
+    jobs_parser.add_argument("job", choices=list(jobs.JOBS))
+    jobs_parser.add_argument(
+        "--user", action="append",
+        help="only this username (can be given more than once)")
+    jobs_parser.add_argument(
+        "--date", help="run as if today were this DD-MM-YY date")
+    jobs_parser.add_argument(
+        "--workers", type=int,
+        help="how many users to work on at once (by default as many as "
+             "the Google Sheets quota allows)")
+    jobs_parser.set_defaults(run=jobs_command)
+
+    serve_parser = commands.add_parser(
+        "serve", help="serve many terminals from one process")
+    serve_parser.add_argument(
+        "--host", default="127.0.0.1", help="address to listen on")
+    serve_parser.add_argument(
+        "--port", type=int, default=8765, help="port to listen on")
+    serve_parser.set_defaults(run=serve_command)
+
+    options = parser.parse_args(args)
+    if options.pacing:
+        pacing.set_mode(options.pacing)
+    if options.trace:
+        tracing.start(options.trace)
+    if options.command is None:
+        run_app()
+        backend.wait_for_writes(SAVE_TIMEOUT)
+    else:
+        options.run(options)
 
 
-startup_prompt()
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,87 @@
+"""
+Stand-ins shared by the tests: a backend whose stores can be made to
+fail, a clock to put in place of the time module, and SQLite and Google
+Sheets backends with a user's budget ready to use. The Google Sheets
+one is kept in benchmarks.fake_sheets.
+"""
+from benchmarks.fake_sheets import CallLog, FakeSpreadsheet
+from budgetapp.sqlite_storage import SqliteBackend
+from budgetapp.storage import SheetsBackend
+
+
+class Flaky:
+    """
+    Wraps an object so that calls to the methods named in failing raise
+    ConnectionError, as if storage couldn't be reached. calls counts
+    the calls made to each method that got through.
+    """
+
+    def __init__(self, target, failing=None, calls=None):
+        self._target = target
+        self.failing = failing if failing is not None else set()
+        self.calls = calls if calls is not None else {}
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            if name in self.failing:
+                raise ConnectionError(f"{name} failed")
+            self.calls[name] = self.calls.get(name, 0) + 1
+            result = attribute(*args, **kwargs)
+            if name in ("open_budget", "create_budget"):
+                # Stores share the backend's failures
+                return Flaky(result, self.failing, self.calls)
+            return result
+        return call
+
+    def batch_changes(self):
+        # Looked up on the wrapper, so start and commit go through it
+        return type(self._target).batch_changes(self)
+
+
+class FakeClock:
+    """
+    Stands in for the time module: sleeping moves the clock on at once
+    and is noted in sleeps
+    """
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def sqlite_budget(username="ann", categories=(("Rent", 1000),)):
+    """
+    Returns a SQLite backend in memory with one user, whose budget has
+    these [name, amount] categories
+    """
+    backend = SqliteBackend(":memory:")
+    backend.add_user(["Ann", username + "@example.com", username, "pw"])
+    backend.create_budget(username).add_categories(
+        [list(category) for category in categories])
+    return backend
+
+
+def sheets_budget(username="ann", categories=(("Rent", 1000),)):
+    """
+    Returns a Google Sheets backend on a FakeSpreadsheet with one user,
+    whose budget has these [name, amount] categories, and the
+    FakeSpreadsheet
+    """
+    spreadsheet = FakeSpreadsheet(CallLog())
+    spreadsheet.add_rows("users", [])
+    backend = SheetsBackend(lambda: spreadsheet)
+    backend.add_user(["Ann", username + "@example.com", username, "pw"])
+    backend.create_budget(username).add_categories(
+        [list(category) for category in categories])
+    return backend, spreadsheet
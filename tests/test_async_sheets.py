@@ -0,0 +1,115 @@
+import asyncio
+import unittest
+from unittest import mock
+from urllib.parse import unquote
+import httpx
+from benchmarks.fake_sheets import FakeWorksheet
+from budgetapp import async_sheets, ratelimit, storage
+from tests.helpers import sheets_budget
+
+
+class Credentials:
+    valid = True
+    token = "token"
+
+
+class FakeAPI:
+    """
+    Answers the metadata and value reads of the Sheets API from a
+    FakeSpreadsheet, noting the ranges asked for
+    """
+
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        self.ranges = []
+
+    def values(self, range_name):
+        self.ranges.append(range_name)
+        title, _, cells = range_name.rpartition("!")
+        worksheet = self.spreadsheet.worksheets[title.strip("'")]
+        return {"values": worksheet._values(cells)}
+
+    def handle(self, request):
+        path = unquote(request.url.path)
+        if path.endswith("/values:batchGet"):
+            return httpx.Response(200, json={"valueRanges": [
+                self.values(range_name)
+                for range_name in request.url.params.get_list("ranges")]})
+        if "/values/" in path:
+            return httpx.Response(
+                200, json=self.values(path.partition("/values/")[2]))
+        return httpx.Response(200, json={"sheets": [
+            {"properties": {
+                "sheetId": sheet_id, "title": title, "gridProperties": {
+                    "rowCount": worksheet.row_count,
+                    "columnCount": worksheet.col_count}}}
+            for sheet_id, (title, worksheet) in enumerate(
+                self.spreadsheet.worksheets.items())]})
+
+
+class ReadBudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        _, self.fake = sheets_budget(categories=[["Rent", 1000]])
+        self.fake.worksheets["ann_transactions"] = FakeWorksheet(
+            self.fake.log, "ann_transactions",
+            [storage.TRANSACTION_HEADER] + [
+                [str(-n), "Shop", "01-10-26", "Rent"]
+                for n in range(1, 301)])
+        self.api = FakeAPI(self.fake)
+        spreadsheet = async_sheets.AsyncSpreadsheet(
+            Credentials(), "sheet-id",
+            transport=httpx.MockTransport(self.api.handle))
+        self.backend = async_sheets.AsyncSheetsBackend(
+            lambda: async_sheets.BlockingSpreadsheet(
+                spreadsheet, async_sheets.LoopThread()))
+
+    def test_only_the_bottom_of_the_transactions_is_read(self):
+        store = self.backend.open_budget("ann")
+        self.assertEqual(store.category_amounts(), ["1000"])
+        self.assertEqual(store.transaction_count(), 300)
+        self.assertEqual(store.recent_transactions(1)[0][0], "-300")
+        first_row = 300 + 1 - storage.TAIL_ROWS + 1
+        self.assertEqual(
+            [range_name for range_name in self.api.ranges
+             if range_name.startswith("'ann_transactions'")],
+            [f"'ann_transactions'!A{first_row}:D"])
+
+
+class NetworkErrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = []
+        # No waiting for tokens or between retries
+        for patch in (mock.patch.object(ratelimit.TokenBucket, "take"),
+                      mock.patch.object(
+                          ratelimit, "retry_delay", return_value=0)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def handle(self, request):
+        self.requests.append(request.method)
+        raise httpx.ConnectError("Network is unreachable", request=request)
+
+    def call(self, method_name, http_method):
+        spreadsheet = async_sheets.AsyncSpreadsheet(
+            Credentials(), "sheet-id",
+            transport=httpx.MockTransport(self.handle))
+        with self.assertRaises(async_sheets.SheetsAPIError) as caught:
+            asyncio.run(spreadsheet._request(
+                method_name, http_method, "https://example.com"))
+        self.assertIsInstance(
+            caught.exception, async_sheets.SheetsConnectionError)
+        self.assertIsNone(ratelimit.status_code(caught.exception))
+
+    def test_reads_are_retried_then_raise_a_sheets_error(self):
+        self.call("get", "GET")
+        self.assertEqual(len(self.requests), ratelimit.MAX_RETRIES + 1)
+
+    def test_appends_are_not_sent_twice(self):
+        self.call("append_rows", "POST")
+        self.assertEqual(self.requests, ["POST"])
+
+
+if __name__ == "__main__":
+    unittest.main()
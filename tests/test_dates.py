@@ -0,0 +1,56 @@
+import unittest
+from datetime import date
+from budgetapp.dates import DateIndex, date_ordinal, parse_date
+
+LEDGER = [
+    ["-1", "A", "15-10-26", "Food"],
+    ["-2", "B", "01-10-26", "Rent"],
+    ["-3", "C", "not a date", "Food"],
+    ["-4", "D", "15-10-26", "Food"],
+    ["-5", "E", "30-09-2026", "Food"],
+]
+
+
+class ParseDateTest(unittest.TestCase):
+
+    def test_two_and_four_digit_years(self):
+        self.assertEqual(parse_date("01-10-26"), date(2026, 10, 1))
+        self.assertEqual(parse_date(" 01-10-2026 "), date(2026, 10, 1))
+
+    def test_anything_else_is_none(self):
+        for text in ["", "2026-10-01", "32-01-26", "not a date", None]:
+            with self.subTest(text=text):
+                self.assertIsNone(parse_date(text))
+                self.assertIsNone(date_ordinal(text))
+
+    def test_ordinals_sort_by_date(self):
+        self.assertLess(date_ordinal("31-12-25"), date_ordinal("01-01-26"))
+
+
+class DateIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = DateIndex(LEDGER)
+
+    def test_transactions_between_dates_in_date_order(self):
+        self.assertEqual(
+            self.index.between(date(2026, 9, 30), date(2026, 10, 15)),
+            [4, 1, 0, 3])
+        self.assertEqual(
+            self.index.between(date(2026, 10, 2), date(2026, 10, 14)), [])
+
+    def test_unreadable_dates_are_left_out(self):
+        self.assertNotIn(
+            2, self.index.between(date(1, 1, 1), date(9999, 12, 31)))
+
+    def test_added_transactions_match_an_index_built_at_once(self):
+        index = DateIndex()
+        for position, transaction in enumerate(LEDGER):
+            index.add(position, transaction)
+        self.assertEqual(
+            (index.ordinals, index.positions),
+            (self.index.ordinals, self.index.positions))
+
+
+if __name__ == "__main__":
+    unittest.main()
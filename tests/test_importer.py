@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+from budgetapp import importer
+from tests.helpers import Flaky, sqlite_budget
+
+STATEMENT = """Date,Description,Amount,Category
+01/10/2026,Landlord,-500.00,Rent
+02/10/2026,Cafe,(4.50),Coffee
+03/10/2026,Employer,"1,000.00",
+not a date,Broken,-1,Rent
+"""
+
+
+class ImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.real = sqlite_budget(
+            categories=[["Rent", 1000], ["Food", 100], ["Income", 0]])
+        self.store = Flaky(self.real.open_budget("ann"))
+        self.directory = tempfile.mkdtemp()
+
+    def statement(self, text, name="statement.csv"):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as file:
+            file.write(text if isinstance(text, bytes) else text.encode())
+        return path
+
+    def import_text(self, text, **options):
+        return importer.import_statement(
+            self.store, self.statement(text),
+            default_category="Food", income_category="Income", **options)
+
+    def budget(self):
+        store = self.real.open_budget("ann")
+        return store.category_amounts(), store.get_transactions()
+
+    def test_statement_is_imported_in_one_append(self):
+        result = self.import_text(STATEMENT)
+        self.assertEqual((result["imported"], result["skipped"]), (3, 1))
+        self.assertEqual(
+            result["changes"],
+            {"Rent": Decimal("-500.00"), "Food": Decimal("-4.50"),
+             "Income": Decimal("1000.00")})
+        amounts, transactions = self.budget()
+        self.assertEqual(amounts, ["500", "95.5", "1000"])
+        self.assertEqual(transactions[1], ["-4.5", "Cafe", "02-10-26", "Food"])
+        self.assertEqual(self.store.calls["append_transactions"], 1)
+
+    def test_unreadable_file_writes_nothing(self):
+        text = STATEMENT.encode() + b"04/10/2026,\xff\xfe,-1,Rent\n"
+        with self.assertRaises(UnicodeDecodeError):
+            self.import_text(text)
+        self.assertEqual(self.budget(), (["1000", "100", "0"], []))
+
+    def test_missing_columns_are_reported(self):
+        with self.assertRaises(importer.StatementError):
+            self.import_text("Description,Category\nCafe,Food\n")
+
+    def test_failed_append_writes_nothing(self):
+        self.store.failing.add("append_transactions")
+        with self.assertRaises(ConnectionError):
+            self.import_text(STATEMENT)
+        self.assertEqual(self.budget(), (["1000", "100", "0"], []))
+
+    def test_failed_category_change_is_reported(self):
+        self.store.failing.add("commit_batch")
+        with self.assertRaises(importer.ImportedError):
+            self.import_text(STATEMENT)
+        amounts, transactions = self.budget()
+        self.assertEqual(amounts, ["1000", "100", "0"])
+        self.assertEqual(len(transactions), 3)
+
+    def test_statement_is_written_a_chunk_at_a_time(self):
+        result = self.import_text(STATEMENT, chunk_size=2)
+        self.assertEqual((result["imported"], result["skipped"]), (3, 1))
+        self.assertEqual(self.store.calls["append_transactions"], 2)
+        self.assertEqual(self.store.calls["commit_batch"], 2)
+        self.assertEqual(self.budget()[0], ["500", "95.5", "1000"])
+
+    def test_failed_later_chunk_keeps_the_budget_in_step(self):
+        append_transactions = self.store.append_transactions
+
+        def append_once(rows):
+            append_transactions(rows)
+            self.store.failing.add("append_transactions")
+        self.store.append_transactions = append_once
+        with self.assertRaises(importer.ImportedError):
+            self.import_text(STATEMENT, chunk_size=2)
+        amounts, transactions = self.budget()
+        # The first chunk is written with its category changes
+        self.assertEqual(amounts, ["500", "95.5", "0"])
+        self.assertEqual(len(transactions), 2)
+
+    def test_ofx_statement(self):
+        path = self.statement(
+            "<OFX><STMTTRN><TRNAMT>-12.00<DTPOSTED>20261005120000[0:GMT]"
+            "<NAME>Grocer</STMTTRN></OFX>\n", "statement.ofx")
+        result = importer.import_statement(
+            self.store, path, default_category="Food")
+        self.assertEqual(result["imported"], 1)
+        self.assertEqual(
+            self.budget()[1], [["-12", "Grocer", "05-10-26", "Food"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
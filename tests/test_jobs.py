@@ -0,0 +1,74 @@
+import threading
+import unittest
+from datetime import date
+from decimal import Decimal
+from budgetapp import jobs
+from tests.helpers import sqlite_budget
+
+
+class RunForUsersTest(unittest.TestCase):
+
+    def test_results_come_back_in_order_with_errors(self):
+        def work(username):
+            if username == "bob":
+                raise ValueError("no budget")
+            return username.upper()
+        outcomes = jobs.run_for_users(
+            ["ann", "bob", "cat", "ann"], work, workers=2)
+        self.assertEqual(
+            [outcome[:2] for outcome in outcomes],
+            [["ann", "ANN"], ["bob", None], ["cat", "CAT"]])
+        self.assertIsNone(outcomes[0][2])
+        self.assertIsInstance(outcomes[1][2], ValueError)
+
+    def test_users_are_worked_on_at_once(self):
+        # Each user waits for the others, so this only ends if they
+        # are all running together
+        barrier = threading.Barrier(3, timeout=5)
+        outcomes = jobs.run_for_users(
+            ["ann", "bob", "cat"], lambda username: barrier.wait(),
+            workers=3)
+        self.assertEqual([outcome[2] for outcome in outcomes],
+                         [None, None, None])
+
+    def test_progress_counts_every_user(self):
+        progress = []
+        jobs.run_for_users(
+            ["ann", "bob"], str, workers=1,
+            progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+
+    def test_default_workers_stay_within_the_limit(self):
+        self.assertTrue(1 <= jobs.default_workers() <= jobs.MAX_WORKERS)
+
+
+class JobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = sqlite_budget(categories=[["Rent", 500], ["Food", 0]])
+        store = self.backend.open_budget("ann")
+        store.change_category_amount(2, -20)
+        store.append_transactions([
+            [Decimal("1000"), "Employer", "01-09-26", "Income"],
+            [Decimal("-500"), "Landlord", "02-09-26", "Rent"],
+            [Decimal("-20"), "Grocer", "03-09-26", "Food"],
+        ])
+
+    def test_reconcile(self):
+        self.assertEqual(
+            jobs.reconcile(self.backend, "ann", date(2026, 10, 18)),
+            "budgeted £480.00, transactions add up to £480.00, "
+            "difference £0.00, overspent in Food")
+
+    def test_month_end(self):
+        self.assertEqual(
+            jobs.month_end(self.backend, "ann", date(2026, 10, 18)),
+            "Sep 2026: income £1000.00, spending £520.00, "
+            "most on Rent (£500.00)")
+        self.assertEqual(
+            jobs.month_end(self.backend, "ann", date(2026, 12, 1)),
+            "no transactions in Nov 2026")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+from decimal import Decimal
+from budgetapp.money import to_money
+
+
+class ToMoneyTest(unittest.TestCase):
+
+    def test_text_is_read_as_pounds(self):
+        self.assertEqual(to_money("12.5"), Decimal("12.50"))
+        self.assertEqual(to_money("£1,234.50"), Decimal("1234.50"))
+        self.assertEqual(to_money(" -7 "), Decimal("-7.00"))
+        self.assertEqual(to_money(3), Decimal("3.00"))
+
+    def test_rounds_half_up_to_the_penny(self):
+        self.assertEqual(to_money("0.005"), Decimal("0.01"))
+        self.assertEqual(to_money("0.004"), Decimal("0.00"))
+        self.assertEqual(to_money("-0.005"), Decimal("-0.01"))
+
+    def test_floats_do_not_drift(self):
+        total = sum((to_money("0.1") for _ in range(10)), Decimal(0))
+        self.assertEqual(total, Decimal("1.00"))
+
+    def test_anything_else_is_a_value_error(self):
+        for value in ["", "abc", "nan", "inf", "-Infinity", "1.2.3", None,
+                      "1e30", "99999999999999999999999999999",
+                      Decimal("1e30"), "-1e15"]:
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    to_money(value)
+
+    def test_large_amounts_below_the_limit(self):
+        self.assertEqual(
+            to_money("999999999999999.99"), Decimal("999999999999999.99"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from decimal import Decimal
+from unittest import mock
+from budgetapp import offline
+from budgetapp.storage import ConflictError
+from tests.helpers import Flaky, sqlite_budget
+
+
+def wait_until(condition, timeout=5):
+    """
+    Waits for the outbox's thread to make condition true
+    """
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.retry_delay = offline.RETRY_DELAY
+        offline.RETRY_DELAY = 0.01
+        self.directory = tempfile.mkdtemp()
+        self.real = sqlite_budget()
+        self.backend = Flaky(self.real)
+        self.offline = offline.OfflineBackend(self.backend, self.directory)
+        self.store = self.offline.open_budget("ann")
+        self.outbox = self.offline._outboxes["ann"]
+
+    def tearDown(self):
+        offline.RETRY_DELAY = self.retry_delay
+        self.outbox.close()
+
+    def real_transactions(self):
+        return self.real.open_budget("ann").get_transactions()
+
+    def test_writes_reach_the_real_store(self):
+        self.store.change_category_amount(1, -100)
+        self.store.append_transaction(
+            [Decimal("-100"), "Landlord", "01-10-26", "Rent"])
+        self.assertTrue(self.offline.wait_for_writes(5))
+        self.assertEqual(
+            self.real.open_budget("ann").category_amounts(), ["900"])
+        self.assertEqual(
+            self.real_transactions(),
+            [["-100", "Landlord", "01-10-26", "Rent"]])
+
+    def test_failed_read_back_does_not_send_again(self):
+        # The append gets through, then reading the budget back fails
+        self.backend.failing.add("transaction_count")
+        self.store.append_transaction(
+            [Decimal("-5"), "Shop", "01-10-26", "Rent"])
+        self.assertTrue(self.offline.wait_for_writes(5))
+        time.sleep(0.1)
+        self.backend.failing.clear()
+        wait_until(lambda: not self.outbox._lines)
+        self.assertEqual(len(self.real_transactions()), 1)
+        self.assertEqual(self.store.transaction_count(), 1)
+        self.assertEqual(self.backend.calls["append_transactions"], 1)
+
+    def test_sent_lines_are_not_sent_again_after_a_restart(self):
+        self.backend.failing.add("transaction_count")
+        self.store.append_transaction(
+            [Decimal("-5"), "Shop", "01-10-26", "Rent"])
+        self.assertTrue(self.offline.wait_for_writes(5))
+        self.outbox.close()
+        self.backend.failing.clear()
+
+        reopened = offline.OfflineBackend(self.backend, self.directory)
+        store = reopened.open_budget("ann")
+        self.outbox = reopened._outboxes["ann"]
+        self.assertEqual(store.transaction_count(), 1)
+        wait_until(lambda: not self.outbox._lines)
+        self.assertEqual(len(self.real_transactions()), 1)
+
+    def test_unsent_lines_are_kept_while_the_store_is_down(self):
+        self.backend.failing.update(
+            ["append_transactions", "start_batch"])
+        self.store.change_category_amount(1, -10)
+        self.store.append_transaction(
+            [Decimal("-10"), "Shop", "01-10-26", "Rent"])
+        self.assertFalse(self.offline.wait_for_writes(0.1))
+        self.assertEqual(self.store.category_amounts(), ["990"])
+        self.assertEqual(self.real_transactions(), [])
+        self.backend.failing.clear()
+        self.assertTrue(self.offline.wait_for_writes(5))
+        self.assertEqual(len(self.real_transactions()), 1)
+
+    def test_ledger_file_is_appended_to(self):
+        self.store.append_transaction(
+            [Decimal("-1"), "Shop", "01-10-26", "Rent"])
+        wait_until(lambda: not self.outbox._lines)
+        path = os.path.join(self.directory, "ann")
+        size = os.path.getsize(path + ".ledger")
+        self.store.append_transaction(
+            [Decimal("-2"), "Shop", "02-10-26", "Rent"])
+        wait_until(lambda: not self.outbox._lines)
+        with open(path + ".ledger", encoding="utf-8") as file:
+            self.assertEqual(len(file.read(size).splitlines()), 1)
+        with open(path + ".json", encoding="utf-8") as file:
+            checkpoint = json.load(file)
+        self.assertNotIn("transactions", checkpoint)
+        self.assertEqual(
+            checkpoint["ledger"], os.path.getsize(path + ".ledger"))
+
+    def test_failed_open_lets_go_of_the_log(self):
+        directory = tempfile.mkdtemp()
+        self.backend.failing.add("open_budget")
+        failure = None
+        try:
+            offline.Outbox(self.backend, "ann", directory)
+        except ConnectionError as error:
+            # Its traceback keeps the half made outbox alive
+            failure = error
+        self.assertIsInstance(failure, ConnectionError)
+        self.backend.failing.clear()
+        offline.Outbox(self.backend, "ann", directory).close()
+
+    def test_conflicts_are_sent_again_after_a_backoff(self):
+        store = self.outbox._store
+        append_transactions = store.append_transactions
+        attempts = []
+
+        def conflict_once(rows):
+            attempts.append(rows)
+            if len(attempts) == 1:
+                raise ConflictError("Changed in another session", store)
+            append_transactions(rows)
+        store.append_transactions = conflict_once
+        with mock.patch.object(
+                offline.ratelimit, "retry_delay", return_value=0) as delay:
+            self.store.append_transaction(
+                [Decimal("-1"), "Shop", "01-10-26", "Rent"])
+            self.assertTrue(self.offline.wait_for_writes(5))
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(delay.call_args[0][0], 0)
+        self.assertEqual(len(self.real_transactions()), 1)
+
+    def test_view_shares_the_transactions(self):
+        self.assertIs(self.outbox.view()[1], self.outbox.view()[1])
+        self.store.append_transaction(
+            [Decimal("-1"), "Shop", "01-10-26", "Rent"])
+        self.assertEqual(
+            self.store.search_transactions(institution="shop"),
+            [["-1", "Shop", "01-10-26", "Rent"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from budgetapp import ratelimit
+from tests.helpers import FakeClock
+
+
+class Refused(Exception):
+    """
+    An error with a response, as gspread's APIError has
+    """
+
+    def __init__(self, status, headers=None):
+        super().__init__(status)
+        self.response = SimpleNamespace(
+            status_code=status, headers=headers or {})
+
+
+class ClockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patch = mock.patch.object(ratelimit, "time", self.clock)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+
+class TokenBucketTest(ClockTest):
+
+    def test_a_burst_is_let_through_then_spread_out(self):
+        bucket = ratelimit.TokenBucket(60)
+        self.assertEqual(bucket.capacity, ratelimit.BURST_SECONDS)
+        for _ in range(ratelimit.BURST_SECONDS):
+            bucket.take()
+        self.assertEqual(self.clock.sleeps, [])
+        bucket.take()
+        # One token a second at 60 a minute
+        self.assertEqual(self.clock.sleeps, [1])
+
+    def test_tokens_come_back_with_time_up_to_the_burst(self):
+        bucket = ratelimit.TokenBucket(60)
+        for _ in range(ratelimit.BURST_SECONDS):
+            bucket.take()
+        self.clock.now += 3
+        for _ in range(3):
+            bucket.take()
+        self.assertEqual(self.clock.sleeps, [])
+        self.clock.now += 3600
+        for _ in range(ratelimit.BURST_SECONDS):
+            bucket.take()
+        self.assertEqual(self.clock.sleeps, [])
+        bucket.take()
+        self.assertEqual(len(self.clock.sleeps), 1)
+
+    def test_a_slow_rate_still_allows_one_call(self):
+        bucket = ratelimit.TokenBucket(3)
+        self.assertEqual(bucket.capacity, 1)
+        bucket.take()
+        bucket.take()
+        self.assertEqual(self.clock.sleeps, [20])
+
+
+class RetryTest(ClockTest):
+
+    def setUp(self):
+        super().setUp()
+        patch = mock.patch.dict(ratelimit.buckets, {
+            "read": ratelimit.TokenBucket(6000),
+            "write": ratelimit.TokenBucket(6000)})
+        patch.start()
+        self.addCleanup(patch.stop)
+        # The longest wait the backoff allows, rather than a random one
+        patch = mock.patch.object(
+            ratelimit.random, "uniform", lambda low, high: high)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def failing(self, *errors):
+        """
+        Returns a function that raises errors in turn, then returns 'ok'
+        """
+        errors = list(errors)
+
+        def call():
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+        return call
+
+    def test_quota_errors_are_retried_with_a_growing_wait(self):
+        call = self.failing(Refused(429), Refused(429), Refused(429))
+        self.assertEqual(ratelimit.call("append_rows", call), "ok")
+        self.assertEqual(self.clock.sleeps, [1, 2, 4])
+
+    def test_wait_never_passes_the_maximum(self):
+        self.assertEqual(
+            ratelimit.retry_delay(10, Refused(429)), ratelimit.MAX_DELAY)
+
+    def test_retry_after_is_used_when_sent(self):
+        call = self.failing(Refused(429, {"Retry-After": "7"}))
+        self.assertEqual(ratelimit.call("get", call), "ok")
+        self.assertEqual(self.clock.sleeps, [7])
+
+    def test_gives_up_after_the_last_retry(self):
+        call = self.failing(*[
+            Refused(429) for _ in range(ratelimit.MAX_RETRIES + 1)])
+        with self.assertRaises(Refused):
+            ratelimit.call("get", call)
+        self.assertEqual(len(self.clock.sleeps), ratelimit.MAX_RETRIES)
+
+    def test_server_errors_only_retry_what_is_safe_to_repeat(self):
+        self.assertEqual(
+            ratelimit.call("get", self.failing(Refused(503))), "ok")
+        with self.assertRaises(Refused):
+            ratelimit.call("append_rows", self.failing(Refused(503)))
+        with self.assertRaises(Refused):
+            ratelimit.call("get", self.failing(Refused(400)))
+        self.assertEqual(self.clock.sleeps, [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
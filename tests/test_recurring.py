@@ -0,0 +1,121 @@
+import unittest
+from datetime import date
+from decimal import Decimal
+from budgetapp import recurring
+from tests.helpers import Flaky, sqlite_budget
+
+
+class PlanTest(unittest.TestCase):
+
+    def test_fixed_amounts_come_off_before_percentages(self):
+        plan = [["Rent", "500"], ["Food", "50%"], ["Savings", "50%"]]
+        self.assertTrue(recurring.plan_is_complete("1000", plan))
+        self.assertEqual(
+            recurring.split_income("1000", plan),
+            [["Rent", Decimal("500.00")], ["Food", Decimal("250.00")],
+             ["Savings", Decimal("250.00")]])
+
+    def test_rounding_pennies_go_to_the_last_percentage(self):
+        plan = [["A", "33.33%"], ["B", "33.33%"], ["C", "33.34%"],
+                ["Rent", "10"]]
+        parts = recurring.split_income("10.10", plan)
+        self.assertEqual(sum(part for _, part in parts), Decimal("10.10"))
+        self.assertEqual(
+            [part for _, part in parts[:3]],
+            [Decimal("0.03"), Decimal("0.03"), Decimal("0.04")])
+
+    def test_incomplete_plans(self):
+        self.assertFalse(recurring.plan_is_complete("100", [["A", "90"]]))
+        self.assertFalse(recurring.plan_is_complete("100", [["A", "90%"]]))
+        self.assertTrue(recurring.plan_is_complete("100", [["A", "100"]]))
+
+
+class DueDatesTest(unittest.TestCase):
+
+    def test_missed_dates_are_caught_up(self):
+        item = recurring.new_item(
+            "ann", "payment", "Gym", "10", "Rent", "weekly", "01-10-26")
+        dates, next_due = recurring.due_dates(item, date(2026, 10, 15))
+        self.assertEqual(
+            dates, [date(2026, 10, 1), date(2026, 10, 8),
+                    date(2026, 10, 15)])
+        self.assertEqual(next_due, date(2026, 10, 22))
+
+    def test_monthly_dates_keep_their_day(self):
+        self.assertEqual(
+            recurring.next_date(date(2026, 12, 28), "monthly"),
+            date(2027, 1, 28))
+        self.assertEqual(
+            recurring.next_date(date(2026, 1, 31), "monthly"),
+            date(2026, 2, 28))
+
+
+class ScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.real = sqlite_budget(
+            categories=[["Rent", 1000], ["Food", 0], ["Savings", 0]])
+        self.backend = Flaky(self.real)
+        self.real.add_recurring_item(recurring.new_item(
+            "ann", "payment", "Landlord", "500", "Rent", "monthly",
+            "01-10-26"))
+        self.real.add_recurring_item(recurring.new_item(
+            "ann", "income", "Job", "1000", "Income", "monthly",
+            "15-10-26", [["Rent", "400"], ["Food", "50%"],
+                         ["Savings", "50%"]]))
+
+    def budget(self):
+        store = self.real.open_budget("ann")
+        return store.category_amounts(), store.get_transactions()
+
+    def test_due_items_are_logged_once(self):
+        results = recurring.run_schedule(self.backend, date(2026, 10, 20))
+        self.assertEqual(results, [["ann", 2, [], None]])
+        amounts, transactions = self.budget()
+        self.assertEqual(amounts, ["900", "300", "300"])
+        self.assertEqual(len(transactions), 2)
+        self.assertEqual(self.backend.calls["append_transactions"], 1)
+        self.assertEqual(
+            recurring.run_schedule(self.backend, date(2026, 10, 20)), [])
+        self.assertEqual(self.budget(), (amounts, transactions))
+
+    def test_failed_append_leaves_the_items_due(self):
+        self.backend.failing.add("append_transactions")
+        results = recurring.run_schedule(self.backend, date(2026, 10, 20))
+        self.assertEqual(results[0][1], 0)
+        self.assertEqual(self.budget(), (["1000", "0", "0"], []))
+        self.assertEqual(
+            [item[6] for item in self.real.recurring_items()],
+            ["01-10-26", "15-10-26"])
+
+        self.backend.failing.clear()
+        recurring.run_schedule(self.backend, date(2026, 10, 20))
+        amounts, transactions = self.budget()
+        self.assertEqual(amounts, ["900", "300", "300"])
+        self.assertEqual(len(transactions), 2)
+
+    def test_failed_category_change_is_not_logged_again(self):
+        self.backend.failing.add("commit_batch")
+        results = recurring.run_schedule(self.backend, date(2026, 10, 20))
+        self.assertIn("categories couldn't be changed", results[0][3])
+        self.assertEqual(
+            [item[6] for item in self.real.recurring_items()],
+            ["01-11-26", "15-11-26"])
+
+        self.backend.failing.clear()
+        self.assertEqual(
+            recurring.run_schedule(self.backend, date(2026, 10, 20)), [])
+        self.assertEqual(len(self.budget()[1]), 2)
+
+    def test_item_with_a_deleted_category_is_skipped(self):
+        self.real.add_recurring_item(recurring.new_item(
+            "ann", "payment", "Gym", "10", "Gone", "weekly", "01-10-26"))
+        results = recurring.run_schedule(self.backend, date(2026, 10, 20))
+        (username, logged, skipped, problem), = results
+        self.assertEqual((logged, problem), (2, None))
+        self.assertEqual(skipped[0][1], "there is no Gone category")
+        self.assertEqual(self.real.recurring_items()[2][6], "01-10-26")
+
+
+if __name__ == "__main__":
+    unittest.main()
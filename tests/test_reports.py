@@ -0,0 +1,131 @@
+import time
+import unittest
+from decimal import Decimal
+from unittest import mock
+from budgetapp import reports
+from budgetapp.reports import LedgerTotals, SpendingReport
+from tests.helpers import sheets_budget, sqlite_budget
+
+LEDGER = [
+    ["1000", "Employer", "01-09-26", "Income"],
+    ["-500", "Landlord", "02-09-26", "Rent"],
+    ["-20.50", "Grocer", "03-09-26", "Food"],
+    ["1000", "Employer", "01-10-26", "Income"],
+    ["-500", "Landlord", "02-10-26", "Rent"],
+    ["-45.25", "Grocer", "05-10-26", "Food"],
+    ["-4.50", "Cafe", "06-10-26", "Coffee"],
+    ["-10", "Cafe", "not a date", "Coffee"],
+    ["rubbish", "Nobody", "07-10-26", "Food"],
+]
+SEPTEMBER = 2026 * 12 + 8
+OCTOBER = SEPTEMBER + 1
+
+
+def summary(report):
+    """
+    Returns everything a report works out, to compare two of them
+    """
+    return (
+        report.transaction_count, report.income, report.spending,
+        report.months, report.month_income, report.month_spending,
+        report.category_spending, report.top_institutions)
+
+
+class SpendingReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.report = SpendingReport(LEDGER)
+
+    def test_totals(self):
+        self.assertEqual(self.report.transaction_count, 9)
+        self.assertEqual(self.report.income, Decimal("2000.00"))
+        self.assertEqual(self.report.spending, Decimal("1080.25"))
+        self.assertEqual(
+            self.report.top_institutions,
+            [["Landlord", Decimal("1000.00")], ["Grocer", Decimal("65.75")],
+             ["Cafe", Decimal("14.50")]])
+
+    def test_months(self):
+        self.assertEqual(self.report.months, [SEPTEMBER, OCTOBER])
+        self.assertEqual(
+            self.report.month_spending,
+            {SEPTEMBER: Decimal("520.50"), OCTOBER: Decimal("549.75")})
+        self.assertEqual(
+            self.report.category_spending[OCTOBER],
+            {"Rent": Decimal("500.00"), "Food": Decimal("45.25"),
+             "Coffee": Decimal("4.50")})
+        self.assertEqual(
+            self.report.spending_change(OCTOBER), Decimal("29.25"))
+        self.assertIsNone(self.report.spending_change(SEPTEMBER))
+
+    def test_category_changes(self):
+        self.assertEqual(
+            self.report.category_changes(OCTOBER),
+            [["Food", Decimal("24.75")], ["Coffee", Decimal("4.50")],
+             ["Rent", Decimal("0.00")]])
+        self.assertEqual(self.report.category_changes(SEPTEMBER), [])
+
+    def test_empty_ledger(self):
+        report = SpendingReport([])
+        self.assertEqual(
+            summary(report),
+            (0, Decimal("0.00"), Decimal("0.00"), [], {}, {}, {}, []))
+
+    def test_totals_added_to_match_totals_built_at_once(self):
+        # New categories turn up part way, so the totals are widened
+        for split in range(len(LEDGER) + 1):
+            with self.subTest(split=split):
+                totals = LedgerTotals(LEDGER[:split])
+                totals.extend(LEDGER[split:])
+                self.assertEqual(
+                    summary(SpendingReport(totals)), summary(self.report))
+
+    def test_totals_without_numpy_match(self):
+        with mock.patch.object(reports, "numpy", None):
+            for split in range(len(LEDGER) + 1):
+                with self.subTest(split=split):
+                    totals = LedgerTotals(LEDGER[:split])
+                    totals.extend(LEDGER[split:])
+                    self.assertEqual(
+                        summary(SpendingReport(totals)),
+                        summary(self.report))
+
+    def test_large_ledger_is_added_up_quickly(self):
+        size = 200000
+        ledger = [
+            [str(-(n % 500 + 1)), f"Shop {n % 40}",
+             f"{n % 28 + 1:02}-{n % 12 + 1:02}-{n % 5 + 22}",
+             f"Category {n % 12}"]
+            for n in range(size)]
+        start = time.perf_counter()
+        totals = LedgerTotals(ledger)
+        # About a tenth of a second, so this only fails if the totals
+        # are added up very much more slowly
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual(totals.count, size)
+        self.assertEqual(
+            sum(totals.spent), sum(n % 500 + 1 for n in range(size)) * 100)
+
+
+class StoreReportTest(unittest.TestCase):
+    """
+    A store's report takes in the transactions logged since the last one
+    """
+
+    def check_store(self, store):
+        store.append_transactions(LEDGER[:4])
+        self.assertEqual(store.spending_report().transaction_count, 4)
+        store.append_transactions(LEDGER[4:])
+        self.assertEqual(
+            summary(store.spending_report()), summary(SpendingReport(LEDGER)))
+
+    def test_sheets_store(self):
+        backend, _ = sheets_budget()
+        self.check_store(backend.open_budget("ann"))
+
+    def test_sqlite_store(self):
+        self.check_store(sqlite_budget().open_budget("ann"))
+
+
+if __name__ == "__main__":
+    unittest.main()
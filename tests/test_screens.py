@@ -0,0 +1,121 @@
+import contextlib
+import io
+import unittest
+import httpx
+from gspread.exceptions import APIError
+from benchmarks.flows import scripted_input
+from budgetapp import pacing
+from budgetapp.async_sheets import SheetsAPIError, SheetsConnectionError
+from tests.helpers import Flaky, sqlite_budget
+import run
+
+
+class ScreenTest(unittest.TestCase):
+    """
+    Runs screens with scripted answers on a SQLite budget
+    """
+
+    def setUp(self):
+        pacing.set_mode("none")
+        self.clear_terminal = run.clear_terminal
+        run.clear_terminal = lambda: None
+        self.real = sqlite_budget(categories=[["Rent", 0], ["Food", 0]])
+        self.store = Flaky(self.real.open_budget("ann"))
+
+    def tearDown(self):
+        run.clear_terminal = self.clear_terminal
+
+    def screen(self, screen, answers, *args):
+        with scripted_input(answers), \
+                contextlib.redirect_stdout(io.StringIO()):
+            return screen(*args)
+
+    def budget(self):
+        store = self.real.open_budget("ann")
+        return store.category_amounts(), store.get_transactions()
+
+
+class IncomeTest(ScreenTest):
+
+    def test_paycheck_is_logged_with_its_delegation(self):
+        next_screen = self.screen(
+            run.add_paycheck,
+            ["100", "Employer", "01-10-26", "1", "60", "2", "40", "2"],
+            self.store)
+        self.assertEqual(next_screen[0], run.home_prompt)
+        self.assertEqual(
+            self.budget(),
+            (["60", "40"], [["100", "Employer", "01-10-26", "Income"]]))
+
+    def test_paycheck_is_not_logged_if_its_delegation_fails(self):
+        self.store.failing.add("commit_batch")
+        with self.assertRaises(ConnectionError):
+            self.screen(
+                run.add_paycheck,
+                ["100", "Employer", "01-10-26", "1", "100"], self.store)
+        self.assertEqual(self.budget(), (["0", "0"], []))
+
+    def test_bank_balance_is_not_logged_if_its_delegation_fails(self):
+        self.store.failing.add("commit_batch")
+        with self.assertRaises(ConnectionError):
+            self.screen(
+                run.add_money_to_new_budget, ["50", "2", "50"], self.store)
+        self.assertEqual(self.budget(), (["0", "0"], []))
+
+
+class AddCategoryTest(ScreenTest):
+
+    def test_a_name_already_taken_is_asked_for_again(self):
+        next_screen = self.screen(
+            run.add_category, ["Rent", "Gifts", "2"], self.store)
+        self.assertEqual(next_screen[0], run.home_prompt)
+        self.assertEqual(self.budget()[0], ["0", "0", "0"])
+        self.assertEqual(
+            self.real.open_budget("ann").category_names(),
+            ["Rent", "Food", "Gifts"])
+
+
+class SheetsErrorTest(ScreenTest):
+
+    def setUp(self):
+        super().setUp()
+        self.home_prompt = run.home_prompt
+        self.shown = []
+        # The dashboard is where the app goes next, so stop there
+        run.home_prompt = self.shown.append
+        self.store = self.real.open_budget("ann")
+        self.refreshed = []
+        self.store.refresh = lambda: self.refreshed.append(True)
+
+    def tearDown(self):
+        super().tearDown()
+        run.home_prompt = self.home_prompt
+
+    def fail_with(self, error):
+        def screen(store):
+            raise error
+        with contextlib.redirect_stdout(io.StringIO()):
+            run.run_app((screen, self.store))
+
+    def test_gspread_error_goes_back_to_the_dashboard(self):
+        response = httpx.Response(
+            503, json={"error": {"code": 503, "message": "Unavailable"}})
+        self.fail_with(APIError(response))
+        self.assertEqual(self.shown, [self.store])
+        self.assertEqual(self.refreshed, [True])
+
+    def test_async_client_error_goes_back_to_the_dashboard(self):
+        self.fail_with(SheetsAPIError(httpx.Response(500, text="Oops")))
+        self.assertEqual(self.shown, [self.store])
+
+    def test_network_drop_goes_back_to_the_dashboard(self):
+        self.fail_with(SheetsConnectionError(httpx.ConnectError("down")))
+        self.assertEqual(self.shown, [self.store])
+
+    def test_other_errors_are_not_caught(self):
+        with self.assertRaises(ZeroDivisionError):
+            self.fail_with(ZeroDivisionError())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from datetime import date
+from decimal import Decimal
+from budgetapp.search import TransactionIndex
+from tests.helpers import sheets_budget, sqlite_budget
+
+LEDGER = [
+    ["-500", "Landlord", "01-10-26", "Rent"],
+    ["-4.50", "Corner Cafe", "15-10-26", "Food"],
+    ["1000", "Employer", "28-09-26", "Income"],
+    ["-12", "CAFE NERO", "02-11-26", "food"],
+    ["-20", "Cafe Nero", "not a date", "Food"],
+]
+SEARCHES = [
+    {},
+    {"institution": "cafe"},
+    {"institution": "cafe", "category": "FOOD"},
+    {"category": "rent"},
+    {"category": "Nothing"},
+    {"min_amount": 10, "max_amount": "500"},
+    {"max_amount": Decimal("4.5")},
+    {"first_date": date(2026, 10, 1)},
+    {"first_date": date(2026, 9, 1), "last_date": date(2026, 10, 15)},
+    {"institution": "nero", "last_date": date(2026, 12, 31)},
+]
+
+
+class TransactionIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TransactionIndex(LEDGER)
+
+    def test_filters(self):
+        self.assertEqual(self.index.search(), [0, 1, 2, 3, 4])
+        self.assertEqual(self.index.search(institution="cafe"), [1, 3, 4])
+        self.assertEqual(self.index.search(category="FOOD"), [1, 3, 4])
+        self.assertEqual(
+            self.index.search(institution="nero", min_amount=15), [4])
+        self.assertEqual(
+            self.index.search(min_amount="12", max_amount=500), [0, 3, 4])
+        self.assertEqual(
+            self.index.search(
+                category="food", first_date=date(2026, 10, 2)), [1, 3])
+        self.assertEqual(self.index.search(institution="nobody"), [])
+
+    def test_added_transactions_are_found(self):
+        index = TransactionIndex()
+        for position, transaction in enumerate(LEDGER):
+            index.add(position, transaction)
+        for filters in SEARCHES:
+            with self.subTest(filters=filters):
+                self.assertEqual(
+                    index.search(**filters), self.index.search(**filters))
+
+
+class StoreSearchTest(unittest.TestCase):
+    """
+    The Google Sheets store searches its index and the SQLite store
+    its database, and both find the same transactions
+    """
+
+    def test_stores_agree(self):
+        sheets = sheets_budget()[0].open_budget("ann")
+        sqlite = sqlite_budget().open_budget("ann")
+        for store in (sheets, sqlite):
+            store.append_transactions(LEDGER[:2])
+            # Built before the rest are appended, then kept up to date
+            store.search_transactions()
+            store.append_transactions(LEDGER[2:])
+        for filters in SEARCHES:
+            with self.subTest(filters=filters):
+                self.assertEqual(
+                    sheets.search_transactions(**filters),
+                    sqlite.search_transactions(**filters))
+
+
+class BackgroundIndexTest(unittest.TestCase):
+    """
+    The index is built after login, before the first search
+    """
+
+    def setUp(self):
+        backend, self.spreadsheet = sheets_budget()
+        backend.open_budget("ann").append_transactions(LEDGER[:3])
+        self.store = backend.open_budget("ann")
+
+    def test_first_search_reads_nothing(self):
+        self.store.index_in_background().join(5)
+        self.spreadsheet.log.reset()
+        self.assertEqual(
+            len(self.store.search_transactions(institution="cafe")), 1)
+        self.assertEqual(sum(self.spreadsheet.log.calls.values()), 0)
+
+    def test_index_keeps_up_with_appends(self):
+        thread = self.store.index_in_background()
+        self.store.append_transactions(LEDGER[3:])
+        thread.join(5)
+        self.assertEqual(
+            self.store.search_transactions(institution="nero"),
+            LEDGER[3:])
+        self.assertEqual(
+            len(self.store._transaction_index.pence), len(LEDGER))
+
+    def test_stores_that_search_in_storage_have_nothing_to_build(self):
+        self.assertIsNone(
+            sqlite_budget().open_budget("ann").index_in_background())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import socket
+import sys
+import threading
+import unittest
+from unittest import mock
+from budgetapp import sessions
+
+RESET = "\x1b[0m"
+
+
+def greet():
+    """
+    A small app that, like the screens, talks through input() and print()
+    """
+    name = input("Name: ")
+    input("Press Enter to be greeted ")
+    print(f"Hello {name}")
+
+
+class SessionServerTest(unittest.TestCase):
+
+    def setUp(self):
+        for name in ("stdin", "stdout"):
+            patch = mock.patch.object(
+                sys, name, sessions.StreamRouter(name, getattr(sys, name)))
+            patch.start()
+            self.addCleanup(patch.stop)
+        # Port 0 lets the system pick a free one
+        self.server = sessions.SessionServer(("127.0.0.1", 0), greet)
+        self.addCleanup(self.server.server_close)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.shutdown)
+
+    def connect(self):
+        connection = socket.create_connection(self.server.server_address)
+        connection.settimeout(5)
+        self.addCleanup(connection.close)
+        return connection
+
+    def read_until(self, connection, text=None):
+        """
+        Returns what the connection sends up to and including text, or
+        until it closes, without the colour resets added after each write
+        """
+        received = ""
+        while text is None or text not in received:
+            data = connection.recv(1024)
+            if not data:
+                break
+            received += data.decode().replace(RESET, "")
+        return received
+
+    def test_sessions_are_kept_apart(self):
+        ann = self.connect()
+        bob = self.connect()
+        self.read_until(ann, "Name: ")
+        self.read_until(bob, "Name: ")
+        ann.sendall(b"Ann\r")
+        bob.sendall(b"Bob\r\n")
+        self.assertIn("Ann\r\n", self.read_until(ann, "greeted "))
+        self.assertIn("Bob\r\n", self.read_until(bob, "greeted "))
+        # Both sessions are waiting for input at once
+        bob.sendall(b"\r")
+        ann.sendall(b"\r")
+        self.assertEqual(self.read_until(bob), "\r\nHello Bob\r\n")
+        self.assertEqual(self.read_until(ann), "\r\nHello Ann\r\n")
+
+    def test_keys_are_echoed_and_edited_as_in_a_terminal(self):
+        ann = self.connect()
+        self.read_until(ann, "Name: ")
+        ann.sendall(b"Anx\x7fn\x1b[A\r")
+        self.assertEqual(
+            self.read_until(ann, "greeted "),
+            "Anx" + sessions.ERASE + "n\r\nPress Enter to be greeted ")
+        ann.sendall(b"\r")
+        self.assertEqual(self.read_until(ann), "\r\nHello Ann\r\n")
+
+    def test_ctrl_d_ends_only_that_session(self):
+        ann = self.connect()
+        bob = self.connect()
+        self.read_until(ann, "Name: ")
+        self.read_until(bob, "Name: ")
+        ann.sendall(b"\x04")
+        self.assertEqual(self.read_until(ann), "")
+        bob.sendall(b"Bob\r\r")
+        self.assertTrue(self.read_until(bob).endswith("Hello Bob\r\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,224 @@
+import unittest
+from benchmarks.fake_sheets import CallLog, FakeSpreadsheet
+from budgetapp import storage
+from budgetapp.storage import ConflictError, SheetsBackend
+from tests.helpers import sheets_budget
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend, self.spreadsheet = sheets_budget(
+            categories=[["Rent", 1000], ["Food", 200]])
+
+    def test_changes_are_appended_to_the_journal(self):
+        store = self.backend.open_budget("ann")
+        store.change_category_amount(1, -100)
+        journal = self.spreadsheet.worksheets["ann_journal"].rows
+        self.assertEqual(journal[-1][:3], ["change", "Rent", "-100"])
+        self.assertEqual(
+            self.backend.open_budget("ann").category_amounts(),
+            ["900", "200"])
+
+    def test_another_sessions_changes_are_caught_up(self):
+        first = self.backend.open_budget("ann")
+        second = self.backend.open_budget("ann")
+        first.change_category_amount(2, 50)
+        second.change_category_amount(1, -10)
+        self.assertEqual(second.category_amounts(), ["990", "250"])
+        self.assertEqual(
+            self.backend.open_budget("ann").category_amounts(),
+            ["990", "250"])
+
+    def test_changing_a_changed_category_is_a_conflict(self):
+        first = self.backend.open_budget("ann")
+        second = self.backend.open_budget("ann")
+        first.set_category_amount(1, 500)
+        with self.assertRaises(ConflictError):
+            second.set_category_amount(1, 600)
+        self.assertEqual(
+            self.backend.open_budget("ann").category_amounts(),
+            ["500", "200"])
+
+    def test_total_is_kept_across_commits(self):
+        first = self.backend.open_budget("ann")
+        second = self.backend.open_budget("ann")
+        self.assertEqual(first.total_budgeted(), 1200)
+        second.add_categories([["Fun", 30]])
+        second.delete_category(2)
+        first.change_category_amount(1, -100)
+        # Kept up to date rather than dropped and added up again
+        self.assertEqual(first._total, 1000 - 100 + 30)
+        first.set_category_amount(2, 40)
+        self.assertEqual(first._total, 900 + 40)
+        self.assertEqual(
+            first.total_budgeted(),
+            self.backend.open_budget("ann").total_budgeted())
+
+    def test_snapshot_grows_the_grid(self):
+        store = self.backend.open_budget("ann")
+        store.add_categories([[f"Extra {n}", 1] for n in range(10)])
+        for _ in range(storage.SNAPSHOT_EVERY):
+            store.change_category_amount(1, -1)
+        main = self.spreadsheet.worksheets["ann_main"]
+        self.assertGreaterEqual(main.row_count, 12)
+        self.assertEqual(main.rows[1][3], "12")
+        reopened = self.backend.open_budget("ann")
+        self.assertEqual(reopened.category_count(), 12)
+        self.assertEqual(
+            reopened.get_category(1), ["Rent", str(1000 - 50)])
+
+    def test_budget_made_before_the_journal_is_given_one(self):
+        self.spreadsheet.add_rows("bob_main", [["Rent", 100], ["Food", 5]])
+        self.spreadsheet.add_rows("bob_transactions", [
+            storage.TRANSACTION_HEADER])
+        store = self.backend.open_budget("bob")
+        self.assertEqual(self.spreadsheet.worksheets["bob_main"].col_count, 4)
+        for _ in range(storage.SNAPSHOT_EVERY):
+            store.change_category_amount(2, 1)
+        self.assertEqual(
+            self.backend.open_budget("bob").category_amounts(),
+            ["100", "55"])
+
+    def test_journal_made_before_expected_versions_is_widened(self):
+        self.spreadsheet.add_rows(
+            "bob_main", [["Rent", 100, 0, ""], ["Food", 5, 0, ""]])
+        self.spreadsheet.add_rows("bob_transactions", [
+            storage.TRANSACTION_HEADER])
+        self.spreadsheet.add_rows("bob_journal", [
+            storage.JOURNAL_HEADER[:4],
+            ["change", "Food", "5", "01-10-26 09:00:00"],
+            ["add", "Fun", "1", "01-10-26 09:00:00"],
+            ["add", "Fun", "2", "01-10-26 09:00:00"]])
+        store = self.backend.open_budget("bob")
+        journal = self.spreadsheet.worksheets["bob_journal"]
+        self.assertEqual(journal.col_count, 6)
+        self.assertEqual(journal.rows[0], storage.JOURNAL_HEADER)
+        # Its rows expect nothing, so they are applied as they were
+        self.assertEqual(store.category_amounts(), ["100", "10", "1", "2"])
+        store.change_category_amount(2, 1)
+        self.assertEqual(
+            self.backend.open_budget("bob").category_amounts(),
+            ["100", "11", "1", "2"])
+
+
+class RaceTest(unittest.TestCase):
+    """
+    Another session appending between a session's check of the journal
+    and its own append
+    """
+
+    def setUp(self):
+        self.backend, self.spreadsheet = sheets_budget(
+            categories=[["Rent", 1000], ["Food", 200]])
+        self.first = self.backend.open_budget("ann")
+        self.second = self.backend.open_budget("ann")
+
+    def race(self, change):
+        """
+        Makes change in the first session just before the second
+        session's next append to the journal
+        """
+        journal = self.second.journal_worksheet
+
+        def append_rows(rows, **kwargs):
+            del journal.append_rows
+            change()
+            return journal.append_rows(rows, **kwargs)
+        journal.append_rows = append_rows
+
+    def amounts(self):
+        return self.backend.open_budget("ann").category_amounts()
+
+    def test_changing_a_deleted_category_is_a_conflict(self):
+        self.race(lambda: self.first.delete_category(2))
+        with self.assertRaises(ConflictError):
+            self.second.change_category_amount(2, 30)
+        self.assertEqual(self.amounts(), ["1000"])
+        self.assertEqual(self.second.category_amounts(), ["1000"])
+
+    def test_deleting_a_changed_category_is_a_conflict(self):
+        self.race(lambda: self.first.change_category_amount(2, 30))
+        with self.assertRaises(ConflictError):
+            self.second.delete_category(2)
+        self.assertEqual(self.amounts(), ["1000", "230"])
+
+    def test_setting_a_set_category_is_a_conflict(self):
+        self.race(lambda: self.first.set_category_amount(2, 10))
+        with self.assertRaises(ConflictError):
+            self.second.set_category_amount(2, 70)
+        self.assertEqual(self.amounts(), ["1000", "10"])
+
+    def test_adding_a_category_added_first_is_a_conflict(self):
+        self.race(lambda: self.first.add_categories([["Fun", 5]]))
+        with self.assertRaises(ConflictError):
+            self.second.add_categories([["Fun", 10]])
+        self.assertEqual(self.amounts(), ["1000", "200", "5"])
+
+    def test_changes_that_do_not_clash_are_both_kept(self):
+        self.race(lambda: self.first.change_category_amount(1, -10))
+        self.second.change_category_amount(2, 5)
+        self.assertEqual(self.amounts(), ["990", "205"])
+        self.assertEqual(self.second.category_amounts(), ["990", "205"])
+        self.assertEqual(self.second.total_budgeted(), 1195)
+
+    def test_a_batch_is_kept_or_skipped_whole(self):
+        self.race(lambda: self.first.delete_category(2))
+        with self.assertRaises(ConflictError):
+            with self.second.batch_changes():
+                self.second.change_category_amount(1, -50)
+                self.second.change_category_amount(2, 50)
+        self.assertEqual(self.amounts(), ["1000"])
+        self.assertEqual(self.second.total_budgeted(), 1000)
+
+
+class DuplicateNameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend, self.spreadsheet = sheets_budget(
+            categories=[["Misc", 0], ["Rent", 0]])
+
+    def test_a_name_already_taken_is_not_added(self):
+        store = self.backend.open_budget("ann")
+        with self.assertRaises(ConflictError):
+            store.add_categories([["Fun", 5], ["Misc", 10]])
+        with self.assertRaises(ConflictError):
+            store.add_categories([["Fun", 5], ["Fun", 10]])
+        self.assertEqual(
+            self.backend.open_budget("ann").category_names(),
+            ["Misc", "Rent"])
+
+    def test_only_the_first_category_with_a_name_is_changed(self):
+        # Budgets made before names had to be unique can repeat one
+        self.spreadsheet.add_rows(
+            "bob_main", [["Misc", 5], ["Rent", 0], ["Misc", 7]])
+        self.spreadsheet.add_rows("bob_transactions", [
+            storage.TRANSACTION_HEADER])
+        store = self.backend.open_budget("bob")
+        for change in (lambda: store.change_category_amount(3, 50),
+                       lambda: store.set_category_amount(3, 50),
+                       lambda: store.delete_category(3)):
+            with self.assertRaises(ConflictError):
+                change()
+        store.change_category_amount(1, 50)
+        self.assertEqual(
+            self.backend.open_budget("bob").category_amounts(),
+            ["55", "0", "7"])
+
+
+class UserCapTest(unittest.TestCase):
+
+    def test_no_room_after_the_last_user(self):
+        spreadsheet = FakeSpreadsheet(CallLog())
+        spreadsheet.add_rows("users", [
+            ["Ann", f"{n}@example.com", f"user{n}", "pw"]
+            for n in range(storage.MAX_SHEETS_USERS - 1)])
+        backend = SheetsBackend(lambda: spreadsheet)
+        self.assertTrue(backend.accepts_new_users())
+        backend.add_user(["Bob", "bob@example.com", "bob", "pw"])
+        self.assertFalse(backend.accepts_new_users())
+        self.assertEqual(storage.MAX_SHEETS_USERS, 66)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from decimal import Decimal
+from benchmarks.fake_sheets import FakeWorksheet
+from budgetapp import storage
+from tests.helpers import sheets_budget
+
+
+def ledger(size):
+    """
+    Returns the rows of a '_transactions' worksheet with size
+    transactions
+    """
+    return [storage.TRANSACTION_HEADER] + [
+        [str(-n), f"Shop {n}", "01-10-26", "Rent"] for n in range(1, size + 1)]
+
+
+class TransactionCountTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend, self.spreadsheet = sheets_budget()
+        self.log = self.spreadsheet.log
+
+    def use_ledger(self, size, row_count=None):
+        self.spreadsheet.worksheets["ann_transactions"] = FakeWorksheet(
+            self.log, "ann_transactions", ledger(size), row_count)
+        store = self.backend.open_budget("ann")
+        self.log.reset()
+        return store
+
+    def test_only_the_last_rows_are_read(self):
+        store = self.use_ledger(500)
+        self.assertEqual(store.transaction_count(), 500)
+        self.assertEqual(self.log.calls["col_values"], 0)
+        self.assertLess(self.log.bytes, 2000)
+        self.log.reset()
+        recent = store.recent_transactions(3)
+        self.assertEqual([row[0] for row in recent], ["-500", "-499", "-498"])
+        self.assertEqual(sum(self.log.calls.values()), 0)
+
+    def test_small_and_empty_ledgers(self):
+        self.assertEqual(self.use_ledger(0).transaction_count(), 0)
+        self.assertEqual(self.use_ledger(3).transaction_count(), 3)
+
+    def test_blank_rows_below_the_ledger(self):
+        store = self.use_ledger(5, row_count=1000)
+        self.assertEqual(store.transaction_count(), 5)
+        self.assertEqual(store.recent_transactions(1)[0][0], "-5")
+
+    def test_appended_rows_are_counted(self):
+        store = self.use_ledger(30)
+        store.transaction_count()
+        store.append_transaction(
+            [Decimal("-7"), "Cafe", "02-10-26", "Rent"])
+        self.assertEqual(store.transaction_count(), 31)
+        self.assertEqual(
+            self.backend.open_budget("ann").transaction_count(), 31)
+        self.assertEqual(
+            store.recent_transactions(2),
+            [["-7", "Cafe", "02-10-26", "Rent"],
+             ["-30", "Shop 30", "01-10-26", "Rent"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
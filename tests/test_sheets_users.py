@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+from benchmarks.fake_sheets import CallLog, FakeSpreadsheet
+from budgetapp import storage
+from tests.helpers import FakeClock
+
+USERS = [
+    ["Ann", "ann@example.com", "ann", "pw"],
+    ["Bob", "bob@example.com", "bob", "pw"],
+]
+
+
+class UserDirectoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patch = mock.patch.object(storage, "time", self.clock)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.log = CallLog()
+        self.spreadsheet = FakeSpreadsheet(self.log)
+        self.spreadsheet.add_rows("users", [list(user) for user in USERS])
+        self.users = storage.UserDirectory(
+            self.spreadsheet.worksheets["users"])
+
+    def reads(self):
+        return self.log.calls["get_all_values"]
+
+    def add_elsewhere(self, user):
+        """
+        Adds a user the way another terminal would
+        """
+        self.spreadsheet.worksheets["users"].rows.append(user)
+
+    def test_hits_read_the_worksheet_once(self):
+        self.assertEqual(self.users.find("ann"), USERS[0])
+        self.assertEqual(self.users.find("bob@example.com"), USERS[1])
+        self.assertTrue(self.users.username_exists("bob"))
+        self.assertTrue(self.users.email_exists("ann@example.com"))
+        self.assertEqual(self.reads(), 1)
+
+    def test_first_miss_reads_the_worksheet_once(self):
+        self.assertIsNone(self.users.find("cat"))
+        self.assertEqual(self.reads(), 1)
+
+    def test_misses_in_a_row_read_it_again_at_most_once(self):
+        self.users.load()
+        self.clock.now += storage.USERS_REFRESH_SECONDS
+        self.assertIsNone(self.users.find("cat"))
+        self.assertFalse(self.users.username_exists("dan"))
+        self.assertFalse(self.users.email_exists("dan@example.com"))
+        self.assertEqual(self.reads(), 2)
+
+    def test_user_added_elsewhere_is_found_once_the_wait_is_up(self):
+        self.users.load()
+        self.add_elsewhere(["Cat", "cat@example.com", "cat", "pw"])
+        self.assertIsNone(self.users.find("cat"))
+        self.clock.now += storage.USERS_REFRESH_SECONDS
+        self.assertEqual(self.users.find("cat")[2], "cat")
+        self.assertEqual(self.reads(), 2)
+
+    def test_adds_and_deletes_keep_the_indexes_in_step(self):
+        self.users.add(["Cat", "cat@example.com", "cat", "pw"])
+        self.assertEqual(self.users.find("cat@example.com")[0], "Cat")
+        self.users.delete("ann")
+        self.assertIsNone(self.users.find("ann"))
+        self.assertEqual(self.users.find("cat")[0], "Cat")
+        self.assertEqual(self.reads(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,233 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import date
+from decimal import Decimal
+from budgetapp.sqlite_storage import SqliteBackend
+from budgetapp.storage import ConflictError
+from tests.helpers import sqlite_budget
+
+TRANSACTIONS = [
+    [Decimal("-500"), "Landlord", "01-10-26", "Rent"],
+    [Decimal("-4.5"), "Corner Cafe", "15-10-26", "Food"],
+    [Decimal("1000"), "Employer", "28-09-26", "Income"],
+    [Decimal("-12"), "Cafe Nero", "02-11-26", "Food"],
+]
+
+
+class UserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = sqlite_budget()
+
+    def test_users_are_found_by_username_or_email(self):
+        user = ["Ann", "ann@example.com", "ann", "pw"]
+        self.assertEqual(self.backend.find_user("ann"), user)
+        self.assertEqual(self.backend.find_user("ann@example.com"), user)
+        self.assertIsNone(self.backend.find_user("bob"))
+        self.assertTrue(self.backend.email_exists("ann@example.com"))
+        self.assertFalse(self.backend.username_exists("bob"))
+        self.assertEqual(self.backend.usernames(), ["ann"])
+
+    def test_usernames_are_unique(self):
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.backend.add_user(["Ann", "other@example.com", "ann", "pw"])
+
+    def test_deleting_a_user_deletes_their_budget(self):
+        self.backend.open_budget("ann").append_transaction(TRANSACTIONS[0])
+        self.backend.delete_user("ann")
+        self.assertIsNone(self.backend.find_user("ann"))
+        self.backend.add_user(["Ann", "ann@example.com", "ann", "pw"])
+        store = self.backend.open_budget("ann")
+        self.assertEqual(
+            (store.category_names(), store.get_transactions()), ([], []))
+
+
+class CategoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = sqlite_budget(
+            categories=[["Rent", 1000], ["Food", 100], ["Fun", 50]])
+        self.store = self.backend.open_budget("ann")
+
+    def events(self):
+        return self.backend.connection.execute(
+            "SELECT event, category, amount FROM category_events "
+            "ORDER BY id").fetchall()
+
+    def test_changes_are_saved_and_journalled(self):
+        self.store.set_category_amount(1, "900")
+        self.store.change_category_amount(2, Decimal("-25.5"))
+        self.store.delete_category(1)
+        store = self.backend.open_budget("ann")
+        self.assertEqual(store.category_names(), ["Food", "Fun"])
+        self.assertEqual(store.get_category(1), ["Food", "74.5"])
+        self.assertEqual(store.total_budgeted(), Decimal("124.50"))
+        self.assertEqual(self.events()[3:], [
+            ("set", "Rent", "900"), ("change", "Food", "-25.5"),
+            ("delete", "Rent", "")])
+
+    def test_batch_is_written_on_commit(self):
+        with self.store.batch_changes():
+            self.store.change_category_amount(1, -100)
+            self.store.change_category_amount(2, 100)
+            self.assertEqual(self.store.category_amounts(),
+                             ["900", "200", "50"])
+            self.assertEqual(
+                self.backend.open_budget("ann").category_amounts(),
+                ["1000", "100", "50"])
+        self.assertEqual(
+            self.backend.open_budget("ann").category_amounts(),
+            ["900", "200", "50"])
+
+    def test_batch_is_rolled_back_by_an_error(self):
+        with self.assertRaises(KeyboardInterrupt):
+            with self.store.batch_changes():
+                self.store.change_category_amount(1, -100)
+                raise KeyboardInterrupt
+        self.assertEqual(
+            self.backend.open_budget("ann").category_amounts(),
+            ["1000", "100", "50"])
+
+    def test_categories_added_in_a_batch_are_written_with_it(self):
+        with self.assertRaises(KeyboardInterrupt):
+            with self.store.batch_changes():
+                self.store.add_category("Gifts", 20)
+                self.assertEqual(self.store.category_count(), 4)
+                raise KeyboardInterrupt
+        self.assertEqual(
+            self.backend.open_budget("ann").category_names(),
+            ["Rent", "Food", "Fun"])
+        with self.store.batch_changes():
+            self.store.add_category("Gifts", 20)
+            self.store.change_category_amount(4, 5)
+        self.assertEqual(
+            self.backend.open_budget("ann").get_category(4),
+            ["Gifts", "25"])
+
+    def test_changes_from_another_session_are_added_to(self):
+        other = self.backend.open_budget("ann")
+        other.category_names()
+        self.store.category_names()
+        other.change_category_amount(2, 10)
+        self.store.change_category_amount(2, 5)
+        self.assertEqual(
+            self.backend.open_budget("ann").category_amounts()[1], "115")
+
+    def test_setting_a_changed_category_conflicts(self):
+        other = self.backend.open_budget("ann")
+        other.category_names()
+        self.store.category_names()
+        other.set_category_amount(1, 10)
+        with self.assertRaises(ConflictError):
+            self.store.set_category_amount(1, 20)
+        self.assertEqual(
+            self.backend.open_budget("ann").category_amounts()[0], "10")
+
+    def test_numbers_stay_on_the_categories_shown(self):
+        other = self.backend.open_budget("ann")
+        other.category_names()
+        self.store.category_names()
+        other.delete_category(1)
+        # Category 2 is still Food to this session, now in position 1
+        self.store.change_category_amount(2, 1)
+        self.assertEqual(
+            self.backend.open_budget("ann").category_amounts(),
+            ["101", "50"])
+
+
+class DuplicateNameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = sqlite_budget(
+            categories=[["Misc", 5], ["Rent", 0]])
+        # Budgets made before names had to be unique can repeat one
+        self.backend.connection.execute(
+            "INSERT INTO categories (user_id, position, name, amount) "
+            "VALUES (1, 3, 'Misc', '7')")
+        self.store = self.backend.open_budget("ann")
+
+    def amounts(self):
+        return self.backend.open_budget("ann").category_amounts()
+
+    def test_categories_with_the_same_name_are_kept_apart(self):
+        self.store.change_category_amount(3, 50)
+        self.assertEqual(self.amounts(), ["5", "0", "57"])
+        self.store.set_category_amount(3, 1)
+        self.assertEqual(self.amounts(), ["5", "0", "1"])
+        self.store.delete_category(3)
+        self.assertEqual(self.amounts(), ["5", "0"])
+
+    def test_a_name_already_taken_is_not_added(self):
+        with self.assertRaises(ConflictError):
+            self.store.add_category("Rent", 10)
+        with self.assertRaises(ConflictError):
+            with self.store.batch_changes():
+                self.store.add_category("Fun", 10)
+                self.store.add_category("Fun", 20)
+        self.assertEqual(self.amounts(), ["5", "0", "7"])
+
+
+class TransactionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = sqlite_budget().open_budget("ann")
+        self.store.append_transactions(TRANSACTIONS)
+
+    def test_transactions_are_read_in_order(self):
+        self.assertEqual(self.store.transaction_count(), 4)
+        self.assertEqual(
+            self.store.get_transactions()[1],
+            ["-4.5", "Corner Cafe", "15-10-26", "Food"])
+        self.assertEqual(
+            [row[1] for row in self.store.recent_transactions(2, skip=1)],
+            ["Employer", "Corner Cafe"])
+
+    def test_transactions_between_dates(self):
+        self.assertEqual(
+            [row[1] for row in self.store.transactions_between(
+                date(2026, 9, 28), date(2026, 10, 15))],
+            ["Employer", "Landlord", "Corner Cafe"])
+
+    def test_search(self):
+        self.assertEqual(
+            [row[1] for row in self.store.search_transactions(
+                institution="cafe", category="FOOD", min_amount=5)],
+            ["Cafe Nero"])
+        self.assertEqual(
+            len(self.store.search_transactions(institution="%")), 0)
+
+
+class LegacyDatabaseTest(unittest.TestCase):
+
+    def test_older_databases_are_brought_up_to_date(self):
+        path = os.path.join(tempfile.mkdtemp(), "budget.db")
+        connection = sqlite3.connect(path)
+        connection.executescript("""
+            CREATE TABLE users (
+                id INTEGER PRIMARY KEY, first_name TEXT, email TEXT UNIQUE,
+                username TEXT UNIQUE, password TEXT);
+            CREATE TABLE categories (
+                id INTEGER PRIMARY KEY, user_id INTEGER, position INTEGER,
+                name TEXT, amount TEXT);
+            CREATE TABLE transactions (
+                id INTEGER PRIMARY KEY, user_id INTEGER, amount TEXT,
+                institution TEXT, date TEXT, category TEXT);
+            INSERT INTO users
+                VALUES (1, 'Ann', 'ann@example.com', 'ann', 'pw');
+            INSERT INTO categories VALUES (1, 1, 1, 'Rent', '1000');
+            INSERT INTO transactions
+                VALUES (1, 1, '-500', 'Landlord', '01-10-26', 'Rent');
+        """)
+        connection.close()
+        store = SqliteBackend(path).open_budget("ann")
+        store.set_category_amount(1, 900)
+        self.assertEqual(store.get_category(1), ["Rent", "900"])
+        self.assertEqual(
+            len(store.transactions_between(
+                date(2026, 10, 1), date(2026, 10, 1))), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()